@@ -1,3 +1,13 @@
 from django.contrib import admin
+from .models import DailyAppointmentStat, DailyPatientStat
 
-# Register your models here.
+
+@admin.register(DailyAppointmentStat)
+class AdminDailyAppointmentStat(admin.ModelAdmin):
+    list_display = ('date', 'status', 'appointments')
+    list_filter = ('status',)
+
+
+@admin.register(DailyPatientStat)
+class AdminDailyPatientStat(admin.ModelAdmin):
+    list_display = ('date', 'user', 'appointments')
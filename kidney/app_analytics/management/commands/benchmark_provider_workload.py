@@ -0,0 +1,124 @@
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from app_authentication.models import User
+from app_appointment.models import Appointment, AssignedProvider
+from app_analytics.workload import QUEUED_STATUSES, UNATTENDED_STATUSES, get_provider_workload
+
+#the statuses of the synthetic appointments and how often they occur
+STATUS_WEIGHTS = {
+    'pending': 10,
+    'approved': 30,
+    'check-in': 5,
+    'in-progress': 5,
+    'completed': 35,
+    'cancelled': 10,
+    'no show': 5,
+}
+
+
+def get_legacy_workload(nurses, days):
+    """The per-nurse, per-day counting the workload would take without the GROUP BY."""
+    workload = []
+
+    for nurse in nurses:
+        assignments = AssignedProvider.objects.filter(assigned_provider=nurse)
+        sessions = []
+        queued = []
+
+        for day in days:
+            sessions.append(assignments.filter(assigned_patient_appointment__date=day).exclude(assigned_patient_appointment__status__in=UNATTENDED_STATUSES).count())
+            queued.append(assignments.filter(assigned_patient_appointment__date=day, assigned_patient_appointment__status__in=QUEUED_STATUSES).count())
+
+        workload.append((sessions, queued))
+
+    return workload
+
+
+class Command(BaseCommand):
+    help = "Times the nurse workload over a synthetic dataset with the single GROUP BY and with per-nurse, per-day counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nurses', type=int, default=50)
+        parser.add_argument('--appointments', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=28, help="Days the appointments and the measured range cover.")
+        parser.add_argument('--patients', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--skip-legacy', action='store_true', help="Only time the GROUP BY.")
+
+    def handle(self, *args, **options):
+
+        #the synthetic dataset only lives in this transaction, it's rolled back once the benchmark is done
+        with transaction.atomic():
+            start_date = timezone.localdate()
+            days = [start_date + timedelta(days=day) for day in range(options['days'])]
+            nurses = self.create_dataset(options, days)
+
+            self.time_workload("group by", options['repeat'], lambda: get_provider_workload(days[0], days[-1]))
+
+            if not options['skip_legacy']:
+                self.time_workload("legacy", 1, lambda: get_legacy_workload(nurses, days))
+
+            transaction.set_rollback(True)
+
+    def create_dataset(self, options, days):
+        generator = random.Random(0)
+        started = time.perf_counter()
+
+        def create_users(total, role):
+            return User.objects.bulk_create(
+                [
+                    User(username=f"benchmark-{uuid.uuid4()}@kidneycare.com", password='!', role=role, first_name=role.title(), last_name=str(index))
+                    for index in range(total)
+                ],
+                batch_size=1000
+            )
+
+        nurses = create_users(options['nurses'], 'nurse')
+        patients = create_users(options['patients'], 'patient')
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+
+        for batch_start in range(0, options['appointments'], 5000):
+            batch_size = min(5000, options['appointments'] - batch_start)
+
+            appointments = Appointment.objects.bulk_create([
+                Appointment(
+                    user=generator.choice(patients),
+                    date=generator.choice(days),
+                    time=datetime.min.replace(hour=generator.randrange(8, 18)).time(),
+                    status=generator.choices(statuses, weights)[0],
+                )
+                for _ in range(batch_size)
+            ])
+
+            AssignedProvider.objects.bulk_create([
+                AssignedProvider(assigned_provider=generator.choice(nurses), assigned_patient_appointment=appointment)
+                for appointment in appointments
+            ])
+
+        self.stdout.write(
+            f"dataset: {options['nurses']} nurses, {options['patients']} patients, {options['appointments']} appointments "
+            f"over {len(days)} days, created in {time.perf_counter() - started:.1f}s"
+        )
+
+        return nurses
+
+    def time_workload(self, label, repeat, workload):
+        timings = []
+
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                workload()
+                timings.append(time.perf_counter() - started)
+
+        self.stdout.write(
+            f"{label:>8}: {min(timings) * 1000:.1f}ms best of {repeat}, "
+            f"{sum(timings) / repeat * 1000:.1f}ms mean, {len(queries.captured_queries)} queries"
+        )
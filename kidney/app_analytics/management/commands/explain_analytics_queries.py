@@ -0,0 +1,17 @@
+from datetime import date
+from app_analytics.models import DailyAppointmentStat, DailyPatientStat
+from kidney.query_plans import ExplainQueriesCommand
+
+
+class Command(ExplainQueriesCommand):
+    help = "Runs EXPLAIN on the hot analytics queries and reports whether each one uses an index."
+
+    def get_hot_queries(self):
+        return [
+            ("daily appointment rollup of two weeks", DailyAppointmentStat.objects.filter(
+                date__range=[date(2025, 1, 1), date(2025, 1, 14)]
+            )),
+            ("daily patient rollup of a week", DailyPatientStat.objects.filter(
+                date__range=[date(2025, 1, 1), date(2025, 1, 7)]
+            ).values('user_id').distinct()),
+        ]
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from app_analytics.rollups import rebuild_rollups
+from app_analytics.patient_counters import rebuild_patient_counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes the daily appointment and patient rollups the analytics read from the appointment table, then refills the patient HyperLogLogs."
+
+    def handle(self, *args, **options):
+        status_rows, patient_rows = rebuild_rollups()
+        self.stdout.write(f"Rebuilt {status_rows} daily status rows and {patient_rows} daily patient rows")
+
+        days = rebuild_patient_counters()
+
+        if days is None:
+            self.stdout.write("Skipped the patient HyperLogLogs, redis is unavailable")
+        else:
+            self.stdout.write(f"Refilled the patient HyperLogLogs of {days} days")
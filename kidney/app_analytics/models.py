@@ -1,3 +1,34 @@
 from django.db import models
+from app_authentication.models import User
 
-# Create your models here.
+
+class DailyAppointmentStat(models.Model):
+    """The appointments booked on a day that currently have a status, kept up to date as appointments change."""
+
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    appointments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status'], name='dailyappointmentstat_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.appointments}"
+
+
+class DailyPatientStat(models.Model):
+    """The appointments a patient booked on a day, a row per patient makes the distinct patients of any range a count."""
+
+    date = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    appointments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'user'], name='dailypatientstat_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.user_id}: {self.appointments}"
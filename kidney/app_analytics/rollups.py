@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from app_appointment.models import Appointment
+from .models import DailyAppointmentStat, DailyPatientStat
+from .patient_counters import record_patient
+
+
+def add_to_counter(model, amount, **lookup):
+    """Adds amount to the appointments of the rollup row matching lookup with a single UPDATE, creating the row first if needed."""
+    counters = model.objects.filter(**lookup)
+
+    if amount < 0:
+        #never below zero, a rebuild brings back counts that drifted
+        counters = counters.filter(appointments__gte=-amount)
+
+    if counters.update(appointments=F('appointments') + amount) or amount < 0:
+        return
+
+    model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+    counters.update(appointments=F('appointments') + amount)
+
+
+def get_booking_date(appointment):
+    #the day the appointment was booked, in the timezone the dashboards are shown in
+    return timezone.localdate(appointment.created_at)
+
+
+def record_appointment_created(appointment):
+    booking_date = get_booking_date(appointment)
+
+    add_to_counter(DailyAppointmentStat, 1, date=booking_date, status=appointment.status)
+
+    if appointment.user_id:
+        add_to_counter(DailyPatientStat, 1, date=booking_date, user_id=appointment.user_id)
+        record_patient(booking_date, appointment.user_id)
+
+
+def record_status_change(appointment, old_status):
+    """Moves the appointment between the status rows of its booking day."""
+    if old_status == appointment.status:
+        return
+
+    booking_date = get_booking_date(appointment)
+
+    add_to_counter(DailyAppointmentStat, -1, date=booking_date, status=old_status)
+    add_to_counter(DailyAppointmentStat, 1, date=booking_date, status=appointment.status)
+
+
+def record_appointment_deleted(appointment):
+    booking_date = get_booking_date(appointment)
+
+    add_to_counter(DailyAppointmentStat, -1, date=booking_date, status=appointment.status)
+
+    if appointment.user_id:
+        add_to_counter(DailyPatientStat, -1, date=booking_date, user_id=appointment.user_id)
+
+
+def rebuild_rollups():
+    """
+        Recomputes both rollups from the appointment table, e.g. after appointments were changed outside the API.
+
+        Returns:
+            tuple: The number of day and status rows, and of day and patient rows.
+    """
+    appointments = Appointment.objects.annotate(booking_date=TruncDate('created_at'))
+
+    status_counts = appointments.values('booking_date', 'status').annotate(total=Count('id')).order_by()
+    patient_counts = appointments.filter(user__isnull=False).values('booking_date', 'user_id').annotate(total=Count('id')).order_by()
+
+    with transaction.atomic():
+        DailyAppointmentStat.objects.all().delete()
+        DailyPatientStat.objects.all().delete()
+
+        DailyAppointmentStat.objects.bulk_create(
+            [DailyAppointmentStat(date=row['booking_date'], status=row['status'], appointments=row['total']) for row in status_counts.iterator()],
+            batch_size=1000
+        )
+        DailyPatientStat.objects.bulk_create(
+            [DailyPatientStat(date=row['booking_date'], user_id=row['user_id'], appointments=row['total']) for row in patient_counts.iterator()],
+            batch_size=1000
+        )
+
+    return DailyAppointmentStat.objects.count(), DailyPatientStat.objects.count()
+
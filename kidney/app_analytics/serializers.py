@@ -6,6 +6,7 @@ from datetime import timedelta
 from django.db.models.functions import TruncDate
 from kidney.utils import ResponseMessageUtils
 from rest_framework import status
+from .workload import MAX_WORKLOAD_DAYS, DEFAULT_WORKLOAD_DAYS
 
 class GetPatientAnalyticsSerializer(serializers.Serializer):
 
@@ -46,4 +47,23 @@ class GetPatientAnalyticsSerializer(serializers.Serializer):
         return ResponseMessageUtils(message="Analytics of Patient", data=data, status_code=status.HTTP_200_OK)
 
 
+class GetProviderWorkloadSerializer(serializers.Serializer):
 
+    start_date = serializers.DateField(input_formats=['%m/%d/%Y'], required=False)
+    end_date = serializers.DateField(input_formats=['%m/%d/%Y'], required=False)
+
+    def validate(self, attrs):
+
+        #the next two weeks by default
+        start_date = attrs.setdefault('start_date', timezone.localdate())
+        end_date = attrs.setdefault('end_date', start_date + timedelta(days=DEFAULT_WORKLOAD_DAYS - 1))
+
+        days = (end_date - start_date).days + 1
+
+        if days < 1:
+            raise serializers.ValidationError({"message": "The end date must not be before the start date"})
+
+        if days > MAX_WORKLOAD_DAYS:
+            raise serializers.ValidationError({"message": f"The workload covers at most {MAX_WORKLOAD_DAYS} days"})
+
+        return attrs
@@ -1,3 +1,168 @@
-from django.test import TestCase
+from datetime import date, time
+from io import StringIO
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from app_authentication.models import User, UserInformation
+from app_appointment.models import Appointment, AssignedProvider
+from app_schedule.models import Schedule
+from .models import DailyAppointmentStat, DailyPatientStat
+from .widgets import get_dashboard
+from .workload import get_provider_workload
 
-# Create your tests here.
+
+@override_settings(ANALYTICS_REDIS_URL=None)
+class AnalyticsRollupTest(TestCase):
+
+    def setUp(self):
+        #drop the schedule version of the previous test
+        cache.clear()
+        self.client = APIClient()
+        Schedule.objects.create(id=3, start_time=time(8, 0), end_time=time(17, 0))
+        self.patients = [
+            User.objects.create_user(username=f'patient{index}@kidneycare.com', password='password123', role='patient')
+            for index in range(2)
+        ]
+
+    def request(self, method, user, url, data=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return getattr(self.client, method)(url, data, format='json')
+
+    def book_and_cancel(self):
+        for patient in self.patients:
+            self.request('post', patient, '/patient/create-appointment/', {"date": "01/06/2025", "time": "09:00 AM"})
+
+        appointment = Appointment.objects.get(user=self.patients[0])
+        self.request('patch', self.patients[0], f'/patients/cancel-appointment/{appointment.id}/', {})
+
+    def get_rollups(self):
+        return (
+            sorted(DailyAppointmentStat.objects.filter(appointments__gt=0).values_list('date', 'status', 'appointments')),
+            sorted(DailyPatientStat.objects.values_list('date', 'user_id', 'appointments')),
+        )
+
+    def test_rollups_follow_bookings_and_status_changes(self):
+        self.book_and_cancel()
+
+        today = timezone.localdate()
+        status_rows, patient_rows = self.get_rollups()
+
+        self.assertEqual(status_rows, [(today, 'cancelled', 1), (today, 'pending', 1)])
+        self.assertEqual(len(patient_rows), 2)
+
+        #the incremental rollups match a rebuild from the appointment table
+        call_command('rebuild_analytics_rollups', stdout=StringIO())
+        self.assertEqual(self.get_rollups(), (status_rows, patient_rows))
+
+    def test_analytics_read_the_rollups(self):
+        self.book_and_cancel()
+
+        appointments = self.request('get', self.patients[0], '/appointments/analytics/').data["data"]
+        self.assertEqual(appointments["total_appointments"], 2)
+        self.assertEqual(appointments["graph_data"][-1], {"value": 2})
+
+        patients = self.request('get', self.patients[0], '/patients/analytics/').data["data"]
+        self.assertEqual(patients["total_patients"], 2)
+        self.assertEqual(patients["graph_data"][-1], {"value": 2})
+
+        breakdown = self.request('get', self.patients[0], '/appointments-breakdown/analytics/').data["data"]
+        self.assertEqual(breakdown, {"percentage_pending_appointment": 50.0, "percentage_cancelled_appointment": 50.0})
+
+    def test_dashboard_combines_the_widgets(self):
+        self.book_and_cancel()
+        UserInformation.objects.bulk_create([UserInformation(user=patient, gender='Male') for patient in self.patients])
+        year = timezone.localdate().year
+
+        #every widget comes from three queries
+        with self.assertNumQueries(3):
+            get_dashboard(year)
+
+        response = self.request('get', self.patients[0], '/dashboard/analytics/')
+        self.assertEqual(response.status_code, 200)
+        dashboard = response.data["data"]
+
+        for key, url in (
+            ("patients", '/patients/analytics/'),
+            ("appointments", '/appointments/analytics/'),
+            ("providers", '/providers/analytics/'),
+            ("appointment_status_breakdown", '/appointments-breakdown/analytics/'),
+            ("patient_tracking", '/patients/trackings/'),
+        ):
+            self.assertEqual(dashboard[key], self.request('get', self.patients[0], url).data["data"])
+
+        tracking = dashboard["patient_tracking"]
+        self.assertEqual(tracking["male_tracking_data"], {"gender": "male", "count": 2})
+        self.assertEqual(tracking["patient_month_tracking_data"]["male"][timezone.localdate().month - 1], 2)
+
+        #served from the shared cache until it expires
+        self.assertIsNotNone(cache.get(f"analytics:dashboard:{year}:approximate"))
+
+    def test_patient_counts_fall_back_to_the_database(self):
+        self.book_and_cancel()
+
+        #nothing listens on the port, the estimate is skipped
+        with override_settings(ANALYTICS_REDIS_URL='redis://127.0.0.1:1/0'):
+            patients = self.request('get', self.patients[0], '/patients/analytics/').data["data"]
+
+        self.assertFalse(patients["approximate"])
+        self.assertEqual(patients["total_patients"], 2)
+        self.assertEqual(patients["total_monthly_patients"], 2)
+
+        exact = self.request('get', self.patients[0], '/patients/analytics/', {"exact": "1"}).data["data"]
+        self.assertEqual(exact, patients)
+
+
+class ProviderWorkloadTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        self.nurses = [
+            User.objects.create_user(username=f'nurse{index}@kidneycare.com', password='password123', role='nurse', first_name=f'Nurse{index}', last_name='Cruz')
+            for index in range(2)
+        ]
+
+    def assign(self, nurse, appointment_date, appointment_status):
+        appointment = Appointment.objects.create(user=self.patient, date=appointment_date, time=time(9, 0), status=appointment_status)
+        return AssignedProvider.objects.create(assigned_provider=nurse, assigned_patient_appointment=appointment)
+
+    def test_workload_matrices(self):
+        self.assign(self.nurses[0], date(2025, 1, 6), 'approved')
+        self.assign(self.nurses[0], date(2025, 1, 6), 'completed')
+        self.assign(self.nurses[0], date(2025, 1, 13), 'cancelled')
+        self.assign(self.nurses[0], date(2025, 1, 20), 'pending')
+
+        #the nurses and the matrices come from two queries whatever the range
+        with self.assertNumQueries(2):
+            workload = get_provider_workload(date(2025, 1, 6), date(2025, 1, 15))
+
+        self.assertEqual(workload["days"][0], "01/06/2025")
+        self.assertEqual(workload["weeks"], ["01/06/2025", "01/13/2025"])
+        self.assertEqual([nurse["name"] for nurse in workload["nurses"]], ["Nurse0 Cruz", "Nurse1 Cruz"])
+        self.assertEqual(workload["sessions"][0], [2, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(workload["sessions"][1], [0] * 10)
+        self.assertEqual(workload["queued"][0][0], 1)
+        self.assertEqual(workload["weekly_sessions"], [[2, 0], [0, 0]])
+        self.assertEqual(workload["queue_length"], [1, 0])
+
+    def test_reassigned_appointment_counts_for_the_current_nurse_only(self):
+        assignment = self.assign(self.nurses[0], date(2025, 1, 6), 'approved')
+        AssignedProvider.objects.create(assigned_provider=self.nurses[1], assigned_patient_appointment=assignment.assigned_patient_appointment)
+
+        workload = get_provider_workload(date(2025, 1, 6), date(2025, 1, 6))
+
+        self.assertEqual(workload["sessions"], [[0], [1]])
+        self.assertEqual(workload["queue_length"], [0, 1])
+
+    def test_workload_endpoint_validates_the_range(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.nurses[0])}")
+
+        response = self.client.get('/providers/workload/', {"start_date": "01/06/2025", "end_date": "01/19/2025"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["data"]["days"]), 14)
+
+        response = self.client.get('/providers/workload/', {"start_date": "01/06/2025", "end_date": "01/05/2025"})
+        self.assertEqual(response.status_code, 400)
@@ -3,15 +3,20 @@ from .views import (
     GetPatientAnalyticsView,
     GetAppointmentAnalyticsView,
     GetProviderAnalyticsView,
+    GetProviderWorkloadView,
     GetAppointmentStatusBreakdownView,
-    GetPatientTrackingGenderView
+    GetPatientTrackingGenderView,
+    GetDashboardAnalyticsView
 )
 
 urlpatterns = [
     path('patients/analytics/', GetPatientAnalyticsView.as_view(), name='patient-analytics'),
     path('appointments/analytics/', GetAppointmentAnalyticsView.as_view(), name='appointment-analytics'),
     path('providers/analytics/', GetProviderAnalyticsView.as_view(), name='provider-analytics'),
+    path('providers/workload/', GetProviderWorkloadView.as_view(), name='provider-workload'),
     path('appointments-breakdown/analytics/', GetAppointmentStatusBreakdownView.as_view(), name='appointment-status-breakdown-analytics'),
     path('patients/trackings/<int:year>/', GetPatientTrackingGenderView.as_view(), name='patient-trackings-filter'),
     path('patients/trackings/', GetPatientTrackingGenderView.as_view(), name='patient-trackings'),
+    path('dashboard/analytics/<int:year>/', GetDashboardAnalyticsView.as_view(), name='dashboard-analytics-filter'),
+    path('dashboard/analytics/', GetDashboardAnalyticsView.as_view(), name='dashboard-analytics'),
 ]
@@ -1,14 +1,29 @@
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
+from django.core.cache import cache
 from django.utils import timezone
-from datetime import timedelta, datetime
-from app_appointment.models import Appointment
-from kidney.utils import ResponseMessageUtils
-from django.db.models.functions import TruncDate
-from app_authentication.models import User, UserInformation
-from django.db.models.aggregates import Count
-from django.db.models.functions import ExtractMonth, ExtractYear
-from calendar import month_abbr
+from kidney.utils import ResponseMessageUtils, extract_first_error_message
+from .serializers import GetProviderWorkloadSerializer
+from .widgets import (
+    WeekWindows,
+    query_appointment_stats,
+    query_patient_stats,
+    query_user_stats,
+    get_patient_analytics,
+    get_appointment_analytics,
+    get_provider_analytics,
+    get_status_breakdown,
+    get_patient_tracking,
+    get_dashboard,
+)
+from .workload import get_provider_workload
+
+DASHBOARD_CACHE_TTL = 30  #seconds the combined dashboard is shared between admins
+
+
+def is_exact(request):
+    return request.query_params.get('exact') in ('1', 'true')
+
 
 class GetPatientAnalyticsView(generics.ListAPIView):
 
@@ -17,82 +32,8 @@ class GetPatientAnalyticsView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         
         try:
-            message = None
-
-            today = timezone.now().date()
-            this_week_start = today - timedelta(days=6)
-            last_week_start = this_week_start - timedelta(days=7)
-            last_week_end = this_week_start - timedelta(days=1)
-
-            this_week_patients = (
-                Appointment.objects
-                .annotate(created_date=TruncDate('created_at'))
-                .filter(created_date__range=[this_week_start, today])
-                .values('user_id').distinct().count() 
-            )
-
-
-            last_week_patients = (
-                Appointment.objects
-                .annotate(created_date=TruncDate('created_at'))
-                .filter(created_date__range=[last_week_start, last_week_end])
-                .values('user_id').distinct().count() 
-            )
-
-            # Calculate changes
-            calculate_diff_patients = this_week_patients - last_week_patients
-
-            if last_week_patients > 0:
-
-                percent_change = round((calculate_diff_patients / last_week_patients) * 100, 2)
-                growth_multiplier = round(this_week_patients / last_week_patients, 3) 
-
-                if percent_change > 0:
-                    message = f"Patients increased by {abs(int(percent_change))}% in 7 days"
-                else:
-                    message = f"Patients decreased by {abs(int(percent_change))}% in 7 days"
-
-            else:
-                percent_change = 0  # or "N/A" if no baseline data
-                growth_multiplier = 1.0
-
-                # percent_change = round((calculate_diff_patients / this_week_patients) * 100, 2)
-                # growth_multiplier = round(this_week_patients / last_week_patients, 3) 
-
-                # if percent_change > 0:
-                #     message = f"Patients increased by {abs(int(percent_change))}% in 7 days"
-                # else:
-                #     message = f"Patients decreased by {abs(int(percent_change))}% in 7 days"
-
-            daily_appointments = (
-                Appointment.objects
-                .annotate(created_date=TruncDate('created_at'))
-                .filter(created_date__range=[this_week_start, today])
-                .values('created_date')
-                .annotate(patient_count=Count('user_id', distinct=True))
-                .order_by('created_date')
-            )
-
-            graph_data = []
-
-            date_cursor = this_week_start
-
-            while date_cursor <= today:
-                entry_data = next((item for item in daily_appointments if item['created_date'] == date_cursor), None)
-                count = entry_data['patient_count'] if entry_data else 0
-                graph_data.append({
-                    "value": count
-                })
-                date_cursor += timedelta(days=1)
-
-            data = {
-                'total_patients': this_week_patients,
-                # 'change': float(calculate_diff_patients),
-                'percent_change': abs(int(percent_change)) if percent_change else 0,
-                'growth': growth_multiplier,
-                "summary": message,
-                "graph_data": graph_data
-            }
+            #estimated from the daily HyperLogLogs, ?exact=1 counts the patients in the daily rollup
+            data = get_patient_analytics(query_patient_stats(WeekWindows(), exact=is_exact(request)))
 
             return ResponseMessageUtils(
                 message="Analytics of Patient",
@@ -113,85 +54,14 @@ class GetAppointmentAnalyticsView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
 
         try:
-            message = None
-
-            today = timezone.now().date()
-            this_week_start = today - timedelta(days=6)
-            last_week_start = this_week_start - timedelta(days=7)
-            last_week_end = this_week_start - timedelta(days=1)
-            
-
-            this_week_appointments = (
-                Appointment.objects
-                .annotate(created_date=TruncDate('created_at'))
-                .filter(created_date__range=[this_week_start, today])
-                .values('id').count() 
-            )
-
-            last_week_appointments = (
-                Appointment.objects
-                .annotate(created_date=TruncDate('created_at'))
-                .filter(created_date__range=[last_week_start, last_week_end]
-                ).values('id').count()
-            )
-
-            calculate_diff_appointments = this_week_appointments - last_week_appointments
-
-
-            if last_week_appointments > 0:
-
-                percent_change = round((calculate_diff_appointments / last_week_appointments) * 100, 2)
-                growth_multiplier = round(this_week_appointments / last_week_appointments, 3) 
-
-                if percent_change > 0:
-                    message = f"Appointment increased by {abs(int(percent_change))}% in 7 days."
-                else:
-                    message = f"Appointment decreased by {abs(int(percent_change))}% in 7 days."
-            else:
-                
-                # percent_change = round((calculate_diff_appointments / this_week_appointments) * 100, 2)
-                # growth_multiplier = round(this_week_appointments / last_week_appointments, 3) 
-
-                # if percent_change > 0:
-                #     message = f"Appointment increased by {abs(int(percent_change))}% in 7 days."
-                # else:
-                    # message = f"Appointment decreased by {abs(int(percent_change))}% in 7 days."
-                percent_change = 0
-                growth_multiplier = 1.0
-
+            windows = WeekWindows()
 
-            daily_appointments = (
-                Appointment.objects
-                .annotate(created_date=TruncDate('created_at'))
-                .values('created_date')
-                .filter(created_date__range=[this_week_start, today])
-                .annotate(appointment_count=Count('id'))
-                .order_by('created_date')
-            )
-
-            date_cursor = this_week_start
-            graph_data = []
-
-            while date_cursor <= today:
-                entry_data = next((item for item in daily_appointments if item["created_date"] == date_cursor), None)
-                count = entry_data["appointment_count"] if entry_data else 0
-                graph_data.append({
-                    "value": count
-                })
-                #increment the date cursor by 1 day
-                date_cursor += timedelta(days=1)
-            data = {
-                'total_appointments': this_week_appointments,
-                # 'change': abs(float(calculate_diff_appointments)),
-                'percent_change': abs(int(percent_change)) if percent_change else 0,
-                "growth": growth_multiplier,
-                "summary": message,
-                "graph_data": graph_data
-            }
+            #one read of the daily rollup covers both weeks and the graph
+            daily_appointments, _ = query_appointment_stats(windows)
 
             return ResponseMessageUtils(
                 message="Analytics of Appointments",
-                data=data,
+                data=get_appointment_analytics(windows, daily_appointments),
                 status_code=status.HTTP_200_OK
             )
         
@@ -208,13 +78,9 @@ class GetProviderAnalyticsView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         
         try:
-            total_provider = User.objects.filter(role__in=['nurse', 'head nurse']).count()
-
             return ResponseMessageUtils(
                 message="Analytics of Healthcare Provider",
-                data={
-                    "total_provider": total_provider
-                },
+                data=get_provider_analytics(query_user_stats()),
                 status_code=status.HTTP_200_OK
             )
         except Exception as e:
@@ -222,7 +88,33 @@ class GetProviderAnalyticsView(generics.ListAPIView):
                 message="Something went wrong while processing your request.",
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-    
+
+
+class GetProviderWorkloadView(generics.GenericAPIView):
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = GetProviderWorkloadSerializer
+
+    def get(self, request, *args, **kwargs):
+
+        try:
+
+            serializer = self.get_serializer(data=request.query_params)
+
+            if not serializer.is_valid():
+                return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
+
+            return ResponseMessageUtils(
+                message="Workload of Healthcare Provider",
+                data=get_provider_workload(serializer.validated_data['start_date'], serializer.validated_data['end_date']),
+                status_code=status.HTTP_200_OK
+            )
+        except Exception as e:
+            return ResponseMessageUtils(
+                message="Something went wrong while processing your request.",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 
 class GetAppointmentStatusBreakdownView(generics.ListAPIView):
 
@@ -231,34 +123,12 @@ class GetAppointmentStatusBreakdownView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         
         try:
-            total_appointments = Appointment.objects.count()
-
-            #initialize default data
-            data = {}
-
-            if total_appointments > 0:
-                #get counts for each status
-                status_counts = (
-                    Appointment.objects
-                    .values('status')
-                    .annotate(count=Count('id'))
-                )
-
-                #convert to percentage format
-                for item in status_counts.all():
-                    status = item["status"]
-                    percentage = round((item["count"] / total_appointments) * 100, 2)
-                    data[f"percentage_{str(status.lower()).replace('-', '_')}_appointment"] = percentage
-            else:
-                #no appointments: set all to 0%
-                statuses = ['pending', 'approved', 'check_in', 'in_progress', 'completed', 'cancelled', 'no_show', 'rescheduled']
-                for status in statuses:
-                    data[f"percentage_{str(status).replace('-', '_')}_appointment"] = 0
-
+            #counts for each status, the total is their sum
+            _, status_totals = query_appointment_stats(WeekWindows())
 
             return ResponseMessageUtils(
                 message="Analytics of Appointment status breakdown",
-                data=data,
+                data=get_status_breakdown(status_totals),
                 status_code=200
             )
         except Exception as e:
@@ -275,60 +145,11 @@ class GetPatientTrackingGenderView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
 
         try:
-
-            data_output = {
-                "male_tracking_data": {"gender": "male", "count": 0},
-                "female_tracking_data": {"gender": "female", "count": 0}
-            }
-
-            if kwargs.get('year') in (None, ""):
-                gender_month_counts = (
-                    UserInformation.objects.filter(user__role="patient")
-                    .annotate(month=ExtractMonth('created_at'), year=ExtractYear('created_at'))
-                    .values('gender', 'month', 'year')
-                    .annotate(count=Count('user_id'))
-                    .order_by('month').filter(year=timezone.now().year)
-                )
-            else:
-                gender_month_counts = (
-                    UserInformation.objects.filter(user__role="patient")
-                    .annotate(month=ExtractMonth('created_at'), year=ExtractYear('created_at'))
-                    .values('gender', 'month', 'year')
-                    .annotate(count=Count('user_id'))
-                    .order_by('month').filter(year=kwargs.get('year'))
-                )
-
-            data_labels = {
-                "labels": [month_abbr[m] for m in range(1, 13)],
-                "male": [0] * 12,
-                "female": [0] * 12
-            }
-
-            for data in gender_month_counts:
-                gender_value = str(data["gender"]).lower()
-                month_index = data["month"] - 1
-
-                if gender_value in data_labels:
-                    data_labels[gender_value][month_index] = data["count"]
-
-                #accumulate total count per gender
-                if gender_value == "male":
-                    data_output["male_tracking_data"] = {
-                        "gender": gender_value,
-                        "count": data_output.get("male", {}).get("count", 0) + data["count"]
-                    }
-                elif gender_value == "female":
-                    data_output["female_tracking_data"] = {
-                        "gender": gender_value,
-                        "count": data_output.get("female", {}).get("count", 0) + data["count"]
-                    }
-
-            #merged the final results
-            final_result = {**data_output, "patient_month_tracking_data": {**data_labels}}
+            year = kwargs.get('year') or timezone.localdate().year
 
             return ResponseMessageUtils(
                 message="Patient Tracking",
-                data=final_result,
+                data=get_patient_tracking(query_user_stats(year)),
                 status_code=200
             )
 
@@ -337,5 +158,35 @@ class GetPatientTrackingGenderView(generics.ListAPIView):
                 message="Something went wrong while processing your request.",
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-    
 
+
+class GetDashboardAnalyticsView(generics.ListAPIView):
+
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'year'
+
+    def list(self, request, *args, **kwargs):
+
+        try:
+            year = kwargs.get('year') or timezone.localdate().year
+            exact = is_exact(request)
+            cache_key = f"analytics:dashboard:{year}:{'exact' if exact else 'approximate'}"
+
+            #every widget of the admin dashboard, shared by the admins for a few seconds
+            data = cache.get(cache_key)
+
+            if data is None:
+                data = get_dashboard(year, exact=exact)
+                cache.set(cache_key, data, DASHBOARD_CACHE_TTL)
+
+            return ResponseMessageUtils(
+                message="Analytics dashboard",
+                data=data,
+                status_code=status.HTTP_200_OK
+            )
+
+        except Exception as e:
+            return ResponseMessageUtils(
+                message="Something went wrong while processing your request.",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
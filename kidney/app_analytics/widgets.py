@@ -0,0 +1,244 @@
+from calendar import month_abbr
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from app_authentication.models import User
+from .models import DailyAppointmentStat, DailyPatientStat
+from .patient_counters import estimate_patients
+
+PROVIDER_ROLES = ['nurse', 'head nurse']
+TRACKED_GENDERS = ('male', 'female')
+#the keys of the status breakdown when there are no appointments yet
+BREAKDOWN_STATUSES = ['pending', 'approved', 'check_in', 'in_progress', 'completed', 'cancelled', 'no_show', 'rescheduled']
+
+#the dashboard's independent queries run on their own connections
+query_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='analytics')
+
+
+class WeekWindows:
+    """The two 7-day windows the analytics compare and the 30-day month, all of them end today except last week."""
+
+    def __init__(self, today=None):
+        self.today = today or timezone.localdate()
+        self.this_week_start = self.today - timedelta(days=6)
+        self.last_week_start = self.this_week_start - timedelta(days=7)
+        self.last_week_end = self.this_week_start - timedelta(days=1)
+        self.month_start = self.today - timedelta(days=29)
+
+    @property
+    def this_week_days(self):
+        return [self.this_week_start + timedelta(days=day) for day in range(7)]
+
+    @property
+    def last_week_days(self):
+        return [self.last_week_start + timedelta(days=day) for day in range(7)]
+
+    @property
+    def month_days(self):
+        return [self.month_start + timedelta(days=day) for day in range(30)]
+
+    @property
+    def days(self):
+        #both weeks, oldest first
+        return [self.last_week_start + timedelta(days=day) for day in range(14)]
+
+
+def run_query(query):
+    #the pooled threads are never torn down like a request thread, close the connection they opened
+    try:
+        return query()
+    finally:
+        connection.close()
+
+
+def run_concurrently(*queries):
+    """
+        Runs independent queries at the same time and returns their results in order.
+
+        Inside a transaction they run one after the other on the current connection,
+        the other connections couldn't see its uncommitted rows.
+    """
+    if connection.in_atomic_block:
+        return [query() for query in queries]
+
+    futures = [query_executor.submit(run_query, query) for query in queries]
+    return [future.result() for future in futures]
+
+
+def query_appointment_stats(windows):
+    """
+        Reads the appointments of each day of both weeks and of each status in one GROUP BY over the daily rollup.
+
+        Returns:
+            tuple: The appointments keyed by the day, and keyed by the status.
+    """
+    days = windows.days
+
+    rows = (
+        DailyAppointmentStat.objects.values('status')
+        .annotate(
+            total=Sum('appointments'),
+            **{f"day_{index}": Sum('appointments', filter=Q(date=day)) for index, day in enumerate(days)}
+        )
+        .order_by()
+    )
+
+    daily_appointments = dict.fromkeys(days, 0)
+    status_totals = {}
+
+    for row in rows:
+        if row['total']:
+            status_totals[row['status']] = row['total']
+
+        for index, day in enumerate(days):
+            daily_appointments[day] += row[f"day_{index}"] or 0
+
+    return daily_appointments, status_totals
+
+
+def query_patient_stats(windows, exact=False):
+    """
+        Counts the distinct patients of both weeks, of the month and of each day of this week.
+
+        The counts are estimated from the daily HyperLogLogs unless exact is set or the
+        counters are unavailable, then they are read in one aggregate over the daily rollup.
+    """
+    if not exact:
+        patient_stats = estimate_patients(windows)
+
+        if patient_stats is not None:
+            return {**patient_stats, "approximate": True}
+
+    patient_stats = DailyPatientStat.objects.filter(
+        date__range=[windows.month_start, windows.today],
+        appointments__gt=0
+    ).aggregate(
+        this_week=Count('user_id', distinct=True, filter=Q(date__gte=windows.this_week_start)),
+        last_week=Count('user_id', distinct=True, filter=Q(date__range=[windows.last_week_start, windows.last_week_end])),
+        this_month=Count('user_id', distinct=True),
+        **{f"day_{index}": Count('user_id', filter=Q(date=day)) for index, day in enumerate(windows.this_week_days)}
+    )
+
+    return {**patient_stats, "approximate": False}
+
+
+def get_month_start(year, month):
+    #months start at local midnight, like the dates shown on the dashboard
+    return timezone.make_aware(datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1))
+
+
+def query_user_stats(year=None):
+    """
+        Counts the providers, and the patients who registered in each month of the year by gender, in one aggregate.
+
+        The tracking counts are only read when a year is given.
+    """
+    counts = {"total_provider": Count('id', filter=Q(role__in=PROVIDER_ROLES))}
+
+    if year is not None:
+        for gender in TRACKED_GENDERS:
+            for month in range(1, 13):
+                counts[f"{gender}_{month}"] = Count('id', filter=Q(
+                    role='patient',
+                    user_information__gender__iexact=gender,
+                    user_information__created_at__gte=get_month_start(year, month),
+                    user_information__created_at__lt=get_month_start(year, month + 1),
+                ))
+
+    return User.objects.aggregate(**counts)
+
+
+def get_weekly_change(this_week, last_week, subject, ending=""):
+    """Returns the percent change, the growth multiplier and the summary of a week over week comparison."""
+    if last_week > 0:
+        percent_change = round(((this_week - last_week) / last_week) * 100, 2)
+        growth_multiplier = round(this_week / last_week, 3)
+
+        direction = "increased" if percent_change > 0 else "decreased"
+        message = f"{subject} {direction} by {abs(int(percent_change))}% in 7 days{ending}"
+    else:
+        #no baseline to compare with
+        percent_change = 0
+        growth_multiplier = 1.0
+        message = None
+
+    return abs(int(percent_change)) if percent_change else 0, growth_multiplier, message
+
+
+def get_patient_analytics(patient_stats):
+    percent_change, growth, message = get_weekly_change(patient_stats['this_week'], patient_stats['last_week'], "Patients")
+
+    return {
+        'total_patients': patient_stats['this_week'],
+        'total_monthly_patients': patient_stats['this_month'],
+        'percent_change': percent_change,
+        'growth': growth,
+        "summary": message,
+        "graph_data": [{"value": patient_stats[f"day_{index}"]} for index in range(7)],
+        #estimated from the HyperLogLogs, ?exact=1 counts them in the database
+        "approximate": patient_stats['approximate']
+    }
+
+
+def get_appointment_analytics(windows, daily_appointments):
+    this_week_appointments = sum(daily_appointments[day] for day in windows.this_week_days)
+    last_week_appointments = sum(total for day, total in daily_appointments.items() if day <= windows.last_week_end)
+
+    percent_change, growth, message = get_weekly_change(this_week_appointments, last_week_appointments, "Appointment", ending=".")
+
+    return {
+        'total_appointments': this_week_appointments,
+        'percent_change': percent_change,
+        "growth": growth,
+        "summary": message,
+        "graph_data": [{"value": daily_appointments[day]} for day in windows.this_week_days]
+    }
+
+
+def get_provider_analytics(user_stats):
+    return {"total_provider": user_stats['total_provider']}
+
+
+def get_status_breakdown(status_totals):
+    total_appointments = sum(status_totals.values())
+
+    if not total_appointments:
+        return {f"percentage_{appointment_status}_appointment": 0 for appointment_status in BREAKDOWN_STATUSES}
+
+    return {
+        f"percentage_{str(appointment_status.lower()).replace('-', '_')}_appointment": round((count / total_appointments) * 100, 2)
+        for appointment_status, count in status_totals.items()
+    }
+
+
+def get_patient_tracking(user_stats):
+    tracking = {
+        "labels": [month_abbr[month] for month in range(1, 13)],
+        **{gender: [user_stats[f"{gender}_{month}"] for month in range(1, 13)] for gender in TRACKED_GENDERS}
+    }
+
+    return {
+        **{f"{gender}_tracking_data": {"gender": gender, "count": sum(tracking[gender])} for gender in TRACKED_GENDERS},
+        "patient_month_tracking_data": tracking
+    }
+
+
+def get_dashboard(year, exact=False):
+    """Builds every widget of the admin dashboard from three queries run concurrently."""
+    windows = WeekWindows()
+
+    (daily_appointments, status_totals), patient_stats, user_stats = run_concurrently(
+        lambda: query_appointment_stats(windows),
+        lambda: query_patient_stats(windows, exact=exact),
+        lambda: query_user_stats(year),
+    )
+
+    return {
+        "patients": get_patient_analytics(patient_stats),
+        "appointments": get_appointment_analytics(windows, daily_appointments),
+        "providers": get_provider_analytics(user_stats),
+        "appointment_status_breakdown": get_status_breakdown(status_totals),
+        "patient_tracking": get_patient_tracking(user_stats),
+    }
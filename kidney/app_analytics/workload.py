@@ -0,0 +1,86 @@
+from datetime import timedelta
+from django.db.models import Count, Q
+from app_authentication.models import User
+from app_appointment.models import AssignedProvider
+from app_appointment.assignments import get_latest_assignment_id
+from .widgets import PROVIDER_ROLES
+
+MAX_WORKLOAD_DAYS = 62  #days a single workload request can cover
+DEFAULT_WORKLOAD_DAYS = 14
+#an appointment with one of these statuses takes no session
+UNATTENDED_STATUSES = ('cancelled', 'no show')
+#the appointments still waiting in a nurse's queue
+QUEUED_STATUSES = ('pending', 'approved')
+
+
+def query_provider_workload(start_date, end_date):
+    """
+        Counts the sessions and the queued appointments of each nurse on each date of the range in one GROUP BY.
+
+        An appointment reassigned to another nurse keeps its old assignment row, only the
+        latest assignment of each appointment is counted.
+    """
+    appointment = 'assigned_patient_appointment'
+
+    return (
+        AssignedProvider.objects.filter(
+            assigned_provider__role__in=PROVIDER_ROLES,
+            assigned_patient_appointment__date__range=(start_date, end_date),
+            id=get_latest_assignment_id()
+        )
+        .values('assigned_provider_id', 'assigned_patient_appointment__date')
+        .annotate(
+            sessions=Count(appointment, distinct=True, filter=~Q(assigned_patient_appointment__status__in=UNATTENDED_STATUSES)),
+            queued=Count(appointment, distinct=True, filter=Q(assigned_patient_appointment__status__in=QUEUED_STATUSES)),
+        )
+        .order_by()
+    )
+
+
+def get_provider_workload(start_date, end_date):
+    """
+        Returns the workload of every nurse as matrices, a row per nurse and a column per date.
+
+        The nurses are listed even without appointments, the matrices are filled from a single
+        GROUP BY and the weekly sessions sum each 7 days from the start date.
+
+        Returns:
+            dict: The days, weeks and nurses labels, the sessions, queued and weekly_sessions matrices and the queue_length of each nurse.
+    """
+    total_days = (end_date - start_date).days + 1
+    days = [start_date + timedelta(days=day) for day in range(total_days)]
+    day_index = {day: index for index, day in enumerate(days)}
+
+    nurses = list(
+        User.objects.filter(role__in=PROVIDER_ROLES)
+        .order_by('first_name', 'last_name', 'id')
+        .values_list('id', 'first_name', 'last_name', 'role')
+    )
+    nurse_index = {nurse[0]: index for index, nurse in enumerate(nurses)}
+
+    sessions = [[0] * total_days for _ in nurses]
+    queued = [[0] * total_days for _ in nurses]
+
+    for row in query_provider_workload(start_date, end_date):
+        row_index = nurse_index.get(row['assigned_provider_id'])
+
+        #a nurse who registered since the roster was read
+        if row_index is None:
+            continue
+
+        column = day_index[row['assigned_patient_appointment__date']]
+        sessions[row_index][column] = row['sessions']
+        queued[row_index][column] = row['queued']
+
+    return {
+        "days": [day.strftime('%m/%d/%Y') for day in days],
+        "weeks": [day.strftime('%m/%d/%Y') for day in days[::7]],
+        "nurses": [
+            {"id": nurse_id, "name": f"{first_name} {last_name}", "role": role}
+            for nurse_id, first_name, last_name, role in nurses
+        ],
+        "sessions": sessions,
+        "queued": queued,
+        "weekly_sessions": [[sum(row[week:week + 7]) for week in range(0, total_days, 7)] for row in sessions],
+        "queue_length": [sum(row) for row in queued],
+    }
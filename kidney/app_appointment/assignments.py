@@ -0,0 +1,28 @@
+from django.db.models import OuterRef, Subquery
+from .models import AssignedProvider
+
+
+def get_current_provider():
+    """
+        The provider of an appointment's latest assignment, to annotate an Appointment queryset with.
+
+        A reassignment adds an AssignedProvider row and keeps the old ones, the newest row is the current provider.
+    """
+    return Subquery(
+        AssignedProvider.objects.filter(
+            assigned_patient_appointment=OuterRef('pk')
+        ).order_by('-id').values('assigned_provider')[:1]
+    )
+
+
+def get_latest_assignment_id():
+    """
+        The id of the latest assignment of the same appointment, to filter an AssignedProvider queryset on.
+
+        An appointment reassigned to another nurse then only counts for the current one.
+    """
+    return Subquery(
+        AssignedProvider.objects.filter(
+            assigned_patient_appointment=OuterRef('assigned_patient_appointment')
+        ).order_by('-id').values('id')[:1]
+    )
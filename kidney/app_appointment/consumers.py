@@ -1,78 +1,38 @@
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from kidney.utils import get_user_by_id
-from app_appointment.models import Appointment
-from django.utils import timezone
-from asgiref.sync import sync_to_async
+from kidney.realtime.gateway import RealtimeConsumer
 import logging
-from django.db.models import F, DateTimeField, ExpressionWrapper, Q
-from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
-class AppointmentConsumer(AsyncWebsocketConsumer):
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.room_name = None
+class AppointmentConsumer(RealtimeConsumer):
+    """
+        The ws/appointment/ route, kept while clients move to ws/realtime/.
 
-    async def connect(self):
-        """Handles the WebSocket connection."""
-        try:
-            #user is already authenticated by middleware
-            user = self.scope["user"]
-            if not user:
-                await self.close(code=4003)
-                return
-            
-            #create chat room and join the chat room
-            self.room_name = f"appointment_user_{user.id}"
-            await self.channel_layer.group_add(self.room_name, self.channel_name)
-
-            #accept the connection
-            await self.accept()
+        A gateway socket that only carries the appointment events of the user and writes
+        them as the plain upcoming appointment frames of the previous consumer.
+    """
 
-        except Exception as e:
-            await self.close(code=4003)
-        
-    async def disconnect(self, close_code):
-        """Handles the WebSocket disconnection."""
-        try:
-            if hasattr(self, 'room_name') and self.room_name:
-                await self.channel_layer.group_discard(self.room_name, self.channel_name)
-        except Exception as e:
-            print(f"[ERROR] Disconnect failed")
+    chat_events = False
 
     async def receive(self, text_data):
-        
-        print(f"TEXT_DATA: {text_data}")
-
-    
-    # async def send_upcoming_appointment(self, appointment):
-
-    #     await self.channel_layer.group_send(
-    #         self.room_name,
-    #         {}
-    #     )
-
-
-    async def upcoming_appointments(self, event):
-        await self.send(text_data=json.dumps({
-            "date": event["date"],
-            "time": event["time"],
-            "patient_id": event["patient_id"],
-            "appointment_id": event["appointment_id"],
-            "nurse_id": event["nurse_id"],
-            "status": event["status"],
-            "machine": event["machine"],
-            "provider_name": event["provider_name"],
-            "provider_image": event["provider_image"]
-        }))
-
-
-    
-
-
-
 
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_error("Invalid JSON data.")
+            return
+
+        #heartbeats and presence subscriptions, the socket doesn't take any other message
+        await self.handle_presence_message(data)
+
+    async def send_envelope(self, type, data=None, conversation=None, event_id=None, replayed=False):
+        #the frames the appointment clients already understand
+        if type == "appointment.upcoming":
+            frame = data
+        elif type == "error":
+            frame = {"error": data["message"]}
+        else:
+            frame = {"type": type, **(data or {})}
+
+        await self.send(text_data=json.dumps(frame))
@@ -0,0 +1,39 @@
+from app_notification.realtime_outbox import enqueue_realtime_event
+
+
+def appointment_group_name(user_id):
+    return f"appointment_user_{user_id}"
+
+
+def get_upcoming_appointment_event(appointment, machine=None, provider=None, request=None):
+    """
+        Builds the upcoming appointment event of the appointment's patient.
+
+        Args:
+            appointment (Appointment): The booked or updated appointment.
+            machine (str): The number of the assigned machine, if any.
+            provider (User): The assigned provider with their profile loaded, if any.
+            request (Request): Used to build the absolute url of the provider's picture.
+    """
+    picture = getattr(getattr(provider, 'user_profile', None), 'picture', None)
+
+    return {
+        "type": "upcoming_appointments",
+        "date": appointment.date.strftime("%m/%d/%Y"),
+        "time": appointment.time.strftime("%I:%M %p"),
+        "patient_id": str(appointment.user_id),
+        "appointment_id": appointment.id,
+        "nurse_id": str(provider.id) if provider else None,
+        "status": str(appointment.status).lower(),
+        "machine": f"machine #{machine}",
+        "provider_name": str(provider.first_name).lower() if provider else None,
+        "provider_image": request.build_absolute_uri(picture.url) if picture and request else None
+    }
+
+
+def publish_upcoming_appointment(appointment, machine=None, provider=None, request=None):
+    """Queues the upcoming appointment event for the patient's sockets, call it inside the transaction that changed the appointment."""
+    enqueue_realtime_event(
+        appointment_group_name(appointment.user_id),
+        get_upcoming_appointment_event(appointment, machine=machine, provider=provider, request=request)
+    )
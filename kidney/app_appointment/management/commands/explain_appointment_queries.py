@@ -0,0 +1,19 @@
+import uuid
+from app_appointment.models import Appointment
+from kidney.query_plans import ExplainQueriesCommand
+
+
+class Command(ExplainQueriesCommand):
+    help = "Runs EXPLAIN on the hot appointment queries and reports whether each one uses an index."
+
+    def get_hot_queries(self):
+        user_id = uuid.uuid4()
+
+        return [
+            ("patient appointments by status", Appointment.objects.filter(
+                user=user_id, status='approved'
+            ).order_by('date')),
+            ("appointments by status", Appointment.objects.filter(
+                status='pending'
+            ).order_by('date')),
+        ]
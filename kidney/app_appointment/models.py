@@ -21,6 +21,14 @@ class Appointment(TimestampModel):
     time = models.TimeField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=appointment_status, default='pending')
 
+    class Meta:
+        indexes = [
+            #appointments of a patient filtered by status (upcoming, history, notifications)
+            models.Index(fields=['user', 'status', 'date'], name='appointment_user_status_idx'),
+            #appointments filtered by status only (admin and provider lists)
+            models.Index(fields=['status', 'date'], name='appointment_status_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} Appointment - {self.id}"
 
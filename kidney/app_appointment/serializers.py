@@ -2,13 +2,32 @@ from rest_framework import serializers
 from .models import Appointment, AssignedAppointment, AssignedMachine, AssignedProvider
 from kidney.utils import is_field_empty
 from django.db import transaction
+from django.db.models import Prefetch
 from app_authentication.models import User, Profile, UserInformation
-from app_schedule.models import Schedule 
-from datetime import datetime, timedelta
+from app_schedule.slots import get_slot_grid, get_slot_key, is_slot_available, change_slot
 from app_notification.models import Notification
+from .events import publish_upcoming_appointment
+from app_analytics.rollups import record_appointment_created, record_status_change
 from django.utils import timezone
 import uuid
 
+SLOT_FULL_MESSAGE = "This time slot is already booked. Please choose different time."
+
+
+def validate_appointment_slot(date, time, current_slot=None):
+    """Checks that the date is an available day, the time one of the schedule's slots and that the slot has room left."""
+    grid = get_slot_grid()
+
+    if date and not grid.is_open(date):
+        raise serializers.ValidationError({"message": "This date is not available"})
+
+    if not grid.has_slot(time):
+        raise serializers.ValidationError({"message": "This time is not available"})
+
+    if (date, time) != current_slot and not is_slot_available(date, time):
+        raise serializers.ValidationError({"message": SLOT_FULL_MESSAGE})
+
+
 class CreateAppointmentSerializer(serializers.ModelSerializer):
 
     date = serializers.DateField(format='%m/%d/%Y',input_formats=['%m/%d/%Y'])
@@ -30,49 +49,12 @@ class CreateAppointmentSerializer(serializers.ModelSerializer):
     
     def validate(self, attrs):
 
-        time = attrs.get('time', None)
-
-        schedule_data = Schedule.objects.get(id=3)
-
-        #convert time into datetime objects
-        start_time = datetime.strptime(schedule_data.start_time.strftime('%I:%M %p'), '%I:%M %p')
-        end_time = datetime.strptime(schedule_data.end_time.strftime('%I:%M %p'), '%I:%M %p')
-
-        #set the interval to 1 hour
-        interval = timedelta(hours=1)
-        #set the start time to the current_time
-        current_time = start_time
-
-        #store all the available time in 'time slots'
-        time_slots = []
-
-        while current_time <= end_time:
-            #append the current_time to time slots
-            time_slots.append(current_time)
-            #adding 1hr interval to the current_time
-            current_time += interval
-
-
-        #format the time to 12-hour strings
-        formatted_time_slots = [datetime.strftime(slot, '%I:%M:%S') for slot in time_slots]
-
-        #format the input time to readable format
-        formatted_time_input = time.strftime('%I:%M:%S')
-
-        #if the time slots not exist
-        if formatted_time_input not in formatted_time_slots:
-            raise serializers.ValidationError({"message": "This time is not available"})
-        
-        #check for every taken slots
-        #taken_slots = [time_slot for time_slot in formatted_time_slots if Appointment.objects.filter(time=time_slot).exists()]
-
-    #     #check if the slots already in taken slots means someone already booked that time
-    #     if formatted_time_input in taken_slots:
-    #         raise serializers.ValidationError({"message": "This time slot is already booked. Please choose different time."})
-
+        validate_appointment_slot(attrs.get('date', None), attrs.get('time', None))
 
         return attrs
     
+    #the appointment, its notification and its realtime event are saved together
+    @transaction.atomic
     def create(self, validated_data):
 
         #get the request object from the serializer context
@@ -82,11 +64,20 @@ class CreateAppointmentSerializer(serializers.ModelSerializer):
         create_appointment = Appointment.objects.create(
             user=request.user,
             date=validated_data.get('date', None),
-            time=validated_data.get('time', None).strftime('%I:%M:%S'),
+            time=validated_data.get('time', None),
         )
 
+        #the counter update is what decides the last place of a slot
+        if not change_slot(None, get_slot_key(create_appointment.date, create_appointment.time, create_appointment.status)):
+            raise serializers.ValidationError({"message": SLOT_FULL_MESSAGE})
+
         Notification.objects.create(appointment=create_appointment)
 
+        record_appointment_created(create_appointment)
+
+        #a new appointment has no machine or provider assigned yet
+        publish_upcoming_appointment(create_appointment, request=request)
+
         #return the created appointment
         return create_appointment
 
@@ -95,7 +86,7 @@ class UpdateAppointmentInPatientSerializer(serializers.ModelSerializer):
 
     #format the date and time to readable format
     date = serializers.DateField(format='%m/%d/%Y',input_formats=['%m/%d/%Y'])
-    time = serializers.TimeField(format='%H:%M %p',input_formats=['%H:%M %p'], allow_null=True)
+    time = serializers.TimeField(format='%H:%M %p',input_formats=['%I:%M %p', '%H:%M %p'], allow_null=True)
 
     class Meta:
         model = Appointment
@@ -114,55 +105,33 @@ class UpdateAppointmentInPatientSerializer(serializers.ModelSerializer):
 
     def validate(self, attrs):
 
-        time = attrs.get('time', None)
-        # date = attrs.get('date', None)
-
-        schedule_data = Schedule.objects.get(id=3)
-
-        #convert time into datetime objects
-        start_time = datetime.strptime(schedule_data.start_time.strftime('%I:%M %p'), '%I:%M %p')
-        end_time = datetime.strptime(schedule_data.end_time.strftime('%I:%M %p'), '%I:%M %p')
-
-        #generate interval every 1 hour
-        interval = timedelta(hours=1)
-        current_time = start_time
-
-        #store all the available time in 'time slots'
-        time_slots = []
-
-        while current_time <= end_time:
-            #append the current_time to time slots
-            time_slots.append(current_time)
-            #adding 1hr interval to the current_time
-            current_time += interval
-
-
-        #format the time to 12-hour strings
-        formatted_time_slots = [datetime.strftime(slot, '%I:%M:%S') for slot in time_slots]
-
-        #format the input time to readable format
-        formatted_time_input = time.strftime('%I:%M:%S')
+        instance = self.instance
 
-        #if the time slots not exist
-        if formatted_time_input not in formatted_time_slots:
-            raise serializers.ValidationError({"message": "This time is not available"})
-        
+        #the appointment can stay in its own slot even when that slot is full
+        validate_appointment_slot(
+            attrs.get('date', None),
+            attrs.get('time', None),
+            current_slot=get_slot_key(instance.date, instance.time, instance.status) if instance else None
+        )
 
-        return attrs    
-        #check for every taken slots
-        #taken_slots = [time_slot for time_slot in formatted_time_slots if Appointment.objects.filter(time=time_slot).exists()]
+        return attrs
 
-    #     #check if the slots already in taken slots means someone already booked that time
-    #     if formatted_time_input in taken_slots and date == schedule_data.date_created:
-    #         raise serializers.ValidationError({"message": "This time slot is already booked. Please choose different time."})
-    
     #update date and time of the patient appointment (for reschedule)
+    @transaction.atomic
     def update(self, instance, validated_data):
+
+        old_slot = get_slot_key(instance.date, instance.time, instance.status)
+        old_status = instance.status
         
         instance.date = validated_data["date"]
         instance.time = validated_data["time"]
         instance.status = "rescheduled"
+
+        if not change_slot(old_slot, get_slot_key(instance.date, instance.time, instance.status)):
+            raise serializers.ValidationError({"message": SLOT_FULL_MESSAGE})
+
         instance.save()
+        record_status_change(instance, old_status)
 
         return instance
 
@@ -227,13 +196,22 @@ class AddAppointmentDetailsInAdminSerializer(serializers.Serializer):
 
         appointment = self.context.get('appointment_pk')
 
-        Appointment.objects.update_or_create(
+        old_slot = get_slot_key(appointment.date, appointment.time, appointment.status)
+        old_status = appointment.status
+
+        appointment, _ = Appointment.objects.update_or_create(
             id=appointment.id,
             defaults={
                 "status": validated_data.get('status', None)
             }
         )
 
+        #a cancelled appointment gives its slot back, restoring one books it again
+        if not change_slot(old_slot, get_slot_key(appointment.date, appointment.time, appointment.status)):
+            raise serializers.ValidationError({"message": SLOT_FULL_MESSAGE})
+
+        record_status_change(appointment, old_status)
+
         #create assigned machine object instance linked to the appointment
         assigned_machine_obj, _ = AssignedMachine.objects.update_or_create(
             assigned_machine_appointment=appointment,
@@ -243,17 +221,19 @@ class AddAppointmentDetailsInAdminSerializer(serializers.Serializer):
             }
         )
 
-        provider = User.objects.filter(id=assigned_providers_data["assigned_provider"]).first()
+        provider = User.objects.select_related('user_profile').filter(id=assigned_providers_data["assigned_provider"]).first()
         
         if not provider:
             raise serializers.ValidationError({"message": "No provider found"})
 
-        #create assigned provider object instance linked to the appointment
-        assigned_provider_obj, _ = AssignedProvider.objects.update_or_create(
-            assigned_provider=provider,
-            assigned_patient_appointment=appointment,
-            defaults={}
-        )
+        #the latest assignment row is the current provider, a reassignment adds a new one
+        assigned_provider_obj = AssignedProvider.objects.filter(assigned_patient_appointment=appointment).order_by('-id').first()
+
+        if not assigned_provider_obj or assigned_provider_obj.assigned_provider_id != provider.id:
+            assigned_provider_obj = AssignedProvider.objects.create(
+                assigned_provider=provider,
+                assigned_patient_appointment=appointment
+            )
 
         #create assigned appointment object instance linked to the appointment
         assigned_appointment_obj, _ = AssignedAppointment.objects.update_or_create(
@@ -267,6 +247,15 @@ class AddAppointmentDetailsInAdminSerializer(serializers.Serializer):
             # }
         )
 
+        #tell the patient once the appointment is approved, in the same transaction as the approval
+        if appointment.status == "approved":
+            publish_upcoming_appointment(
+                appointment,
+                machine=assigned_machine_obj.assigned_machine,
+                provider=provider,
+                request=self.context.get('request')
+            )
+
         return assigned_appointment_obj
 
 
@@ -313,8 +302,38 @@ class GetAssignedAppointmentSerializer(serializers.ModelSerializer):
         return data
 
 
+class PrefetchedAppointmentSerializer(serializers.ModelSerializer):
+
+    """Base serializer for appointment lists that reads related rows from prefetched caches only."""
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        #load the patient profile, assigned provider and assigned machine in a fixed number of queries
+        return queryset.select_related('user__user_profile').prefetch_related(
+            #newest first, the first row is the current provider after a reassignment
+            Prefetch('assigned_patient_appointment', queryset=AssignedProvider.objects.select_related('assigned_provider').order_by('-id')),
+            Prefetch('assigned_machine_appointment', queryset=AssignedMachine.objects.all()),
+        )
+
+    def get_patient_picture(self, obj):
+        #get the request object from the serializer context
+        request = self.context.get('request')
+        user_profile = getattr(obj.user, 'user_profile', None)
+        return request.build_absolute_uri(user_profile.picture.url) if user_profile and user_profile.picture else None
+
+    def get_assigned_provider_user(self, obj):
+        assigned_providers = obj.assigned_patient_appointment.all()
+        return assigned_providers[0].assigned_provider if assigned_providers else None
+
+    def get_assigned_machine_number(self, obj):
+        assigned_machines = obj.assigned_machine_appointment.all()
+        if assigned_machines and assigned_machines[0].assigned_machine:
+            return int(assigned_machines[0].assigned_machine)
+        return None
+
+
 #DONE
-class GetAppointmentsInProviderSerializer(serializers.ModelSerializer):
+class GetAppointmentsInProviderSerializer(PrefetchedAppointmentSerializer):
 
     first_name = serializers.SerializerMethodField()
     last_name = serializers.SerializerMethodField()
@@ -331,34 +350,16 @@ class GetAppointmentsInProviderSerializer(serializers.ModelSerializer):
 
 
     def get_picture(self, obj):
-        #get the request object from the serializer context
-        request = self.context.get('request')
-        try:
-            user_profile = Profile.objects.get(user=obj.user)
-            return request.build_absolute_uri(user_profile.picture.url) if user_profile.picture else None
-        except Profile.DoesNotExist:
-            return None
+        return self.get_patient_picture(obj)
 
     # # get the assigned provider of the patient from the related appointment
     def get_provider(self, obj):
-        
-        try:
-            assigned_provider = AssignedProvider.objects.get(
-                assigned_patient_appointment=obj
-            )
-            return f"{assigned_provider.assigned_provider.first_name} {assigned_provider.assigned_provider.last_name}"
-        except AssignedProvider.DoesNotExist:
-            return None
+        provider = self.get_assigned_provider_user(obj)
+        return f"{provider.first_name} {provider.last_name}" if provider else None
     
     # #get the assigned machine of the patient from the related appointment
     def get_machine(self, obj):
-        try:
-            assigned_machine = AssignedMachine.objects.get(
-                assigned_machine_appointment=obj
-            )
-            return int(assigned_machine.assigned_machine)
-        except AssignedMachine.DoesNotExist:
-            return None
+        return self.get_assigned_machine_number(obj)
     
     # #get the firstname of the patient from the related appointment
     def get_first_name(self, obj):
@@ -489,7 +490,7 @@ class GetPatientAppointmentHistorySerializer(serializers.ModelSerializer):
         return data
 
 
-class GetAllAppointsmentsInAdminSerializer(serializers.ModelSerializer):
+class GetAllAppointsmentsInAdminSerializer(PrefetchedAppointmentSerializer):
 
     first_name = serializers.SerializerMethodField()
     last_name = serializers.SerializerMethodField()
@@ -523,32 +524,14 @@ class GetAllAppointsmentsInAdminSerializer(serializers.ModelSerializer):
         return str(obj.status).lower()
     
     def get_picture(self, obj):
-
-        request = self.context.get('request')
-
-        user_profile = Profile.objects.get(user=obj.user)
-
-        return request.build_absolute_uri(user_profile.picture.url) if user_profile.picture else None
+        return self.get_patient_picture(obj)
     
     def get_assigned_provider(self, obj):
-
-        assigned_provider = AssignedAppointment.objects.select_related('appointment').filter(appointment=obj)
-
-        for provider in assigned_provider:
-
-            if provider and provider.assigned_provider:
-                return f'{provider.assigned_provider.assigned_provider.first_name} {provider.assigned_provider.assigned_provider.last_name}'
-            return None
+        provider = self.get_assigned_provider_user(obj)
+        return f'{provider.first_name} {provider.last_name}' if provider else None
         
     def get_assigned_machine(self, obj):
-
-        assigned_machine = AssignedAppointment.objects.select_related('appointment').filter(appointment=obj)
-
-        for machine in assigned_machine:
-
-            if machine and machine.assigned_machine:
-                return int(machine.assigned_machine.assigned_machine)
-            return None
+        return self.get_assigned_machine_number(obj)
 
 
 
@@ -559,9 +542,15 @@ class CancelAppointmentSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = '__all__'
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        #give the slot back to other patients
+        change_slot(get_slot_key(instance.date, instance.time, instance.status), None)
+        old_status = instance.status
+
         instance.status = 'cancelled'
         instance.save()
+        record_status_change(instance, old_status)
         return instance
 
 
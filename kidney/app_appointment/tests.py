@@ -1,3 +1,152 @@
+from datetime import date, time
+from io import StringIO
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from app_authentication.models import User, Profile
+from app_notification.models import RealtimeEvent
+from app_schedule.models import Schedule
+from .models import Appointment, AssignedProvider, AssignedMachine, AssignedAppointment
 
-# Create your tests here.
+
+class AppointmentListQueryCountTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.nurse = self.create_user('nurse@kidneycare.com', 'nurse')
+        self.admin = self.create_user('admin@kidneycare.com', 'admin')
+
+    def create_user(self, username, role):
+        user = User.objects.create_user(username=username, password='password123', role=role, first_name=role, last_name='user')
+        Profile.objects.create(user=user)
+        return user
+
+    def add_appointments(self, count, status='pending'):
+        for _ in range(count):
+            patient = self.create_user(f"patient{User.objects.count()}@kidneycare.com", 'patient')
+            appointment = Appointment.objects.create(user=patient, date=date(2025, 1, 6), time=time(8, 0), status=status)
+            provider = AssignedProvider.objects.create(assigned_provider=self.nurse, assigned_patient_appointment=appointment)
+            machine = AssignedMachine.objects.create(assigned_machine_appointment=appointment, assigned_machine='3')
+            AssignedAppointment.objects.create(appointment=appointment, assigned_provider=provider, assigned_machine=machine)
+
+    def count_queries(self, user, url):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data["data"]["results"]
+
+    def test_provider_appointments_query_count_is_constant(self):
+        self.add_appointments(2)
+        small_count, small_data = self.count_queries(self.nurse, '/patient/appointments/')
+
+        self.add_appointments(8)
+        large_count, large_data = self.count_queries(self.nurse, '/patient/appointments/')
+
+        self.assertEqual(len(small_data), 2)
+        self.assertEqual(len(large_data), 10)
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(large_data[0]["provider"], 'nurse user')
+        self.assertEqual(large_data[0]["machine"], 3)
+
+    def test_admin_appointments_query_count_is_constant(self):
+        self.add_appointments(2)
+        small_count, _ = self.count_queries(self.admin, '/patient/all-appointments/')
+
+        self.add_appointments(8)
+        large_count, large_data = self.count_queries(self.admin, '/patient/all-appointments/')
+
+        self.assertEqual(len(large_data), 10)
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(large_data[0]["assigned_provider"], 'nurse user')
+        self.assertEqual(large_data[0]["assigned_machine"], 3)
+
+    def test_lists_show_the_provider_of_the_latest_assignment(self):
+        self.add_appointments(1)
+        appointment = Appointment.objects.get()
+        other_nurse = self.create_user('other@kidneycare.com', 'nurse')
+        other_nurse.first_name = 'other'
+        other_nurse.save()
+
+        #reassign to the other nurse and back, each reassignment adds a row
+        for nurse in (other_nurse, self.nurse):
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}")
+            response = self.client.post(f'/appointment-details/{appointment.id}/', {
+                "status": "pending",
+                "assigned_machine": {"assigned_machine": "3"},
+                "assigned_provider": {"assigned_provider": str(nurse.id)},
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+
+            _, data = self.count_queries(self.admin, '/patient/all-appointments/')
+            self.assertEqual(data[0]["assigned_provider"], f'{nurse.first_name} user')
+
+        self.assertEqual(AssignedProvider.objects.filter(assigned_patient_appointment=appointment).count(), 3)
+
+        #the provider list follows the latest assignment too
+        self.assertEqual(len(self.count_queries(self.nurse, '/patient/appointments/')[1]), 1)
+        self.assertEqual(len(self.count_queries(other_nurse, '/patient/appointments/')[1]), 0)
+
+
+class AppointmentRealtimeEventTest(TestCase):
+
+    def setUp(self):
+        #drop the schedule version of the previous test
+        cache.clear()
+        self.client = APIClient()
+        Schedule.objects.create(id=3, start_time=time(8, 0), end_time=time(17, 0))
+        self.patient = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        self.nurse = User.objects.create_user(username='nurse@kidneycare.com', password='password123', role='nurse', first_name='Joy')
+        self.admin = User.objects.create_user(username='admin@kidneycare.com', password='password123', role='admin')
+        Profile.objects.bulk_create([Profile(user=self.patient), Profile(user=self.nurse), Profile(user=self.admin)])
+
+    def post(self, user, url, data):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return self.client.post(url, data, format='json')
+
+    def receive_dispatched_event(self):
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"appointment_user_{self.patient.id}", channel_name)
+
+        call_command('dispatch_realtime_events', once=True, stdout=StringIO())
+
+        return async_to_sync(channel_layer.receive)(channel_name)
+
+    def test_booking_queues_the_event_for_the_dispatcher(self):
+        response = self.post(self.patient, '/patient/create-appointment/', {"date": "01/06/2025", "time": "01:00 PM"})
+        self.assertEqual(response.status_code, 201)
+
+        outbox_event = RealtimeEvent.objects.get()
+        self.assertEqual(outbox_event.group, f"appointment_user_{self.patient.id}")
+        self.assertEqual(outbox_event.status, 'pending')
+
+        event = self.receive_dispatched_event()
+        self.assertEqual(event["type"], "upcoming_appointments")
+        self.assertEqual(event["appointment_id"], Appointment.objects.get().id)
+        self.assertEqual(event["date"], "01/06/2025")
+        self.assertIsNone(event["nurse_id"])
+        #delivered events leave the outbox
+        self.assertFalse(RealtimeEvent.objects.exists())
+
+    def test_approval_queues_the_event_with_the_assignment(self):
+        appointment = Appointment.objects.create(user=self.patient, date=date(2025, 1, 6), time=time(8, 0))
+
+        response = self.post(self.admin, f'/appointment-details/{appointment.id}/', {
+            "status": "approved",
+            "assigned_machine": {"assigned_machine": "3"},
+            "assigned_provider": {"assigned_provider": str(self.nurse.id)},
+        })
+        self.assertEqual(response.status_code, 201)
+
+        event = self.receive_dispatched_event()
+        self.assertEqual(event["status"], "approved")
+        self.assertEqual(event["machine"], "machine #3")
+        self.assertEqual(event["nurse_id"], str(self.nurse.id))
+        self.assertEqual(event["provider_name"], "joy")
@@ -13,22 +13,25 @@ from .serializers import (
     GetPatientAppointmentDetailsInAdminSerializer,
     GetUpcomingAppointmentDetailsInPatientSerializer,
 )
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.db import transaction
 from django.db.models import F, DateTimeField, ExpressionWrapper, Q
 from django.utils import timezone
 from app_authentication.models import User
 from .models import Appointment
+from .assignments import get_current_provider
 from rest_framework import generics, status
 from kidney.utils import (
     ResponseMessageUtils,
-    extract_first_error_message,
-    get_token_user_id
+    extract_first_error_message
 )
+from kidney.identity import get_request_identity
 from datetime import timedelta
 from rest_framework.permissions import IsAuthenticated
 from .models import AssignedAppointment
 from kidney.pagination.appointment_pagination import Pagination
+from app_schedule.slots import get_slot_key, change_slot
+from app_analytics.rollups import record_appointment_deleted
+from rest_framework.exceptions import ValidationError
 
 class CreateAppointmentView(generics.CreateAPIView):
 
@@ -40,49 +43,15 @@ class CreateAppointmentView(generics.CreateAPIView):
             serializer = self.get_serializer(data=request.data)
             if serializer.is_valid():
                 
-                created_appointment = serializer.save()
-                
-                appointment = Appointment.objects.get(id=created_appointment.id)
-                user = appointment.user
-
-                #create an instance of channel layer
-                channel_layer = get_channel_layer()
-
-                #get the machine that linked to the created appointment
-                assigned_machine_obj = created_appointment.assigned_machine_appointment.first()
-
-                assigned_machine = assigned_machine_obj.assigned_machine if assigned_machine_obj else None
-
-                assigned_provider_obj = appointment.assigned_patient_appointment.first()
-
-                assigned_provider = assigned_provider_obj.assigned_provider if assigned_provider_obj else None
-
-                get_provider_profile = (
-                    request.build_absolute_uri(getattr(getattr(assigned_provider, 'user_profile', None), 'picture', None).url)
-                    if getattr(getattr(assigned_provider, 'user_profile', None), 'picture', None)
-                    else None
-                )
-
-                async_to_sync(channel_layer.group_send)(
-                    f"appointment_user_{user.id}",
-                    {
-                        "type": "upcoming_appointments",
-                        "date": appointment.date.strftime("%m/%d/%Y"),
-                        "time": appointment.time.strftime("%I:%M %p"),
-                        "patient_id": str(user.id),
-                        "appointment_id": appointment.id,
-                        "nurse_id": str(assigned_provider.id) if assigned_provider else None,
-                        "status": str(appointment.status).lower(),
-                        "machine": f"machine #{assigned_machine}",
-                        "provider_name": str(assigned_provider.first_name).lower() if assigned_provider else None,
-                        "provider_image": get_provider_profile
-                    }
-                ) 
-            
+                #the upcoming appointment event is queued with the appointment, the dispatcher sends it
+                serializer.save()
 
                 return ResponseMessageUtils(message="Successfully created an appointment", status_code=status.HTTP_201_CREATED)
             return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
-            
+
+        except ValidationError as e:
+            #the slot was filled by another booking after the validation
+            return ResponseMessageUtils(message=extract_first_error_message(e.detail), status_code=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return ResponseMessageUtils(
                 message=f"Something went wrong while processing your request {e}",
@@ -114,6 +83,9 @@ class UpdateAppointmentInPatientView(generics.UpdateAPIView):
                     status_code=status.HTTP_200_OK
                 )
             return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            #the slot was filled by another booking after the validation
+            return ResponseMessageUtils(message=extract_first_error_message(e.detail), status_code=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return ResponseMessageUtils(
                 message="Something went wrong while processing your request.",
@@ -134,50 +106,19 @@ class AddAppointmentDetailsInAdminView(generics.CreateAPIView):
 
             appointment = Appointment.objects.get(id=self.kwargs.get('pk'))
 
-            serializer = self.get_serializer(data=request.data, many=False, context={'appointment_pk': appointment})
+            serializer = self.get_serializer(data=request.data, many=False, context={'appointment_pk': appointment, 'request': request})
 
             if serializer.is_valid():
                 
-                updated_appointment = serializer.save()
-                #get the user linked to the updated appointment
-                user = updated_appointment.appointment.user
-                #create an instance of channel layer
-                channel_layer = get_channel_layer()
-
-                assigned_machine_obj = appointment.assigned_machine_appointment.first()
-
-                assigned_machine = assigned_machine_obj.assigned_machine if assigned_machine_obj else None
-
-                assigned_provider_obj = appointment.assigned_patient_appointment.first()
-
-                assigned_provider = assigned_provider_obj.assigned_provider if assigned_provider_obj else None
-
-                get_provider_profile = (
-                    request.build_absolute_uri(getattr(getattr(assigned_provider, 'user_profile', None), 'picture', None).url)
-                    if getattr(getattr(assigned_provider, 'user_profile', None), 'picture', None)
-                    else None
-                )
-
-                if updated_appointment.appointment.status == "approved":
-                    async_to_sync(channel_layer.group_send)(
-                        f"appointment_user_{user.id}",
-                        {
-                            "type": "upcoming_appointments",
-                            "date": updated_appointment.appointment.date.strftime("%m/%d/%Y"),
-                            "time": updated_appointment.appointment.time.strftime("%I:%M %p"),
-                            "patient_id": str(user.id),
-                            "appointment_id": updated_appointment.appointment.id,
-                            "nurse_id": str(assigned_provider.id) if assigned_provider else None,
-                            "status": str(updated_appointment.appointment.status).lower(),
-                            "machine": f"machine #{assigned_machine}",
-                            "provider_name": str(assigned_provider.first_name).lower(),
-                            "provider_image": get_provider_profile
-                        }
-                    )   
+                #an approval queues the upcoming appointment event in the same transaction
+                serializer.save()
 
                 return ResponseMessageUtils(message="Successfully added Appointment details", status_code=status.HTTP_201_CREATED)
             return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
 
+        except ValidationError as e:
+            #restoring a cancelled appointment into a slot that filled up
+            return ResponseMessageUtils(message=extract_first_error_message(e.detail), status_code=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"WHAT WENT WRONG? {e}")
             return ResponseMessageUtils(
@@ -195,15 +136,16 @@ class GetAppointmentInProviderView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):  
         try:
             
-            user = User.objects.filter(
-                id=request.user.id,
-                role__in=['nurse', 'head nurse']
-            ).first()
-
-            assigned_appointments_to_provider = Appointment.objects.select_related('user').filter(
-                Q(assigned_patient_appointment__assigned_provider=user) |
-                Q(assigned_patient_appointment__assigned_provider__isnull=True),
-                status__in=['pending', 'approved', 'check-in', 'in-progress', 'no show', 'rescheduled']
+            identity = get_request_identity(request)
+            user = identity.user if identity.role in ['nurse', 'head nurse'] else None
+
+            assigned_appointments_to_provider = self.get_serializer_class().setup_eager_loading(
+                Appointment.objects.annotate(current_provider=get_current_provider()).filter(
+                    #only the latest assignment counts, the nurse an appointment was moved away from no longer sees it
+                    Q(current_provider=user) |
+                    Q(current_provider__isnull=True),
+                    status__in=['pending', 'approved', 'check-in', 'in-progress', 'no show', 'rescheduled']
+                ).order_by('id')
             )
 
             #create an instance of the paginator
@@ -287,7 +229,9 @@ class GetAllAppointsmentsInAdminView(generics.ListAPIView):
             #     appointment = Appointment.objects.all()
             # else:
                 #filter appointments based on the status path parameter value
-            appointment = Appointment.objects.filter(status='pending')
+            appointment = self.get_serializer_class().setup_eager_loading(
+                Appointment.objects.filter(status='pending').order_by('id')
+            )
 
             paginator = self.pagination_class()
             paginated_data = paginator.paginate_queryset(appointment, request)
@@ -354,7 +298,7 @@ class GetPatientUpcomingAppointmentView(generics.RetrieveAPIView):
     def get(self, request, *args, **kwargs):
         
         #user id of the current authenticated user
-        user_id = get_token_user_id(request)
+        user_id = get_request_identity(request).user_id
         
         try:
             now = timezone.now()
@@ -387,7 +331,7 @@ class GetPatientUpcomingAppointmentsInHomeView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         
         #get the user id of the current authenticated user
-        user_id = get_token_user_id(request)
+        user_id = get_request_identity(request).user_id
         
         try:
             
@@ -418,7 +362,13 @@ class CancelPatientUpcomingAppointmentInAppointmentView(generics.UpdateAPIView):
         
         try:
             instance = self.get_queryset()
-            instance.delete()
+
+            with transaction.atomic():
+                #give the slot back to other patients
+                change_slot(get_slot_key(instance.date, instance.time, instance.status), None)
+                record_appointment_deleted(instance)
+                instance.delete()
+
             return ResponseMessageUtils(message="Successfully Deleted", status_code=status.HTTP_200_OK)
         except Appointment.DoesNotExist:
             return ResponseMessageUtils(message="Appointment not found", status_code=status.HTTP_400_BAD_REQUEST)    
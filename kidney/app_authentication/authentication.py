@@ -1,18 +1,38 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
-from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .token_blacklist import is_blacklisted
 
 class CustomJWTAuthentication(JWTAuthentication):
     def get_validated_token(self, raw_token):
         validated_token = super().get_validated_token(raw_token)
 
-        # Check if token is blacklisted
+        # Check if token is blacklisted, revoked tokens are kept in the cache until they expire
         jti = validated_token.get('jti')
-        if jti is not None:
-            try:
-                if BlacklistedToken.objects.filter(token__jti=jti).exists():
-                    raise InvalidToken('Token is blacklisted')
-            except BlacklistedToken.DoesNotExist:
-                pass
+        if jti is not None and is_blacklisted(jti, validated_token.get('exp')):
+            raise InvalidToken('Token is blacklisted')
 
         return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        # Fetch the user together with the profile, views read both from the request identity
+        try:
+            user = self.user_model.objects.select_related('user_profile').get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from app_authentication.token_blacklist import rebuild_blacklist
+
+
+class Command(BaseCommand):
+    help = "Reloads every unexpired blacklisted token from the BlacklistedToken table into the cache."
+
+    def handle(self, *args, **options):
+
+        total = rebuild_blacklist()
+
+        if total is None:
+            self.stdout.write(self.style.WARNING("The blacklist is already being rebuilt."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {total} blacklisted tokens into the cache."))
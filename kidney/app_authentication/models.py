@@ -44,6 +44,9 @@ class UserInformation(TimestampModel):
     def __str__(self):
         return f"Information of {self.user.username}"
     
+OTP_VALIDITY_SECONDS = 180  #3 minutes, also the timer shown to the user and the email expiry
+
+
 class OTP(TimestampModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='user_otp')
     otp_code = models.CharField(max_length=6)
@@ -51,7 +54,7 @@ class OTP(TimestampModel):
     otp_token = models.UUIDField(default=uuid.uuid4, unique=True)
 
     def is_otp_expired(self):
-        return timezone.now() > self.created_at + timedelta(minutes=3)
+        return timezone.now() > self.created_at + timedelta(seconds=OTP_VALIDITY_SECONDS)
     
 class Caregiver(TimestampModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='caregiver')
@@ -1,22 +1,23 @@
 from datetime import datetime
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
-from app_authentication.models import User, OTP
+from app_authentication.models import User, OTP, OTP_VALIDITY_SECONDS
 from .models import Profile, UserInformation, User, Caregiver
 from rest_framework import serializers
 from django.contrib.auth import authenticate, login
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError, AccessToken
+from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 from kidney.utils import generate_otp, send_otp_to_email, send_password_to_email, validate_email, is_field_empty, generate_password
 import uuid
 from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
 from django.core.cache import cache
 from django.contrib.auth.hashers import make_password
 from kidney.constants import Role
+from .token_blacklist import add_to_blacklist
+from app_chat.participants import notify_profile_changed
+from kidney.identity import get_request_identity
 from rest_framework.exceptions import PermissionDenied
 
-OTP_VALIDITY_SECONDS = 600  # 3 minutes otp validity
 MAX_ATTEMPT = 5 #max attempt to send code
 
 class RefreshTokenSerializer(TokenRefreshSerializer):
@@ -112,7 +113,8 @@ class SendOTPSerializer(serializers.Serializer):
                 subject='Your OTP Code',
                 message=f'Your OTP is {otp}',
                 recipient_list=[username],
-                otp=otp_obj.otp_code
+                otp=otp_obj.otp_code,
+                expires_in=OTP_VALIDITY_SECONDS
             )
 
             #cache user data and timer
@@ -130,7 +132,7 @@ class SendOTPSerializer(serializers.Serializer):
 
             return {
                 "otp_token": str(otp_obj.otp_token),
-                "timer": int(timedelta(minutes=3).total_seconds())
+                "timer": OTP_VALIDITY_SECONDS
             }
         
         except Exception as e:
@@ -265,7 +267,8 @@ class ResendOTPSerializer(serializers.Serializer):
             subject='Your OTP Code',
             message=f'Your OTP is {otp}',
             recipient_list=[str(username).lower()],
-            otp=otp
+            otp=otp,
+            expires_in=OTP_VALIDITY_SECONDS
         )
 
         #return the updated instance
@@ -453,6 +456,7 @@ class RegisterSerializer(serializers.Serializer):
         user.last_name = validated_data["last_name"]
         user.status = 'online'
         user.save()
+        notify_profile_changed(user.id)
     
         # Create or update User information
         UserInformation.objects.create(
@@ -535,6 +539,7 @@ class LoginObtainPairSerializer(TokenObtainPairSerializer):
 
         user.status = 'online'
         user.save()
+        notify_profile_changed(user.id)
 
         default_data = {
             "message": "Successfully Logged in",
@@ -640,6 +645,7 @@ class WebLoginObtainPairSerializer(TokenObtainPairSerializer):
 
         user.status = 'online'
         user.save()
+        notify_profile_changed(user.id)
 
         default_data = {
             "message": "Successfully Logged in",
@@ -738,16 +744,11 @@ class LogoutSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         self.refresh_token = attrs['refresh']
-        #get the request from the context
-        request = self.context.get('request')
-        #get the authorization header
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header or not auth_header.startswith('Bearer '):
-            raise serializers.ValidationError({"message": 'No valid Authorization header found.'})   
-        
-        #get the token part
-        self.access_token_str = auth_header.split(' ')[1]
+        #the access token was already decoded and its user fetched by the authentication
+        self.identity = get_request_identity(self.context.get('request'))
+
+        if self.identity.claims is None:
+            raise serializers.ValidationError({"message": 'No valid Authorization header found.'})
 
         return attrs
 
@@ -757,23 +758,14 @@ class LogoutSerializer(serializers.Serializer):
             # Blacklist refresh token
             refresh_token = RefreshToken(self.refresh_token)
             refresh_token.blacklist()
+            add_to_blacklist(refresh_token['jti'], refresh_token['exp'])
         except TokenError:
             raise serializers.ValidationError({"message": "Invalid refresh token."})
 
         try:
             
-            #parse the token
-            access_token = AccessToken(self.access_token_str)
-
-            #retrive the user with the user_id from the token payload
-            user = User.objects.get(id=access_token["user_id"])
-
-            if not user:
-                raise serializers.ValidationError({"message": "No user found"})
-            
-            #update the status of the user once logged out
-            user.status = 'offline'
-            user.save()
+            access_token = self.identity.claims
+            user = self.identity.user
 
             #format datetime fields are correctly formatted as strings
             created_at_str = datetime.fromtimestamp(access_token['iat']).isoformat()
@@ -783,7 +775,7 @@ class LogoutSerializer(serializers.Serializer):
             outstanding_token, _ = OutstandingToken.objects.get_or_create(
                 jti=access_token['jti'],
                 defaults={
-                    'user_id': self.context['request'].user.id,
+                    'user_id': user.id,
                     'token': str(access_token),
                     'created_at': created_at_str,
                     'expires_at': expires_at_str,
@@ -792,8 +784,12 @@ class LogoutSerializer(serializers.Serializer):
 
             # Blacklist the token
             BlacklistedToken.objects.get_or_create(token=outstanding_token)
-        except TokenError as e:
-            raise serializers.ValidationError({"message": "Invalid access token."})
+            add_to_blacklist(access_token['jti'], access_token['exp'])
+
+            #update the status of the user once logged out, the token is already revoked
+            user.status = 'offline'
+            user.save()
+            notify_profile_changed(user.id)
         except Exception as e:
             raise serializers.ValidationError({"message": "Error occured during logout"})
 
@@ -1113,15 +1109,18 @@ class GetProfileProfileInPatientSerializer(serializers.ModelSerializer):
 
         data = super().to_representation(instance)
 
+        #the user is already loaded with the profile
+        user = instance.user
+
         try:
-            user_information = UserInformation.objects.select_related('user').get(user=data["user"])
+            user_information = UserInformation.objects.get(user=user)
         except Exception as e:
             pass
         
         #user informations
-        data["first_name"] = user_information.user.first_name
-        data["middle_name"] = user_information.user.middlename if user_information.user.middlename else None
-        data["last_name"] = user_information.user.last_name
+        data["first_name"] = user.first_name
+        data["middle_name"] = user.middlename if user.middlename else None
+        data["last_name"] = user.last_name
         data["birth_date"] = user_information.birthdate
         data["gender"] = user_information.gender
         data["contact_number"] = user_information.contact
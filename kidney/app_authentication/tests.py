@@ -1,3 +1,151 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+from django.test import TestCase, TransactionTestCase
+from django.db import connection
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from app_authentication.models import User, Profile, UserInformation
+from app_notification.models import RealtimeEvent
+from kidney.identity import identity_cache
+from app_authentication.token_blacklist import BLACKLIST_REBUILD_LOCK_KEY, blacklist_cache_key, rebuild_blacklist
 
-# Create your tests here.
+
+class TokenBlacklistCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        Profile.objects.create(user=self.user)
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+
+    def logout(self):
+        response = self.client.post('/logout/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_authentication_does_not_query_the_blacklist_table(self):
+        call_command('rebuild_token_blacklist', stdout=StringIO())
+
+        #the first request checks the token against the table once
+        self.client.get('/providers/chat/')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/providers/chat/')
+
+        self.assertFalse([query for query in queries if 'token_blacklist' in query["sql"]])
+
+    def test_logout_uses_the_authenticated_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.logout()
+
+        #one by the authentication and one by simplejwt when it blacklists the refresh token
+        user_queries = [query for query in queries if query["sql"].startswith('SELECT') and 'FROM "app_authentication_user"' in query["sql"]]
+        self.assertEqual(len(user_queries), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.status, 'offline')
+
+    def test_logout_drops_the_cached_websocket_identity(self):
+        identity_cache[str(self.user.id)] = (float('inf'), None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.logout()
+
+        self.assertNotIn(str(self.user.id), identity_cache)
+
+    def test_logged_out_token_is_rejected(self):
+        self.logout()
+
+        response = self.client.get('/providers/chat/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_logged_out_token_is_rejected_after_the_cache_is_flushed(self):
+        self.logout()
+        cache.clear()
+
+        response = self.client.get('/providers/chat/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_logged_out_token_is_rejected_after_its_entry_is_evicted(self):
+        self.logout()
+        call_command('rebuild_token_blacklist', stdout=StringIO())
+        cache.delete(blacklist_cache_key(self.access['jti']))
+
+        response = self.client.get('/providers/chat/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_rebuild_is_skipped_while_another_one_runs(self):
+        self.logout()
+        cache.add(BLACKLIST_REBUILD_LOCK_KEY, True)
+
+        self.assertIsNone(rebuild_blacklist())
+        cache.delete(BLACKLIST_REBUILD_LOCK_KEY)
+        self.assertEqual(rebuild_blacklist(), 2)
+
+
+class UnreachableChannelLayer:
+
+    async def group_send(self, group, message):
+        raise ConnectionError("Redis is unreachable")
+
+
+class LogoutWithoutChannelLayerTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        Profile.objects.create(user=self.user)
+
+    @mock.patch('channels.layers.get_channel_layer', return_value=UnreachableChannelLayer())
+    def test_logout_revokes_the_token_when_the_channel_layer_is_down(self, get_channel_layer):
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        response = self.client.post('/logout/', {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200)
+
+        #the profile change waits in the outbox
+        self.assertTrue(RealtimeEvent.objects.filter(group=f"profile_{self.user.id}").exists())
+        self.assertEqual(self.client.get('/providers/chat/').status_code, 401)
+
+
+class RequestIdentityTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        Profile.objects.create(user=self.user)
+        UserInformation.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        call_command('rebuild_token_blacklist', stdout=StringIO())
+
+    def test_user_and_profile_are_fetched_once_per_request(self):
+        for url in ['/user/role/', '/profile/']:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+
+            self.assertEqual(response.status_code, 200)
+
+            user_queries = [query for query in queries if 'FROM "app_authentication_user"' in query["sql"]]
+            profile_queries = [query for query in queries if 'FROM "app_authentication_profile"' in query["sql"]]
+            self.assertEqual(len(user_queries), 1)
+            self.assertEqual(len(profile_queries), 0)
+
+    def test_profile_edit_uses_the_request_profile(self):
+        response = self.client.patch('/edit/profile/', {
+            'first_name': 'Juan',
+            'last_name': 'Dela Cruz',
+            'birth_date': '01/02/1990',
+            'gender': 'male',
+            'contact_number': '09123456789'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Juan')
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+BLACKLIST_KEY_PREFIX = 'token_blacklist'
+#held while the blacklist is loaded into the cache, so two rebuilds don't scan the table at once
+BLACKLIST_REBUILD_LOCK_KEY = f'{BLACKLIST_KEY_PREFIX}:rebuilding'
+BLACKLIST_REBUILD_LOCK_SECONDS = 300
+#how long a token id missing from the cache and checked against the table is remembered as valid
+UNKNOWN_TOKEN_TIMEOUT = 300
+
+
+def blacklist_cache_key(jti):
+    return f'{BLACKLIST_KEY_PREFIX}:{jti}'
+
+
+def get_remaining_seconds(expires_at):
+    """Returns the seconds left before a unix timestamp or datetime expiry."""
+    if isinstance(expires_at, (int, float)):
+        return expires_at - timezone.now().timestamp()
+
+    return (expires_at - timezone.now()).total_seconds()
+
+
+def add_to_blacklist(jti, expires_at):
+    """
+        Stores a revoked token id in the cache until the token itself expires.
+
+        Args:
+            jti (str): The token id.
+            expires_at (int | datetime): The token expiry as a unix timestamp or datetime.
+    """
+    remaining_seconds = get_remaining_seconds(expires_at)
+
+    #an expired token is already rejected by the token validation
+    if remaining_seconds > 0:
+        cache.set(blacklist_cache_key(jti), True, timeout=int(remaining_seconds) + 1)
+
+
+def rebuild_blacklist():
+    """
+        Loads every unexpired blacklisted token into the cache and returns how many were loaded.
+
+        The tokens are written with one set_many per minute of remaining lifetime, each token is
+        kept at least until it expires. Returns None when another rebuild is already running.
+    """
+    if not cache.add(BLACKLIST_REBUILD_LOCK_KEY, True, timeout=BLACKLIST_REBUILD_LOCK_SECONDS):
+        return None
+
+    try:
+        blacklisted_tokens = BlacklistedToken.objects.filter(
+            token__expires_at__gt=timezone.now()
+        ).values_list('token__jti', 'token__expires_at')
+
+        #the tokens grouped by their remaining lifetime rounded up to the minute
+        buckets = defaultdict(dict)
+        total = 0
+
+        for jti, expires_at in blacklisted_tokens.iterator():
+            remaining_minutes = int(get_remaining_seconds(expires_at) // 60) + 1
+            buckets[remaining_minutes][blacklist_cache_key(jti)] = True
+            total += 1
+
+        for remaining_minutes, entries in buckets.items():
+            cache.set_many(entries, timeout=remaining_minutes * 60)
+
+        return total
+    finally:
+        cache.delete(BLACKLIST_REBUILD_LOCK_KEY)
+
+
+def is_blacklisted(jti, expires_at=None):
+    """
+        Checks whether a token id was revoked.
+
+        A token id missing from the cache (flushed or evicted) is checked against the table and the
+        answer is cached, a revoked token is never accepted because its cache entry was dropped.
+
+        Args:
+            jti (str): The token id.
+            expires_at (int | datetime, optional): The token expiry, a valid token isn't remembered past it.
+    """
+    key = blacklist_cache_key(jti)
+    cached = cache.get(key)
+
+    if cached is not None:
+        return cached
+
+    revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    timeout = UNKNOWN_TOKEN_TIMEOUT
+    if expires_at is not None:
+        timeout = max(1, min(timeout, int(get_remaining_seconds(expires_at)) + 1))
+
+    #add doesn't overwrite a logout that cached the token as revoked in the meantime
+    cache.add(key, revoked, timeout=timeout)
+
+    return revoked
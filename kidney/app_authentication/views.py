@@ -26,7 +26,9 @@ from rest_framework import serializers
 from django.core.cache import cache
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework import generics
-from kidney.utils import ResponseMessageUtils, get_tokens_for_user, extract_first_error_message, get_token_user_id
+from kidney.utils import ResponseMessageUtils, get_tokens_for_user, extract_first_error_message
+from kidney.identity import get_request_identity
+from app_chat.participants import notify_profile_changed
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
@@ -399,9 +401,7 @@ class GetUserRoleView(generics.ListAPIView):
 
         try:
             
-            user_id = get_token_user_id(request)
-
-            user = User.objects.get(id=user_id)
+            user = get_request_identity(request).user
 
             serializer = self.get_serializer(user, data=request.data)
 
@@ -458,19 +458,13 @@ class EditProfileInPatientView(generics.UpdateAPIView):
     def patch(self, request, *args, **kwargs):
 
         try:
-            #get the current authenticated user id
-            user_id = get_token_user_id(request)
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                return ResponseMessageUtils(
-                    message="User not found.",
-                    status_code=status.HTTP_404_NOT_FOUND
-                )
+            #get the current authenticated user and the profile loaded with it
+            identity = get_request_identity(request)
+            user = identity.user
 
             # Get or create related objects
             user_information, _ = UserInformation.objects.get_or_create(user=user)
-            user_profile, _ = Profile.objects.get_or_create(user=user)
+            user_profile = identity.profile or Profile.objects.create(user=user)
           
 
             # Update user fields if present in data
@@ -496,12 +490,11 @@ class EditProfileInPatientView(generics.UpdateAPIView):
             user_information.contact = request.data.get('contact_number', user_information.contact)
             user_information.save()
 
-            user_profile = Profile.objects.get(user_id=user_id)
-
             serializer = self.get_serializer(instance=user_profile, data=request.data, partial=True)
 
             if serializer.is_valid():
                 serializer.save()
+                notify_profile_changed(user.id)
 
                 #refresh from the database to get updated values
                 user.refresh_from_db()
@@ -535,10 +528,11 @@ class GetUserProfileInformationView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
 
         try:
-            #get the user id
-            user_id = get_token_user_id(request)
+            #get the profile loaded with the authenticated user
+            user_profile = get_request_identity(request).profile
 
-            user_profile = Profile.objects.get(user_id=user_id)
+            if user_profile is None:
+                raise Profile.DoesNotExist
             
             serializer = self.get_serializer(user_profile)
             return ResponseMessageUtils(
@@ -633,8 +627,7 @@ class CaregiverListView(generics.RetrieveDestroyAPIView):
     lookup_field = 'pk'
 
     def get_queryset(self):
-        user_id = get_token_user_id(self.request)
-        return Caregiver.objects.filter(added_by=user_id)
+        return Caregiver.objects.filter(added_by=get_request_identity(self.request).user)
     
     def get_object(self):
         return Caregiver.objects.filter(id=self.kwargs.get('pk')).first()
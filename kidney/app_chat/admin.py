@@ -1,6 +1,10 @@
 from django.contrib import admin
-from .models import Message
+from .models import Message, Conversation
 # Register your models here.
 @admin.register(Message)
 class AdminMessage(admin.ModelAdmin):
-    pass
\ No newline at end of file
+    pass
+
+@admin.register(Conversation)
+class AdminConversation(admin.ModelAdmin):
+    readonly_fields = ('created_at', 'updated_at')
\ No newline at end of file
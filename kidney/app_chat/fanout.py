@@ -0,0 +1,32 @@
+import asyncio
+
+
+def inbox_group_name(user_id):
+    #every chat socket of the user is in this group
+    return f"user_{user_id}"
+
+
+def chat_room_name(chat_type, first_user_id, second_user_id):
+    first_user_id, second_user_id = str(first_user_id), str(second_user_id)
+    return f"chat_{chat_type}_{min(first_user_id, second_user_id)}_{max(first_user_id, second_user_id)}"
+
+
+async def fan_out(channel_layer, event, user_ids):
+    """
+        Sends one chat event to every chat socket of the given users.
+
+        The target groups are computed once and the sends run concurrently. Every socket
+        of a user is in the user's inbox group only, so it receives the event once and picks
+        the parts meant for it (see ChatConsumer.chat_event). Presence isn't read, an expired
+        presence doesn't mean the socket is gone and a group without sockets costs one send.
+
+        Args:
+            channel_layer (BaseChannelLayer): The channel layer.
+            event (dict): The event, its type is the consumer handler.
+            user_ids (iterable): The users to deliver to.
+    """
+    user_ids = {str(user_id) for user_id in user_ids if user_id}
+
+    await asyncio.gather(*(
+        channel_layer.group_send(inbox_group_name(user_id), event) for user_id in user_ids
+    ))
@@ -0,0 +1,55 @@
+import base64
+import uuid
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.core.files.base import ContentFile
+from .models import Message
+
+MAX_IMAGE_SIZE_MB = 20
+
+
+def split_image_data(image_data):
+    """
+        Splits a base64 data url into the file extension and the encoded payload.
+
+        Raises:
+            ValueError: If the data url is malformed.
+    """
+    header, encoded = image_data.split(';base64,', 1)
+    extension = header.split('/')[-1]
+
+    if not extension or not encoded:
+        raise ValueError("Malformed image data")
+
+    return extension, encoded
+
+
+def store_image(message, extension, encoded):
+    """Decodes the payload and uploads it to the storage, this blocks so it must run off the event loop."""
+    content = ContentFile(base64.b64decode(encoded), name=f"{uuid.uuid4()}.{extension}")
+
+    #upload only, the message row is updated separately
+    message.image.save(content.name, content, save=False)
+
+    return message.image.name
+
+
+@database_sync_to_async
+def attach_image(message):
+    Message.objects.filter(id=message.id).update(image=message.image.name)
+
+
+async def upload_message_image(message, image_data):
+    """
+        Decodes and uploads the image of a saved message in a thread pool, then attaches it to the message.
+
+        Returns:
+            str: The url of the uploaded image.
+    """
+    extension, encoded = split_image_data(image_data)
+
+    #thread_sensitive=False runs in the thread pool instead of the single sync thread used for the database
+    await sync_to_async(store_image, thread_sensitive=False)(message, extension, encoded)
+    await attach_image(message)
+
+    return message.image.url
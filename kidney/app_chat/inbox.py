@@ -0,0 +1,122 @@
+from django.db import connection, transaction
+from django.db.models import F, Q, Window, Exists, OuterRef, Subquery
+from django.db.models.functions import Least, Greatest, RowNumber
+from .models import Message, Conversation
+from kidney.presence import get_presence
+
+
+def conversation_pair(first_user_id, second_user_id):
+    """Returns the participant ids in the same order used by the chat room group name."""
+    first_user_id, second_user_id = str(first_user_id), str(second_user_id)
+    return min(first_user_id, second_user_id), max(first_user_id, second_user_id)
+
+
+def get_conversations(user, roles, mutual=False):
+    """
+        Returns the conversations the user has with the given roles, most recent first.
+
+        Args:
+            user (User): The user whose inbox is being loaded.
+            roles (list): Roles of the counterparts to include (e.g, ['patient']).
+            mutual (bool): Only include conversations where both sides have sent a message.
+
+        Returns:
+            QuerySet: Conversations with the last message, its sender, receiver and
+            their profiles already joined.
+    """
+    conversations = Conversation.objects.filter(
+        Q(user_one=user, user_two__role__in=roles) |
+        Q(user_two=user, user_one__role__in=roles),
+        last_message__isnull=False
+    )
+
+    if mutual:
+        #both participants must have sent at least one message to the other
+        conversations = conversations.filter(
+            Exists(Message.objects.filter(sender=OuterRef('user_one'), receiver=OuterRef('user_two'))),
+            Exists(Message.objects.filter(sender=OuterRef('user_two'), receiver=OuterRef('user_one'))),
+        )
+
+    return conversations.select_related(
+        'last_message__sender__user_profile',
+        'last_message__receiver__user_profile',
+    ).order_by('-last_activity', '-id')
+
+
+def get_latest_pair_messages():
+    """
+        Returns the latest message of every (min, max) user pair in a single query, e.g. to rebuild the conversations.
+
+        Returns:
+            QuerySet: Messages annotated with user_one and user_two.
+    """
+    messages = Message.objects.annotate(
+        user_one=Least('sender', 'receiver'),
+        user_two=Greatest('sender', 'receiver'),
+    )
+
+    if connection.features.supports_over_clause:
+        #rank the messages of each pair and keep only the newest one
+        return messages.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('user_one'), F('user_two')],
+                order_by=[F('created_at').desc(), F('id').desc()],
+            )
+        ).filter(row_number=1)
+
+    #fallback for databases without window functions (e.g, old SQLite builds)
+    newest_of_pair = messages.filter(
+        user_one=OuterRef('user_one'),
+        user_two=OuterRef('user_two')
+    ).order_by('-created_at', '-id').values('id')[:1]
+
+    return messages.filter(id=Subquery(newest_of_pair))
+
+
+def get_latest_messages(user, roles, mutual=False):
+    """Returns the latest message of every conversation the user has with the given roles, in a single query."""
+    return [conversation.last_message for conversation in get_conversations(user, roles, mutual=mutual)]
+
+
+def get_messages_presence(messages):
+    """Returns the presence of every sender and receiver of the messages with a single cache round-trip."""
+    return get_presence(
+        {message.sender_id for message in messages} | {message.receiver_id for message in messages}
+    )
+
+
+def record_message(message):
+    """Moves the conversation pointer to the saved message and increments the receiver's unread count."""
+    user_one_id, user_two_id = conversation_pair(message.sender_id, message.receiver_id)
+
+    unread_field = 'user_one_unread' if str(message.receiver_id) == user_one_id else 'user_two_unread'
+
+    pair = {'user_one_id': user_one_id, 'user_two_id': user_two_id}
+
+    #update in the database so concurrent messages don't lose an unread increment
+    changes = {
+        'last_message': message,
+        'last_activity': message.created_at,
+        unread_field: F(unread_field) + 1,
+    }
+
+    with transaction.atomic():
+        #the conversation usually exists already, so try a single update first
+        if Conversation.objects.filter(**pair).update(**changes):
+            return
+
+        conversation, _ = Conversation.objects.get_or_create(**pair)
+        Conversation.objects.filter(id=conversation.id).update(**changes)
+
+
+def mark_conversation_as_read(reader_id, other_user_id):
+    """Resets the unread count of the reader in the conversation with the other user."""
+    user_one_id, user_two_id = conversation_pair(reader_id, other_user_id)
+
+    unread_field = 'user_one_unread' if str(reader_id) == user_one_id else 'user_two_unread'
+
+    Conversation.objects.filter(
+        user_one_id=user_one_id,
+        user_two_id=user_two_id
+    ).update(**{unread_field: 0})
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from app_chat.inbox import get_latest_pair_messages
+from app_chat.models import Message, Conversation
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the Conversation table (last message and unread counts) from existing messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+
+        batch_size = options['batch_size']
+
+        #latest message of every (min, max) user pair
+        latest_messages = get_latest_pair_messages().values('id', 'sender', 'receiver', 'created_at')
+
+        #unread messages grouped by who has to read them
+        unread_counts = {
+            (str(item['sender']), str(item['receiver'])): item['count']
+            for item in Message.objects.filter(read=False).values('sender', 'receiver').annotate(count=Count('id'))
+        }
+
+        conversations = []
+
+        for message in latest_messages.iterator():
+            sender_id, receiver_id = str(message['sender']), str(message['receiver'])
+            user_one_id, user_two_id = min(sender_id, receiver_id), max(sender_id, receiver_id)
+
+            conversations.append(Conversation(
+                user_one_id=user_one_id,
+                user_two_id=user_two_id,
+                last_message_id=message['id'],
+                last_activity=message['created_at'],
+                #unread messages of user one are the ones user two sent to them
+                user_one_unread=unread_counts.get((user_two_id, user_one_id), 0),
+                user_two_unread=unread_counts.get((user_one_id, user_two_id), 0),
+            ))
+
+        with transaction.atomic():
+            Conversation.objects.bulk_create(
+                conversations,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['user_one', 'user_two'],
+                update_fields=['last_message', 'last_activity', 'user_one_unread', 'user_two_unread'],
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {len(conversations)} conversations"))
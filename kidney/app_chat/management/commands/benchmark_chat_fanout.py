@@ -0,0 +1,171 @@
+import json
+import uuid
+from collections import Counter
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.urls import re_path
+from rest_framework_simplejwt.tokens import AccessToken
+from app_authentication.models import User, Profile
+from app_chat.consumers import ChatConsumer
+from kidney import presence
+from kidney.middleware.token_auth_middleware import JWTAuthMiddleware
+from kidney.presence import aget_presence
+
+
+class LegacyChatConsumer(ChatConsumer):
+    """The previous fan-out: the room group plus sequential sends to the inbox groups."""
+
+    async def connect(self):
+        await super().connect()
+        if self.room:
+            await self.channel_layer.group_add(self.room.room_group_name, self.channel_name)
+
+    async def disconnect(self, close_code):
+        if self.room:
+            await self.channel_layer.group_discard(self.room.room_group_name, self.channel_name)
+        await super().disconnect(close_code)
+
+    async def send_chat_message(self, room, message_content=None, image_data=None):
+        message = await room.save_message(message_content=message_content)
+        sender = message.sender
+        receiver = message.receiver
+
+        await self.channel_layer.group_send(
+            room.room_group_name,
+            {"type": "chat_message", **room.get_chat_payload(message)}
+        )
+
+        if sender.role == "patient" and receiver.role in ['nurse', 'head nurse']:
+            status = (await aget_presence([receiver.id]))[str(receiver.id)]
+            await self.channel_layer.group_send(
+                f"user_{sender.id}",
+                {"type": "inbox_update", **room.get_inbox_payload(message, receiver, status)}
+            )
+            await self.channel_layer.group_send(
+                f"user_{receiver.id}",
+                {"type": "notification", **room.get_notification_payload(message, sender)}
+            )
+
+    async def chat_message(self, event):
+        await self.send_envelope("chat.message", {key: value for key, value in event.items() if key != "type"})
+
+    async def inbox_update(self, event):
+        await self.send_envelope("chat.inbox", {key: value for key, value in event.items() if key != "type"})
+
+    async def notification(self, event):
+        await self.send_envelope("chat.notification", {key: value for key, value in event.items() if key != "type"})
+
+
+class CountingChannelLayer(InMemoryChannelLayer):
+    """Counts the group sends, a Redis round-trip each with channels_redis, and the frames delivered to sockets."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.operations = Counter()
+
+    async def send(self, channel, message):
+        #the in-memory group_send delivers through send
+        self.operations['deliveries'] += 1
+        return await super().send(channel, message)
+
+    async def group_send(self, group, message):
+        self.operations['group_send'] += 1
+        return await super().group_send(group, message)
+
+
+class CountingCache:
+    """Counts the presence reads, a Redis round-trip with django-redis."""
+
+    def __init__(self, wrapped, operations):
+        self.wrapped = wrapped
+        self.operations = operations
+
+    def get_many(self, keys):
+        self.operations['cache_get_many'] += 1
+        return self.wrapped.get_many(keys)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class Command(BaseCommand):
+    help = "Counts the channel layer and cache operations per chat message with the legacy and the deduplicated fan-out."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100)
+
+    def handle(self, *args, **options):
+
+        #temporary participants, removed once the benchmark is done
+        patient = User.objects.create_user(username=f"benchmark-{uuid.uuid4()}@kidneycare.com", password=None, role='patient')
+        nurse = User.objects.create_user(username=f"benchmark-{uuid.uuid4()}@kidneycare.com", password=None, role='nurse')
+        Profile.objects.bulk_create([Profile(user=patient), Profile(user=nurse)])
+
+        pattern = r"ws/chat/(?P<chat_type>nurse|head_nurse|admin|patient)/(?P<room_name>[a-f0-9\-]{36})/$"
+
+        try:
+            for receiver_online in (True, False):
+                for label, consumer in (('legacy', LegacyChatConsumer), ('fan-out', ChatConsumer)):
+                    application = JWTAuthMiddleware(URLRouter([re_path(pattern, consumer.as_asgi())]))
+
+                    operations = async_to_sync(self.run_messages)(
+                        application, patient, nurse, options['messages'], receiver_online
+                    )
+
+                    per_message = {name: operations[name] / options['messages'] for name in ('cache_get_many', 'group_send', 'deliveries')}
+
+                    self.stdout.write(
+                        f"{label:>8} (receiver {'online' if receiver_online else 'offline'}): "
+                        f"{per_message['cache_get_many'] + per_message['group_send']:.2f} redis operations per message "
+                        f"(presence reads {per_message['cache_get_many']:.2f}, group sends {per_message['group_send']:.2f}), "
+                        f"{per_message['deliveries']:.2f} socket deliveries"
+                    )
+        finally:
+            User.objects.filter(id__in=[patient.id, nurse.id]).delete()
+
+    async def run_messages(self, application, patient, nurse, total, receiver_online):
+
+        layer = CountingChannelLayer()
+        previous_layer = channel_layers.set('default', layer)
+
+        try:
+            with mock.patch.object(presence, 'cache', CountingCache(cache, layer.operations)):
+                communicators = [self.communicator(application, patient, nurse)]
+                if receiver_online:
+                    communicators.append(self.communicator(application, nurse, patient))
+
+                for communicator in communicators:
+                    await communicator.connect()
+
+                #only the messages are measured
+                layer.operations.clear()
+
+                for index in range(total):
+                    await communicators[0].send_to(text_data=json.dumps({"message": f"benchmark {index}"}))
+
+                #a socket handles its messages in order, the pong comes once every fan-out is done
+                await communicators[0].send_to(text_data=json.dumps({"type": "ping"}))
+                while json.loads(await communicators[0].receive_from(timeout=30)).get("type") != 'pong':
+                    pass
+
+                operations = Counter(layer.operations)
+
+                for communicator in communicators:
+                    await communicator.disconnect()
+
+                return operations
+        finally:
+            channel_layers.set('default', previous_layer)
+
+    def communicator(self, application, user, other_user):
+        #both sides open the same nurse chat room
+        return WebsocketCommunicator(
+            application,
+            f"/ws/chat/nurse/{other_user.id}/",
+            headers=[(b'authorization', f"Bearer {AccessToken.for_user(user)}".encode())]
+        )
@@ -0,0 +1,83 @@
+import asyncio
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+from app_authentication.models import User
+from app_chat.routing import websocket_urlpatterns
+from kidney.identity import identity_cache
+from kidney.middleware.token_auth_middleware import JWTAuthMiddleware
+
+
+class LegacyJWTAuthMiddleware(JWTAuthMiddleware):
+    """The previous connect path: token decoding and a full user fetch in the sync thread pool."""
+
+    async def __call__(self, scope, receive, send):
+        user_id = await database_sync_to_async(self.get_user_from_token)(self.get_token_from_scope(scope))
+
+        if not user_id:
+            await self.close_connection(send, code=4003)
+            return
+
+        user = await database_sync_to_async(User.objects.get)(id=user_id)
+
+        return await self.inner(dict(scope, user=user), receive, send)
+
+
+class Command(BaseCommand):
+    help = "Measures chat WebSocket connects per second with the legacy and the async cached authentication."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+
+        #temporary participants, removed once the benchmark is done
+        patient = User.objects.create_user(username=f"benchmark-{uuid.uuid4()}@kidneycare.com", password=None, role='patient')
+        nurse = User.objects.create_user(username=f"benchmark-{uuid.uuid4()}@kidneycare.com", password=None, role='nurse')
+
+        try:
+            path = f"/ws/chat/nurse/{nurse.id}/"
+            headers = [(b'authorization', f"Bearer {AccessToken.for_user(patient)}".encode())]
+
+            applications = [
+                ('legacy', LegacyJWTAuthMiddleware(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)))),
+                ('async cached', JWTAuthMiddleware(URLRouter(websocket_urlpatterns))),
+            ]
+
+            for label, application in applications:
+                identity_cache.clear()
+
+                connected, elapsed = async_to_sync(self.run_connects)(
+                    application, path, headers, options['connections'], options['concurrency']
+                )
+
+                self.stdout.write(
+                    f"{label:>12}: {connected}/{options['connections']} connects in {elapsed:.2f}s "
+                    f"({connected / elapsed:.1f} connects/s)"
+                )
+        finally:
+            User.objects.filter(id__in=[patient.id, nurse.id]).delete()
+
+    async def run_connects(self, application, path, headers, total, concurrency):
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect_once():
+            async with semaphore:
+                communicator = WebsocketCommunicator(application, path, headers=headers)
+                connected, _ = await communicator.connect()
+                if connected:
+                    await communicator.disconnect()
+                return connected
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(connect_once() for _ in range(total)))
+
+        return sum(results), time.perf_counter() - start
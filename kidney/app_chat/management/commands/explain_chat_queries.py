@@ -0,0 +1,25 @@
+import uuid
+from django.db.models import Q
+from app_chat.models import Message, Conversation
+from kidney.query_plans import ExplainQueriesCommand
+
+
+class Command(ExplainQueriesCommand):
+    help = "Runs EXPLAIN on the hot chat queries and reports whether each one uses an index."
+
+    def get_hot_queries(self):
+        user_id = uuid.uuid4()
+        other_user_id = uuid.uuid4()
+
+        return [
+            ("chat history between two users", Message.objects.filter(
+                Q(sender=user_id, receiver=other_user_id) |
+                Q(sender=other_user_id, receiver=user_id)
+            ).order_by('-created_at', '-id')[:11]),
+            ("unread messages of a user", Message.objects.filter(
+                receiver=user_id, read=False
+            ).values('sender')),
+            ("inbox conversations of a user", Conversation.objects.filter(
+                Q(user_one=user_id) | Q(user_two=user_id)
+            ).order_by('-last_activity')),
+        ]
@@ -20,5 +20,35 @@ class Message(TimestampModel):
     status = models.CharField(max_length=20, choices=status_choices, default='Sent')
     date_sent = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            #conversation history between two users, newest first
+            models.Index(fields=['sender', 'receiver', 'created_at'], name='message_pair_created_idx'),
+            #unread messages of a receiver
+            models.Index(fields=['receiver', 'sender'], condition=models.Q(read=False), name='message_unread_idx'),
+        ]
+
     def __str__(self):
         return f"Message from: {self.sender.username} to {self.receiver.username}"
+
+
+class Conversation(TimestampModel):
+
+    #participants are stored in the same (min, max) order used by the chat room group name
+    user_one = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_user_one')
+    user_two = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_user_two')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity = models.DateTimeField(null=True, blank=True, db_index=True)
+    user_one_unread = models.PositiveIntegerField(default=0)
+    user_two_unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_one', 'user_two'], name='unique_conversation_pair')
+        ]
+
+    def unread_count_for(self, user):
+        return self.user_one_unread if str(user.id) == str(self.user_one_id) else self.user_two_unread
+
+    def __str__(self):
+        return f"Conversation between {self.user_one_id} and {self.user_two_id}"
@@ -0,0 +1,38 @@
+from django.db import transaction
+from app_authentication.models import User
+from kidney.identity import forget_identity
+from app_notification.realtime_outbox import enqueue_realtime_event
+
+
+def profile_group_name(user_id):
+    return f"profile_{user_id}"
+
+
+def get_picture_url(user):
+    user_profile = getattr(user, 'user_profile', None)
+    return user_profile.picture.url if user_profile and user_profile.picture else None
+
+
+def get_participants(*user_ids):
+    """Returns the users with the given ids and their profiles in a single query, keyed by the id as a string."""
+    users = User.objects.select_related('user_profile').filter(id__in=user_ids)
+    return {str(user.id): user for user in users}
+
+
+def notify_profile_changed(user_id):
+    """
+        Tells the connected chat consumers to reload the user, call it inside the transaction that changed the user.
+
+        The event goes through the realtime outbox, so a channel layer that is down can't fail the
+        request. The user is dropped from the WebSocket identity cache of this process once the change
+        commits, the consumers drop it from theirs when they receive the event.
+    """
+    enqueue_realtime_event(
+        profile_group_name(user_id),
+        {
+            "type": "profile_changed",
+            "user_id": str(user_id),
+        }
+    )
+
+    transaction.on_commit(lambda: forget_identity(user_id))
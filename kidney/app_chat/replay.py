@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import time
+import weakref
+from datetime import datetime, timedelta, timezone as dt_timezone
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from redis import asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+from redis.exceptions import RedisError
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+REPLAY_STREAM_MAXLEN = 1000  #events kept per user, older ones are trimmed
+REPLAY_STREAM_TTL = 7 * 24 * 60 * 60  #seconds an idle user's stream is kept
+REPLAY_BATCH_SIZE = 100  #events or messages read per round-trip while replaying
+STREAM_RETRY_SECONDS = 30  #how long the streams are skipped after redis failed
+REPLAY_CLOCK_MARGIN = timedelta(seconds=5)  #drift allowed between the redis and the database clocks
+
+#one client per event loop, redis.asyncio connections can't be shared between loops
+stream_clients = weakref.WeakKeyDictionary()
+stream_unavailable_until = 0
+
+
+def event_stream_key(user_id):
+    return f"chat_events:{user_id}"
+
+
+def parse_event_id(event_id):
+    """
+        Parses a stream entry id, '<milliseconds>-<sequence>'.
+
+        Raises:
+            ValueError: If the id is malformed.
+    """
+    milliseconds, _, sequence = str(event_id).partition('-')
+    return int(milliseconds), int(sequence or 0)
+
+
+def event_id_to_datetime(event_id):
+    """Returns when the event was appended, the id starts with the redis time in milliseconds."""
+    milliseconds, _ = parse_event_id(event_id)
+    return datetime.fromtimestamp(milliseconds / 1000, tz=dt_timezone.utc)
+
+
+def get_user_event(event, user_id):
+    """Returns the parts of a fanned out chat event that are meant for the user, the entry of the user's stream."""
+    user_event = {
+        "room": event.get("room"),
+        "participants": event.get("participants", []),
+    }
+
+    for part in ("chat", "image_ready"):
+        if event.get(part):
+            user_event[part] = event[part]
+
+    for part in ("inbox", "notification"):
+        if event.get(part, {}).get(str(user_id)):
+            user_event[part] = event[part][str(user_id)]
+
+    return user_event
+
+
+def get_stream_client():
+    """Returns the redis client of the running loop, or None while the streams are disabled or unavailable."""
+    url = getattr(settings, 'REALTIME_REDIS_URL', None)
+
+    if not url or time.monotonic() < stream_unavailable_until:
+        return None
+
+    loop = asyncio.get_running_loop()
+    client = stream_clients.get(loop)
+
+    if client is None:
+        #fail fast, a message is never held up waiting on the replay stream
+        client = aioredis.from_url(url, decode_responses=True, socket_connect_timeout=2, socket_timeout=2, retry=Retry(NoBackoff(), 1))
+        stream_clients[loop] = client
+
+    return client
+
+
+def mark_stream_unavailable(error):
+    global stream_unavailable_until
+    logger.warning(f"[WS] Chat event streams unavailable for {STREAM_RETRY_SECONDS}s: {error}")
+    stream_unavailable_until = time.monotonic() + STREAM_RETRY_SECONDS
+
+
+async def append_events(events):
+    """
+        Appends one event to the stream of each user in a single round-trip.
+
+        Args:
+            events (dict): The event of each user, keyed by the user id.
+
+        Returns:
+            dict: The stream entry id of each user's event, empty if the streams are unavailable.
+    """
+    client = get_stream_client()
+
+    if not client or not events:
+        return {}
+
+    user_ids = list(events)
+
+    try:
+        async with client.pipeline(transaction=False) as pipeline:
+            for user_id in user_ids:
+                key = event_stream_key(user_id)
+                pipeline.xadd(key, {"event": json.dumps(events[user_id])}, maxlen=REPLAY_STREAM_MAXLEN, approximate=True)
+                pipeline.expire(key, REPLAY_STREAM_TTL)
+            results = await pipeline.execute()
+    except RedisError as e:
+        mark_stream_unavailable(e)
+        return {}
+
+    #every xadd is followed by its expire
+    return dict(zip(user_ids, results[::2]))
+
+
+async def stream_covers(user_id, last_event_id):
+    """Returns True if every event after last_event_id is still retained in the user's stream."""
+    client = get_stream_client()
+
+    if not client:
+        return False
+
+    try:
+        oldest = await client.xrange(event_stream_key(user_id), count=1)
+    except RedisError as e:
+        mark_stream_unavailable(e)
+        return False
+
+    #an expired stream or one trimmed past the last seen event can't tell what was missed
+    return bool(oldest) and parse_event_id(oldest[0][0]) <= parse_event_id(last_event_id)
+
+
+async def iter_stream_events(user_id, last_event_id, batch_size=REPLAY_BATCH_SIZE):
+    """
+        Yields the (event_id, event) pairs appended after last_event_id, a batch per round-trip.
+
+        Raises:
+            RedisError: If the stream can't be read, the events yielded so far were delivered.
+    """
+    client = get_stream_client()
+    key = event_stream_key(user_id)
+
+    while client:
+        #the ( prefix excludes the last seen event
+        entries = await client.xrange(key, min=f"({last_event_id}", count=batch_size)
+
+        for event_id, fields in entries:
+            yield event_id, json.loads(fields["event"])
+            last_event_id = event_id
+
+        if len(entries) < batch_size:
+            return
+
+
+async def get_last_event_id(user_id):
+    """Returns the id of the newest event in the user's stream, a cursor for the next replay."""
+    client = get_stream_client()
+
+    if not client:
+        return None
+
+    try:
+        newest = await client.xrevrange(event_stream_key(user_id), count=1)
+    except RedisError as e:
+        mark_stream_unavailable(e)
+        return None
+
+    return newest[0][0] if newest else None
+
+
+@database_sync_to_async
+def get_missed_messages(user_id, since, cursor=None, limit=REPLAY_BATCH_SIZE):
+    """
+        Returns the messages the user sent or received after since, oldest first.
+
+        Keyset paginated on (created_at, id), pass the last message of a batch as
+        the cursor to get the next one.
+    """
+    messages = Message.objects.filter(
+        Q(sender_id=user_id) | Q(receiver_id=user_id),
+        created_at__gt=since
+    ).select_related('sender', 'receiver')
+
+    if cursor:
+        messages = messages.filter(
+            Q(created_at__gt=cursor.created_at) | Q(created_at=cursor.created_at, id__gt=cursor.id)
+        )
+
+    return list(messages.order_by('created_at', 'id')[:limit])
+
+
+async def iter_missed_messages(user_id, last_event_id, batch_size=REPLAY_BATCH_SIZE):
+    """
+        Yields the messages of the user after the last seen event, a batch per query, when the stream can't serve the gap.
+
+        The event time is widened by REPLAY_CLOCK_MARGIN, a message can be replayed twice but never missed.
+    """
+    since = event_id_to_datetime(last_event_id) - REPLAY_CLOCK_MARGIN
+    cursor = None
+
+    while True:
+        messages = await get_missed_messages(user_id, since, cursor=cursor, limit=batch_size)
+
+        for message in messages:
+            yield message
+
+        if len(messages) < batch_size:
+            return
+
+        cursor = messages[-1]
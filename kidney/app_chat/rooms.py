@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from kidney.presence import aget_presence, ONLINE
+from kidney.utils import get_base64_file_size
+from .fanout import fan_out, chat_room_name
+from .image_upload import MAX_IMAGE_SIZE_MB, split_image_data, upload_message_image
+from .inbox import record_message
+from .models import Message
+from .participants import get_participants, get_picture_url
+from .replay import append_events, get_user_event
+
+logger = logging.getLogger(__name__)
+
+CHAT_TYPES = ['nurse', 'head_nurse', 'admin', 'patient']
+
+#background image uploads that are still running
+image_upload_tasks = set()
+
+
+def get_message_payload(message, image_status=None):
+    return {
+        "message": message.content if message.content else None,
+        "sender_id": str(message.sender.id),
+        "receiver_id": str(message.receiver.id),
+        "chat_id": int(message.id),
+        "created_at": str(message.created_at),
+        "message_status": str(message.status).lower(),
+        "image": message.image.url if message.image else None,
+        "image_status": image_status
+    }
+
+
+class ChatError(Exception):
+    """A chat message the client sent was rejected, the message is sent back to the client."""
+
+
+class ChatRoom:
+    """
+        A chat room between the connected user (the sender) and another user, as opened by a socket.
+
+        The participants and their profile pictures are loaded once when the socket
+        opens the conversation, saving and publishing a message doesn't query them again.
+    """
+
+    def __init__(self, chat_type, sender_id, receiver_id):
+        self.chat_type = str(chat_type)
+        self.sender_id = str(sender_id)
+        self.receiver_id = str(receiver_id)
+        self.room_group_name = chat_room_name(self.chat_type, self.sender_id, self.receiver_id)
+        self.sender = None
+        self.receiver = None
+        self.pictures = {}
+
+    @property
+    def is_loaded(self):
+        return self.sender is not None and self.receiver is not None
+
+    @database_sync_to_async
+    def load_participants(self):
+        participants = get_participants(self.sender_id, self.receiver_id)
+
+        self.sender = participants.get(self.sender_id)
+        self.receiver = participants.get(self.receiver_id)
+        self.pictures = {user_id: get_picture_url(user) for user_id, user in participants.items()}
+
+    async def save_message(self, message_content=None, image_data=None):
+        """
+            Saves a new message, the image is only validated here and uploaded later.
+
+            Raises:
+                ChatError: If the image is too big or malformed.
+        """
+        message = Message(
+            sender=self.sender,
+            receiver=self.receiver,
+            content=message_content,
+            status='sent', #initially set status to 'sent',
+            date_sent=timezone.now()
+        )
+
+        if image_data:
+            #measured from the encoded length, decoding and uploading happen after the message is sent
+            size_in_mb = get_base64_file_size(image_data) / (1024 * 1024)
+
+            if size_in_mb >= MAX_IMAGE_SIZE_MB:
+                raise ChatError("The image upload is too big.")
+
+            try:
+                split_image_data(image_data)
+            except ValueError:
+                raise ChatError("Invalid image data.")
+
+        message.image = None
+
+        await self.persist_message(message)
+        return message
+
+    @database_sync_to_async
+    def persist_message(self, message):
+        #save the message and move the conversation pointer in the same transaction
+        with transaction.atomic():
+            message.save()
+            record_message(message)
+
+    async def publish_message(self, channel_layer, message, image_status=None):
+        """Delivers the message, the inbox update and the notification to both participants in a single fan-out."""
+        presence = await aget_presence([self.sender_id, self.receiver_id])
+
+        event = {
+            "type": "chat_event",
+            "room": self.room_group_name,
+            "chat": self.get_chat_payload(message, image_status),
+            "inbox": {},
+            "notification": {},
+        }
+
+        sender = message.sender
+        receiver = message.receiver
+
+        if sender.role == "patient" and receiver.role in ['nurse', 'head nurse']:
+            #the patient's inbox shows the provider, the provider gets a notification
+            event["inbox"][str(sender.id)] = self.get_inbox_payload(message, receiver, presence[str(receiver.id)])
+            event["notification"][str(receiver.id)] = self.get_notification_payload(message, sender)
+        elif sender.role == "patient" and receiver.role == "admin":
+            event["inbox"][str(receiver.id)] = self.get_inbox_payload(message, sender, presence[str(sender.id)])
+
+        await self.publish(channel_layer, event)
+
+    async def publish(self, channel_layer, event):
+        """Appends the event to both participants' replay streams, then fans it out to their live sockets."""
+        participants = [self.sender_id, self.receiver_id]
+
+        event["participants"] = participants
+        #the stream entry ids let a reconnecting client ask for what it missed after them
+        event["event_ids"] = await append_events({user_id: get_user_event(event, user_id) for user_id in participants})
+
+        await fan_out(channel_layer, event, participants)
+
+    def get_chat_payload(self, message, image_status=None):
+        return get_message_payload(message, image_status)
+
+    def get_inbox_payload(self, message, user, status):
+        #user is the counterpart shown in the inbox row
+        return {
+            "status": status,
+            "first_name": user.first_name,
+            "user_image": self.pictures.get(str(user.id)),
+            "message": message.content if message.content else None,
+            "message_status": message.status,
+            "read": message.read,
+            "chat_id": int(message.id),
+            "sender_id": str(message.sender.id),
+            "receiver_id": str(message.receiver.id),
+            "created_at": str(message.created_at),
+            "image": message.image.url if message.image else None
+        }
+
+    def get_notification_payload(self, message, sender):
+        return {
+            "first_name": str(sender.first_name).lower(),
+            "last_name": str(sender.last_name).lower(),
+            #the sender is connected
+            "status": ONLINE,
+            "message": str(message.content).lower(),
+            "created_at": str(message.created_at),
+            "picture": self.pictures.get(str(sender.id)),
+            "message_status": str(message.status).lower()
+        }
+
+    def start_image_upload(self, channel_layer, message, image_data):
+        task = asyncio.create_task(self.upload_image(channel_layer, message, image_data))
+
+        #keep a reference so the task isn't garbage collected, it finishes even if the socket closes
+        image_upload_tasks.add(task)
+        task.add_done_callback(image_upload_tasks.discard)
+
+    async def upload_image(self, channel_layer, message, image_data):
+        try:
+            image_url = await upload_message_image(message, image_data)
+            image_status = 'ready'
+        except Exception as e:
+            logger.exception(f"[WS] Failed to upload image of message {message.id}: {e}")
+            image_url = None
+            image_status = 'failed'
+
+        await self.publish(
+            channel_layer,
+            {
+                "type": "chat_event",
+                "room": self.room_group_name,
+                "image_ready": {
+                    "chat_id": int(message.id),
+                    "image": image_url,
+                    "image_status": image_status
+                }
+            }
+        )
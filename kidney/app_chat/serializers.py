@@ -4,8 +4,11 @@ from app_authentication.models import Profile, User
 from django.db.models import Q
 from datetime import datetime
 from django.utils import timezone
-from django.db import connection
-from kidney.pagination.appointment_pagination import Pagination
+from django.db import connection, transaction
+from kidney.pagination.keyset_pagination import KeysetPagination
+from .inbox import mark_conversation_as_read
+from kidney.identity import get_request_identity
+from kidney.presence import get_user_presence
     
 
 class GetNotificationChatsToProviderSerializer(serializers.ModelSerializer):
@@ -40,7 +43,7 @@ class GetNotificationChatsToProviderSerializer(serializers.ModelSerializer):
         data["last_message"] = {
             "patient_first_name": patient.first_name,
             "patient_last_name": patient.last_name,
-            "patient_status": getattr(patient, 'status', 'offline').lower(),
+            "patient_status": get_user_presence(patient.id, self.context.get('presence')),
             "patient_image": request.build_absolute_uri(getattr(getattr(patient, 'user_profile', None), 'picture', None).url) if getattr(getattr(patient, 'user_profile', None), 'picture', None) else None,
             "message": instance.content,
             "message_status": instance.status.lower(),
@@ -111,7 +114,7 @@ class GetProvidersChatSerializer(serializers.ModelSerializer):
         data.update(provider_information)
         data["last_message"] = {
             "provider_first_name": provider.first_name,
-            "provider_status": getattr(provider, 'status', 'offline').lower(),
+            "provider_status": get_user_presence(provider.id, self.context.get('presence')),
             "provider_image": request.build_absolute_uri(getattr(getattr(provider, 'user_profile', None), 'picture', None).url) if getattr(getattr(provider, 'user_profile', None), 'picture', None) else None,
             "message": instance.content,
             "message_status": instance.status.lower(),
@@ -157,7 +160,7 @@ class GetPatientsChatSerializer(serializers.ModelSerializer):
             "patient_first_name": patient.first_name,
             "patient_last_name": patient.last_name,
             "patient_image": getattr(getattr(patient, 'user_profile', None), 'picture', None).url if getattr(getattr(patient, 'user_profile', None), 'picture', None) else None,
-            "patient_status": getattr(patient, 'status', 'offline').lower(),
+            "patient_status": get_user_presence(patient.id, self.context.get('presence')),
             "message": instance.content,
             "message_status": instance.status.lower(),
             "is_read": instance.read,
@@ -176,6 +179,7 @@ class UpdateChatStatusInAdminSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id']
 
+    @transaction.atomic
     def update(self, instance, validated_data):        
 
         sender_id = self.context.get('sender_id')
@@ -186,54 +190,55 @@ class UpdateChatStatusInAdminSerializer(serializers.ModelSerializer):
            Q(sender=receiver_id, receiver=sender_id)
         ).update(read=True, status='read')
 
+        #the current user has read the conversation, reset their unread count
+        mark_conversation_as_read(sender_id, receiver_id)
+
         return instance
 
 
 class GetPatientChatInformationSerializer(serializers.ModelSerializer): 
 
     user_image = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['id', 'first_name', 'last_name', 'user_image', 'status']
 
+    def get_status(self, obj):
+        return get_user_presence(obj.id)
+
     def get_user_image(self, obj):
         return getattr(getattr(obj, 'user_profile', None), 'picture', None).url if getattr(getattr(obj, 'user_profile', None), 'picture', None) else None
     
     def to_representation(self, instance):
 
-        paginator = Pagination()
+        paginator = KeysetPagination()
 
         data = super().to_representation(instance)
 
         request = self.context.get('request')
 
-        messages_list = []
         pagination_messages_list = []
 
         #rename key
         data["patient_id"] = data.pop('id')
 
-        user_id = self.context.get('user_id')
+        user = get_request_identity(request).user
 
-        patient = User.objects.filter(id=instance.id, role='patient').first()
+        patient = instance if instance.role == 'patient' else None
 
         if patient:
 
-            admin = User.objects.filter(id=user_id, role='admin').first()
+            admin = user if user.role == 'admin' else None
 
-            messages = Message.objects.select_related('sender', 'receiver').filter(
-                sender=patient, receiver=admin
-            ).values('content', 'status', 'sender', 'receiver', 'created_at', 'read', 'id', 'image').union(
-                Message.objects.select_related('sender', 'receiver').filter(
-                    (
-                        Q(sender=patient, receiver=admin) |
-                        Q(sender=admin, receiver=patient)
-                    )
-                ).values('content', 'status', 'sender', 'receiver', 'created_at', 'read', 'id', 'image')
-            ).order_by('-created_at')
+            messages = Message.objects.filter(
+                Q(sender=patient, receiver=admin) |
+                Q(sender=admin, receiver=patient)
+            ).values('content', 'status', 'sender', 'receiver', 'created_at', 'read', 'id', 'image')
 
-            messages_list = [{
+            #only the requested page is fetched from the database
+            pagination_messages_list = [{
                 "id": int(message["id"]),
                 "message": str(message["content"]).lower(),
                 "message_status": str(message["status"]).lower(),
@@ -242,11 +247,9 @@ class GetPatientChatInformationSerializer(serializers.ModelSerializer):
                 "receiver_id": str(message["receiver"]),
                 "created_at": str(message["created_at"]),
                 "image": request.build_absolute_uri(message["image"]) if message["image"] else None
-            } for message in messages]
-            
-            pagination_messages_list = paginator.paginate_queryset(messages_list, request)
+            } for message in paginator.paginate_queryset(messages, request)]
 
-            data["count"] = paginator.page.paginator.count if pagination_messages_list else 0
+            data["count"] = paginator.get_count(messages) if pagination_messages_list else 0
             data["next"] = paginator.get_next_link() if pagination_messages_list else None
             data["previous"] = paginator.get_previous_link() if pagination_messages_list else None
             data["first_name"] = data.pop('first_name')
@@ -264,48 +267,46 @@ class GetPatientChatInformationSerializer(serializers.ModelSerializer):
 class GetPatientChatInformationInProviderSerializer(serializers.ModelSerializer): 
 
     user_image = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['id', 'first_name', 'last_name', 'user_image', 'status']
 
+    def get_status(self, obj):
+        return get_user_presence(obj.id)
+
     def get_user_image(self, obj):
         return getattr(getattr(obj, 'user_profile', None), 'picture', None).url if getattr(getattr(obj, 'user_profile', None), 'picture', None) else None
     
     def to_representation(self, instance):
 
-        paginator = Pagination()
+        paginator = KeysetPagination()
 
         data = super().to_representation(instance)
 
         request = self.context.get('request')
 
-        messages_list = []
         pagination_messages_list = []
 
         #rename key
         data["patient_id"] = data.pop('id')
 
-        user_id = self.context.get('user_id')
+        user = get_request_identity(request).user
 
-        patient = User.objects.filter(id=instance.id, role='patient').first()
+        patient = instance if instance.role == 'patient' else None
 
         if patient:
 
-            provider = User.objects.filter(id=user_id, role__in=['nurse', 'head nurse']).first()
+            provider = user if user.role in ['nurse', 'head nurse'] else None
 
-            messages = Message.objects.select_related('sender', 'receiver').filter(
-                sender=patient, receiver=provider
-            ).values('content', 'status', 'sender', 'receiver', 'created_at', 'read', 'id', 'image').union(
-                Message.objects.select_related('sender', 'receiver').filter(
-                    (
-                        Q(sender=patient, receiver=provider) |
-                        Q(sender=provider, receiver=patient)
-                    )
-                ).values('content', 'status', 'sender', 'receiver', 'created_at', 'read', 'id', 'image')
-            ).order_by('-created_at')
+            messages = Message.objects.filter(
+                Q(sender=patient, receiver=provider) |
+                Q(sender=provider, receiver=patient)
+            ).values('content', 'status', 'sender', 'receiver', 'created_at', 'read', 'id', 'image')
 
-            messages_list = [{
+            #only the requested page is fetched from the database
+            pagination_messages_list = [{
                 "id": int(message["id"]),
                 "message": str(message["content"]).lower(),
                 "message_status": str(message["status"]).lower(),
@@ -314,11 +315,9 @@ class GetPatientChatInformationInProviderSerializer(serializers.ModelSerializer)
                 "receiver_id": str(message["receiver"]),
                 "created_at": str(message["created_at"]),
                 "image": request.build_absolute_uri(message["image"]) if message["image"] else None
-            } for message in messages]
-            
-            pagination_messages_list = paginator.paginate_queryset(messages_list, request)
+            } for message in paginator.paginate_queryset(messages, request)]
 
-            data["count"] = paginator.page.paginator.count if pagination_messages_list else 0
+            data["count"] = paginator.get_count(messages) if pagination_messages_list else 0
             data["next"] = paginator.get_next_link() if pagination_messages_list else None
             data["previous"] = paginator.get_previous_link() if pagination_messages_list else None
             data["first_name"] = data.pop('first_name')
@@ -336,59 +335,57 @@ class GetPatientChatInformationInProviderSerializer(serializers.ModelSerializer)
 class GetProviderChatInformationSerializer(serializers.ModelSerializer):
 
     user_image = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['id', 'first_name', 'user_image', 'status']
 
+    def get_status(self, obj):
+        return get_user_presence(obj.id)
+
     def to_representation(self, instance):
         
-        user_id = self.context.get('user_id')
         #get the request object from the serializer context
         request  = self.context.get('request')
+        user = get_request_identity(request).user
 
         data = super().to_representation(instance)
         
-        paginator = Pagination()
+        paginator = KeysetPagination()
 
-        #get the patient as a single object
-        patient = User.objects.filter(id=user_id, role='patient').first()
+        #the authenticated user is the patient
+        patient = user if user.role == 'patient' else None
 
-        messages_list = []
+        messages = Message.objects.none()
         paginated_messages = []
 
         if patient:
             #get the provider as a single object
-            provider = User.objects.filter(id=instance.id, role__in=['nurse', 'head nurse']).first()
+            provider = instance if instance.role in ['nurse', 'head nurse'] else None
 
             if provider:
 
-                #get all messages between the patient and provider
-                messages = Message.objects.prefetch_related('sender', 'receiver').filter(
-                    sender=patient, receiver=provider
-                ).union(
-                    Message.objects.prefetch_related('sender', 'receiver').filter(
-                        (
-                            Q(sender=provider, receiver=patient) |
-                            Q(sender=patient, receiver=provider)
-                        )
-                    )
-                ).order_by('-created_at')
-
-                messages_list = [{
+                #get the messages between the patient and provider, only the requested page is fetched
+                messages = Message.objects.filter(
+                    Q(sender=provider, receiver=patient) |
+                    Q(sender=patient, receiver=provider)
+                )
+
+                paginated_messages = [{
                     "message": str(message.content).lower(),
                     "message_status": str(message.status).lower(),
                     "is_read": message.read,
                     "image": str(message.image.url) if message.image else None,
                     "chat_id": int(message.id),
-                    "sender_id": str(message.sender.id),
-                    "receiver_id": str(message.receiver.id),
+                    "sender_id": str(message.sender_id),
+                    "receiver_id": str(message.receiver_id),
                     "created_at": str(message.created_at)
-                } for message in messages]
-
-            paginated_messages = paginator.paginate_queryset(messages_list, request)
+                } for message in paginator.paginate_queryset(messages, request)]
 
-        data["count"] = paginator.page.paginator.count if paginated_messages else 0
+        data["count"] = paginator.get_count(messages) if paginated_messages else 0
+        data["next"] = paginator.get_next_link() if paginated_messages else None
+        data["previous"] = paginator.get_previous_link() if paginated_messages else None
         data["provider_id"] = str(data.pop('id'))
         data["provider_first_name"] = data.pop('first_name')
         data["provider_status"] = str(data.pop('status')).lower()
@@ -1,3 +1,679 @@
-from django.test import TestCase
+import base64
+import json
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from datetime import timedelta
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from app_authentication.models import User, Profile
+from app_authentication.token_blacklist import is_blacklisted
+from django.core.management import call_command
+from .models import Message, Conversation
+from .inbox import get_latest_pair_messages, record_message, mark_conversation_as_read
+from .routing import websocket_urlpatterns
+from .rooms import ChatRoom
+from .replay import get_user_event, iter_missed_messages
+from .fanout import fan_out
+from kidney.middleware.token_auth_middleware import JWTAuthMiddleware
+from kidney.realtime.routing import websocket_urlpatterns as realtime_websocket_urlpatterns
+from app_appointment.routing import websocket_urlpatterns as appointment_websocket_urlpatterns
+from kidney.utils import get_base64_file_size
+from kidney.identity import identity_cache
+from kidney.presence import get_presence, presence_key, presence_lock_key, socket_connected
 
-# Create your tests here.
+
+class ChatTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_user(self, username, role):
+        user = User.objects.create_user(username=username, password='password123', role=role)
+        Profile.objects.create(user=user)
+        return user
+
+    def authenticate(self, user):
+        token = AccessToken.for_user(user)
+        #check the token against the blacklist once so the check isn't inside a measured request
+        is_blacklisted(token['jti'], token['exp'])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def send(self, sender, receiver, content):
+        message = Message.objects.create(sender=sender, receiver=receiver, content=content)
+        record_message(message)
+        return message
+
+    def add_conversations(self, user, role, count, reply=True):
+        for _ in range(count):
+            counterpart = self.create_user(f"{role}{User.objects.count()}@kidneycare.com", role)
+            self.send(counterpart, user, 'hello')
+            if reply:
+                self.send(user, counterpart, 'hi')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data["data"]
+
+
+class InboxQueryCountTest(ChatTestCase):
+
+    def test_providers_chat_query_count_is_constant(self):
+        patient = self.create_user('patient@kidneycare.com', 'patient')
+        self.authenticate(patient)
+
+        self.add_conversations(patient, 'nurse', 2)
+        small_count, small_data = self.count_queries('/providers/chat/')
+
+        self.add_conversations(patient, 'nurse', 8)
+        large_count, large_data = self.count_queries('/providers/chat/')
+
+        self.assertEqual(len(small_data), 2)
+        self.assertEqual(len(large_data), 10)
+        self.assertEqual(small_count, large_count)
+
+    def test_patients_chat_query_count_is_constant(self):
+        admin = self.create_user('admin@kidneycare.com', 'admin')
+        self.authenticate(admin)
+
+        self.add_conversations(admin, 'patient', 2)
+        small_count, _ = self.count_queries('/patients/chat/')
+
+        self.add_conversations(admin, 'patient', 8)
+        large_count, large_data = self.count_queries('/patients/chat/')
+
+        self.assertEqual(len(large_data), 10)
+        self.assertEqual(small_count, large_count)
+
+    def test_chat_notifications_only_include_replied_conversations(self):
+        nurse = self.create_user('nurse@kidneycare.com', 'nurse')
+        self.authenticate(nurse)
+
+        self.add_conversations(nurse, 'patient', 3)
+        self.add_conversations(nurse, 'patient', 2, reply=False)
+        small_count, small_data = self.count_queries('/patients/chat/notifications/')
+
+        self.add_conversations(nurse, 'patient', 6)
+        large_count, large_data = self.count_queries('/patients/chat/notifications/')
+
+        self.assertEqual(len(small_data), 3)
+        self.assertEqual(len(large_data), 9)
+        self.assertEqual(small_count, large_count)
+
+    def test_latest_message_is_returned_per_conversation(self):
+        patient = self.create_user('patient@kidneycare.com', 'patient')
+        nurse = self.create_user('nurse@kidneycare.com', 'nurse')
+        self.authenticate(patient)
+
+        self.send(patient, nurse, 'first')
+        latest = self.send(nurse, patient, 'second')
+
+        _, data = self.count_queries('/providers/chat/')
+
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["chat_id"], latest.id)
+        self.assertEqual(data[0]["last_message"]["message"], 'second')
+
+
+class ConversationTest(ChatTestCase):
+
+    def test_unread_counts_follow_messages_and_reads(self):
+        patient = self.create_user('patient@kidneycare.com', 'patient')
+        nurse = self.create_user('nurse@kidneycare.com', 'nurse')
+
+        self.send(patient, nurse, 'first')
+        self.send(patient, nurse, 'second')
+        latest = self.send(nurse, patient, 'third')
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message_id, latest.id)
+        self.assertEqual(conversation.unread_count_for(nurse), 2)
+        self.assertEqual(conversation.unread_count_for(patient), 1)
+
+        mark_conversation_as_read(nurse.id, patient.id)
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.unread_count_for(nurse), 0)
+        self.assertEqual(conversation.unread_count_for(patient), 1)
+
+    def test_backfill_rebuilds_conversations_from_messages(self):
+        patient = self.create_user('patient@kidneycare.com', 'patient')
+        nurse = self.create_user('nurse@kidneycare.com', 'nurse')
+        admin = self.create_user('admin@kidneycare.com', 'admin')
+
+        Message.objects.create(sender=patient, receiver=nurse, content='hello')
+        latest = Message.objects.create(sender=nurse, receiver=patient, content='hi', read=True)
+        Message.objects.create(sender=patient, receiver=admin, content='hello')
+
+        call_command('backfill_conversations', stdout=StringIO())
+
+        self.assertEqual(Conversation.objects.count(), 2)
+
+        conversation = Conversation.objects.get(last_message=latest)
+        self.assertEqual(conversation.unread_count_for(nurse), 1)
+        self.assertEqual(conversation.unread_count_for(patient), 0)
+
+    def test_latest_pair_messages_without_window_functions(self):
+        patient = self.create_user('patient@kidneycare.com', 'patient')
+        nurse = self.create_user('nurse@kidneycare.com', 'nurse')
+
+        Message.objects.create(sender=patient, receiver=nurse, content='hello')
+        latest = Message.objects.create(sender=nurse, receiver=patient, content='hi')
+
+        self.assertEqual(list(get_latest_pair_messages()), [latest])
+
+        #the correlated subquery picks the same message
+        with mock.patch.object(connection.features, 'supports_over_clause', False):
+            self.assertEqual(list(get_latest_pair_messages()), [latest])
+
+
+class ChatHistoryPaginationTest(ChatTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.patient = self.create_user('patient@kidneycare.com', 'patient')
+        self.nurse = self.create_user('nurse@kidneycare.com', 'nurse')
+        self.messages = [self.send(self.patient, self.nurse, f"message {index}") for index in range(25)]
+        self.authenticate(self.patient)
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"]
+
+    def test_pages_follow_cursors_in_both_directions(self):
+        first_page = self.get_page(f'/conversation/{self.nurse.id}/')
+        self.assertEqual(first_page["count"], 25)
+        self.assertIsNone(first_page["previous"])
+        self.assertEqual([m["chat_id"] for m in first_page["messages"]], [m.id for m in self.messages[::-1][:10]])
+
+        second_page = self.get_page(first_page["next"])
+        self.assertEqual([m["chat_id"] for m in second_page["messages"]], [m.id for m in self.messages[::-1][10:20]])
+        #only the first page counts the thread
+        self.assertIsNone(second_page["count"])
+
+        last_page = self.get_page(second_page["next"])
+        self.assertEqual(len(last_page["messages"]), 5)
+        self.assertIsNone(last_page["next"])
+
+        newer_page = self.get_page(last_page["previous"])
+        self.assertEqual(newer_page["messages"], second_page["messages"])
+
+    def test_only_one_page_is_fetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page(f'/conversation/{self.nurse.id}/?limit=5')
+
+        message_queries = [query["sql"] for query in queries if 'FROM "app_chat_message"' in query["sql"] and 'COUNT' not in query["sql"]]
+        self.assertEqual(len(message_queries), 1)
+        self.assertIn('LIMIT 6', message_queries[0])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f'/conversation/{self.nurse.id}/?before=invalid')
+        self.assertEqual(response.status_code, 404)
+
+
+class ChatConsumerTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        self.nurse = User.objects.create_user(username='nurse@kidneycare.com', password='password123', role='nurse')
+        Profile.objects.create(user=self.patient)
+        Profile.objects.create(user=self.nurse)
+        #presence counters live in the cache
+        cache.clear()
+
+    async def connect(self, user, other_user, chat_type='nurse'):
+        communicator = WebsocketCommunicator(
+            JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+            f"/ws/chat/{chat_type}/{other_user.id}/",
+            headers=[(b'authorization', f"Bearer {AccessToken.for_user(user)}".encode())]
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def connect_realtime(self, user, path="/ws/realtime/"):
+        communicator = WebsocketCommunicator(
+            JWTAuthMiddleware(URLRouter(realtime_websocket_urlpatterns + appointment_websocket_urlpatterns)),
+            path,
+            headers=[(b'authorization', f"Bearer {AccessToken.for_user(user)}".encode())]
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_until(self, communicator, predicate, timeout=5):
+        #skip the status, inbox and notification frames sent along the way
+        while True:
+            frame = json.loads(await communicator.receive_from(timeout=timeout))
+            if predicate(frame):
+                return frame
+
+
+class WebSocketAuthTest(ChatConsumerTestCase):
+
+    async def test_connect_caches_the_authenticated_user(self):
+        identity_cache.clear()
+
+        communicator = await self.connect(self.patient, self.nurse)
+        await communicator.disconnect()
+
+        self.assertEqual(identity_cache[str(self.patient.id)][1].role, 'patient')
+
+    async def test_invalid_token_is_rejected(self):
+        communicator = WebsocketCommunicator(
+            JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+            f"/ws/chat/nurse/{self.nurse.id}/",
+            headers=[(b'authorization', b"Bearer invalid")]
+        )
+        connected, code = await communicator.connect()
+
+        self.assertFalse(connected)
+        self.assertEqual(code, 4003)
+
+
+class ChatParticipantCacheTest(ChatConsumerTestCase):
+
+    async def send_and_receive_inbox(self, communicator, content):
+        await communicator.send_to(text_data=json.dumps({"message": content}))
+        return await self.receive_until(communicator, lambda frame: "first_name" in frame and frame.get("message") == content)
+
+    def test_message_is_saved_with_a_single_insert(self):
+        room = ChatRoom("nurse", self.patient.id, self.nurse.id)
+        async_to_sync(room.load_participants)()
+        async_to_sync(room.save_message)(message_content='first')
+
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(room.save_message)(message_content='second')
+
+        #the message insert and the conversation pointer update, no user or profile lookups
+        statements = [query["sql"].split()[0] for query in queries]
+        self.assertEqual([statement for statement in statements if statement in ('SELECT', 'INSERT', 'UPDATE')], ['INSERT', 'UPDATE'])
+
+    async def test_participants_are_reloaded_on_profile_change(self):
+        communicator = await self.connect(self.patient, self.nurse)
+        frame = await self.send_and_receive_inbox(communicator, 'first')
+        self.assertEqual(frame["first_name"], '')
+
+        await sync_to_async(User.objects.filter(id=self.nurse.id).update)(first_name='Joy')
+        await communicator.send_input({"type": "profile_changed", "user_id": str(self.nurse.id)})
+
+        frame = await self.send_and_receive_inbox(communicator, 'second')
+        self.assertEqual(frame["first_name"], 'Joy')
+
+        await communicator.disconnect()
+
+
+class PresenceTest(ChatConsumerTestCase):
+
+    def presence_of(self, user):
+        return get_presence([user.id])[str(user.id)]
+
+    async def ping(self, communicator):
+        #the socket handles its messages in order, the connect is done once the pong arrives
+        await communicator.send_to(text_data=json.dumps({"type": "ping"}))
+        await self.receive_until(communicator, lambda frame: frame.get("type") == 'pong')
+
+    async def test_user_is_online_until_the_last_socket_closes(self):
+        first = await self.connect(self.patient, self.nurse)
+        second = await self.connect(self.patient, self.nurse)
+        await self.ping(first)
+        await self.ping(second)
+        self.assertEqual(await sync_to_async(self.presence_of)(self.patient), 'online')
+
+        await first.disconnect()
+        self.assertEqual(await sync_to_async(self.presence_of)(self.patient), 'online')
+
+        await second.disconnect()
+        self.assertEqual(await sync_to_async(self.presence_of)(self.patient), 'offline')
+
+    async def test_presence_changes_are_pushed_to_the_other_participant(self):
+        communicator = await self.connect(self.patient, self.nurse)
+        status = await self.receive_until(communicator, lambda frame: "status" in frame and len(frame) == 1)
+        self.assertEqual(status["status"], 'offline')
+
+        nurse_communicator = await self.connect(self.nurse, self.patient)
+        frame = await self.receive_until(communicator, lambda frame: frame.get("type") == 'presence')
+        self.assertEqual(frame, {"type": "presence", "user_id": str(self.nurse.id), "status": "online"})
+
+        await nurse_communicator.disconnect()
+        frame = await self.receive_until(communicator, lambda frame: frame.get("type") == 'presence' and frame["status"] == 'offline')
+        self.assertEqual(frame["user_id"], str(self.nurse.id))
+
+        await communicator.disconnect()
+
+    @mock.patch('kidney.presence.PRESENCE_REFRESH_INTERVAL', 0)
+    async def test_any_frame_brings_back_an_expired_user(self):
+        communicator = await self.connect(self.patient, self.nurse)
+
+        #nothing was received long enough for the key to expire
+        await cache.adelete(presence_key(self.patient.id))
+        self.assertEqual(await sync_to_async(self.presence_of)(self.patient), 'offline')
+
+        #the nurse is already watched by the conversation, the patient isn't
+        await communicator.send_to(text_data=json.dumps({"type": "subscribe_presence", "user_ids": [str(self.patient.id)]}))
+        await self.receive_until(communicator, lambda frame: frame.get("type") == 'presence')
+        self.assertEqual(await sync_to_async(self.presence_of)(self.patient), 'online')
+
+        await communicator.disconnect()
+
+    @mock.patch('kidney.presence.PRESENCE_REFRESH_INTERVAL', 0)
+    async def test_closing_a_tab_after_the_key_expired_keeps_the_other_one_online(self):
+        first = await self.connect(self.patient, self.nurse)
+        second = await self.connect(self.patient, self.nurse)
+
+        await cache.adelete(presence_key(self.patient.id))
+
+        for communicator in (first, second):
+            await self.ping(communicator)
+
+        await first.disconnect()
+        self.assertEqual(await sync_to_async(self.presence_of)(self.patient), 'online')
+
+        await second.disconnect()
+        self.assertEqual(await sync_to_async(self.presence_of)(self.patient), 'offline')
+
+    def test_sockets_are_not_written_without_the_lock(self):
+        cache.add(presence_lock_key(self.nurse.id), True)
+
+        with mock.patch('kidney.presence.PRESENCE_LOCK_ATTEMPTS', 1):
+            self.assertIsNone(async_to_sync(socket_connected)(self.nurse.id, 'nurse-channel'))
+
+        self.assertIsNone(cache.get(presence_key(self.nurse.id)))
+        self.assertEqual(self.presence_of(self.nurse), 'offline')
+
+    def test_inbox_reads_the_presence_of_the_page(self):
+        Message.objects.create(sender=self.patient, receiver=self.nurse, content='hello')
+        record_message(Message.objects.get())
+        async_to_sync(socket_connected)(self.nurse.id, 'nurse-channel')
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.patient)}")
+        response = client.get('/providers/chat/')
+
+        self.assertEqual(response.data["data"][0]["last_message"]["provider_status"], 'online')
+
+
+class ChatFanOutTest(ChatConsumerTestCase):
+
+    async def frames_until_pong(self, communicator):
+        #a socket handles its messages in order, everything before the pong has been delivered
+        await communicator.send_to(text_data=json.dumps({"type": "ping"}))
+        frames = []
+        while True:
+            frame = json.loads(await communicator.receive_from(timeout=5))
+            if frame.get("type") == 'pong':
+                return frames
+            frames.append(frame)
+
+    def test_every_participant_gets_one_send(self):
+        channel_layer = mock.AsyncMock()
+
+        async_to_sync(fan_out)(channel_layer, {"type": "chat_event"}, [self.patient.id, self.nurse.id, self.nurse.id])
+
+        self.assertEqual(channel_layer.group_send.await_count, 2)
+        channel_layer.group_send.assert_any_await(f"user_{self.nurse.id}", {"type": "chat_event"})
+
+    async def test_socket_gets_its_frames_after_the_presence_expired(self):
+        patient_socket = await self.connect(self.patient, self.nurse)
+        nurse_socket = await self.connect(self.nurse, self.patient)
+
+        for communicator in (patient_socket, nurse_socket):
+            await self.frames_until_pong(communicator)
+
+        #the nurse's socket is still open but nothing refreshed its presence in time
+        await cache.adelete(presence_key(self.nurse.id))
+
+        await patient_socket.send_to(text_data=json.dumps({"message": "hello"}))
+        await self.frames_until_pong(patient_socket)
+
+        nurse_frames = await self.frames_until_pong(nurse_socket)
+        self.assertEqual(nurse_frames[0]["message"], 'hello')
+
+        await patient_socket.disconnect()
+        await nurse_socket.disconnect()
+
+    async def test_each_socket_gets_its_frames_once(self):
+        other_patient = await sync_to_async(User.objects.create_user)(username='other@kidneycare.com', password='password123', role='patient')
+        await sync_to_async(Profile.objects.create)(user=other_patient)
+
+        patient_socket = await self.connect(self.patient, self.nurse)
+        nurse_socket = await self.connect(self.nurse, self.patient)
+        other_room_socket = await self.connect(self.nurse, other_patient)
+
+        for communicator in (patient_socket, nurse_socket, other_room_socket):
+            await self.frames_until_pong(communicator)
+
+        await patient_socket.send_to(text_data=json.dumps({"message": "hello"}))
+        await self.frames_until_pong(patient_socket)
+
+        #the chat message and the notification
+        nurse_frames = await self.frames_until_pong(nurse_socket)
+        self.assertEqual(len(nurse_frames), 2)
+        self.assertEqual(nurse_frames[0]["message"], 'hello')
+        self.assertEqual(nurse_frames[1]["status"], 'online')
+        self.assertIn("last_name", nurse_frames[1])
+
+        #another room of the nurse only gets the notification
+        other_frames = await self.frames_until_pong(other_room_socket)
+        self.assertEqual(len(other_frames), 1)
+        self.assertIn("last_name", other_frames[0])
+
+        for communicator in (patient_socket, nurse_socket, other_room_socket):
+            await communicator.disconnect()
+
+
+class RealtimeGatewayTest(ChatConsumerTestCase):
+
+    async def subscribe(self, communicator, user, chat_type='nurse'):
+        await communicator.send_to(text_data=json.dumps({"type": "subscribe", "chat_type": chat_type, "user_id": str(user.id)}))
+        frame = await self.receive_until(communicator, lambda frame: frame["type"] in ('subscribed', 'error'))
+        self.assertEqual(frame["type"], 'subscribed')
+        return frame["conversation"]
+
+    async def test_one_socket_carries_several_conversations(self):
+        other_patient = await sync_to_async(User.objects.create_user)(username='other@kidneycare.com', password='password123', role='patient')
+        await sync_to_async(Profile.objects.create)(user=other_patient)
+
+        gateway = await self.connect_realtime(self.nurse)
+        first = await self.subscribe(gateway, self.patient)
+        second = await self.subscribe(gateway, other_patient)
+        self.assertNotEqual(first, second)
+
+        #the patient is still on the legacy chat route
+        patient_socket = await self.connect(self.patient, self.nurse)
+        await patient_socket.send_to(text_data=json.dumps({"message": "hello"}))
+
+        frame = await self.receive_until(gateway, lambda frame: frame["type"] == 'chat.message')
+        self.assertEqual(frame["conversation"], first)
+        self.assertEqual(frame["data"]["message"], 'hello')
+
+        frame = await self.receive_until(gateway, lambda frame: frame["type"] == 'chat.notification')
+        self.assertEqual(frame["data"]["message"], 'hello')
+
+        #a reply through the gateway reaches the legacy socket as a plain frame
+        await gateway.send_to(text_data=json.dumps({"type": "chat.send", "conversation": first, "message": "hi"}))
+        frame = await self.receive_until(patient_socket, lambda frame: frame.get("message") == 'hi' and "chat_id" in frame)
+        self.assertEqual(frame["sender_id"], str(self.nurse.id))
+
+        await gateway.send_to(text_data=json.dumps({"type": "unsubscribe", "conversation": first}))
+        await self.receive_until(gateway, lambda frame: frame["type"] == 'unsubscribed')
+
+        await gateway.send_to(text_data=json.dumps({"type": "chat.send", "conversation": first, "message": "bye"}))
+        frame = await self.receive_until(gateway, lambda frame: frame["type"] == 'error')
+        self.assertEqual(frame["data"]["message"], 'Not subscribed to this conversation.')
+
+        await patient_socket.disconnect()
+        await gateway.disconnect()
+
+    async def test_appointment_events_are_carried_by_both_routes(self):
+        gateway = await self.connect_realtime(self.patient)
+        legacy = await self.connect_realtime(self.patient, path="/ws/appointment/")
+
+        event = {"type": "upcoming_appointments", "appointment_id": 1, "status": "approved"}
+        await get_channel_layer().group_send(f"appointment_user_{self.patient.id}", event)
+
+        frame = await self.receive_until(gateway, lambda frame: frame["type"] == 'appointment.upcoming')
+        self.assertEqual(frame["data"], {"appointment_id": 1, "status": "approved"})
+
+        frame = json.loads(await legacy.receive_from(timeout=5))
+        self.assertEqual(frame, {"appointment_id": 1, "status": "approved"})
+
+        await gateway.disconnect()
+        await legacy.disconnect()
+
+    async def test_unknown_conversation_is_rejected(self):
+        gateway = await self.connect_realtime(self.patient)
+
+        await gateway.send_to(text_data=json.dumps({"type": "subscribe", "chat_type": "nurse", "user_id": "not-a-uuid"}))
+        frame = await self.receive_until(gateway, lambda frame: frame["type"] == 'error')
+        self.assertEqual(frame["data"]["message"], 'Invalid user id.')
+
+        await gateway.disconnect()
+
+
+@override_settings(REALTIME_REDIS_URL=None)
+class ChatReplayTest(ChatConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        #seen before the client went offline
+        self.seen = Message.objects.create(sender=self.patient, receiver=self.nurse, content='seen')
+        Message.objects.filter(id=self.seen.id).update(created_at=now - timedelta(hours=1))
+        self.last_event_id = f"{int((now - timedelta(minutes=30)).timestamp() * 1000)}-0"
+        self.missed = [Message.objects.create(sender=self.nurse, receiver=self.patient, content=f'missed {index}') for index in range(3)]
+
+    def test_user_event_only_holds_the_parts_of_the_user(self):
+        event = {
+            "room": "chat_nurse_a_b",
+            "participants": ["a", "b"],
+            "chat": {"chat_id": 1},
+            "inbox": {"a": {"chat_id": 1}},
+            "notification": {"b": {"chat_id": 1}},
+        }
+
+        self.assertEqual(set(get_user_event(event, "a")), {"room", "participants", "chat", "inbox"})
+        self.assertEqual(set(get_user_event(event, "b")), {"room", "participants", "chat", "notification"})
+
+    def test_missed_messages_are_read_in_keyset_batches(self):
+        async def collect():
+            return [message.id async for message in iter_missed_messages(self.patient.id, self.last_event_id, batch_size=2)]
+
+        with CaptureQueriesContext(connection) as queries:
+            message_ids = async_to_sync(collect)()
+
+        self.assertEqual(message_ids, [message.id for message in self.missed])
+        self.assertEqual(len(queries), 2)
+
+    async def test_gap_beyond_the_stream_is_replayed_from_the_database(self):
+        gateway = await self.connect_realtime(self.patient)
+
+        await gateway.send_to(text_data=json.dumps({"type": "replay", "last_event_id": self.last_event_id}))
+
+        frames = []
+        while True:
+            frame = await self.receive_until(gateway, lambda frame: frame["type"] in ('chat.message', 'replay.done'))
+            if frame["type"] == 'replay.done':
+                break
+            frames.append(frame)
+
+        self.assertEqual([frame["data"]["chat_id"] for frame in frames], [message.id for message in self.missed])
+        self.assertTrue(all(frame["replayed"] for frame in frames))
+        self.assertEqual(frame["data"], {"last_event_id": self.last_event_id, "source": "database"})
+
+        await gateway.disconnect()
+
+    async def test_legacy_route_replays_its_conversation(self):
+        other_patient = await sync_to_async(User.objects.create_user)(username='other@kidneycare.com', password='password123', role='patient')
+        await sync_to_async(Message.objects.create)(sender=self.nurse, receiver=other_patient, content='elsewhere')
+
+        communicator = await self.connect(self.patient, self.nurse)
+        await communicator.send_to(text_data=json.dumps({"type": "replay", "last_event_id": self.last_event_id}))
+
+        frames = []
+        while True:
+            frame = await self.receive_until(communicator, lambda frame: "chat_id" in frame or frame.get("type") == 'replay.done')
+            if frame.get("type") == 'replay.done':
+                break
+            frames.append(frame)
+
+        self.assertEqual([frame["message"] for frame in frames], ['missed 0', 'missed 1', 'missed 2'])
+
+        await communicator.disconnect()
+
+    async def test_invalid_event_id_is_rejected(self):
+        gateway = await self.connect_realtime(self.patient)
+
+        await gateway.send_to(text_data=json.dumps({"type": "replay", "last_event_id": "yesterday"}))
+        frame = await self.receive_until(gateway, lambda frame: frame["type"] == 'error')
+        self.assertEqual(frame["data"]["message"], 'Invalid event id.')
+
+        await gateway.disconnect()
+
+
+class ChatImageUploadTest(ChatConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        storage_patch = mock.patch.object(Message._meta.get_field('image'), 'storage', FileSystemStorage(self.media_root, base_url='/media/'))
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    def test_size_is_computed_from_the_encoded_length(self):
+        for raw in [b'', b'a', b'ab', b'abc', b'abcd' * 1000 + b'e']:
+            encoded = f"data:image/png;base64,{base64.b64encode(raw).decode()}"
+            self.assertEqual(get_base64_file_size(encoded), len(raw))
+
+    async def test_image_message_is_sent_before_the_upload(self):
+        communicator = await self.connect(self.patient, self.nurse)
+        image = b'\x89PNG\r\n' + b'0' * 1024
+
+        await communicator.send_to(text_data=json.dumps({
+            "message": "photo",
+            "image_data": f"data:image/png;base64,{base64.b64encode(image).decode()}"
+        }))
+
+        placeholder = await self.receive_until(communicator, lambda frame: "chat_id" in frame and "image_status" in frame)
+        self.assertIsNone(placeholder["image"])
+        self.assertEqual(placeholder["image_status"], 'uploading')
+
+        ready = await self.receive_until(communicator, lambda frame: frame.get("type") == 'image_ready')
+        self.assertEqual(ready["chat_id"], placeholder["chat_id"])
+        self.assertEqual(ready["image_status"], 'ready')
+
+        message = await sync_to_async(Message.objects.get)(id=placeholder["chat_id"])
+        self.assertTrue(ready["image"].endswith(message.image.name))
+        with message.image.open('rb') as stored:
+            self.assertEqual(stored.read(), image)
+
+        await communicator.disconnect()
+
+    async def test_oversized_image_is_rejected_without_saving(self):
+        communicator = await self.connect(self.patient, self.nurse)
+
+        await communicator.send_to(text_data=json.dumps({
+            "image_data": "data:image/png;base64," + "A" * (28 * 1024 * 1024)
+        }))
+
+        error = await self.receive_until(communicator, lambda frame: "error" in frame)
+        self.assertEqual(error["error"], "The image upload is too big.")
+        self.assertFalse(await sync_to_async(Message.objects.exists)())
+
+        await communicator.disconnect()
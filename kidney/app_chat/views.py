@@ -2,7 +2,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics
 from rest_framework import status
 from app_authentication.models import User
-from kidney.utils import ResponseMessageUtils, get_token_user_id, extract_first_error_message
+from kidney.utils import ResponseMessageUtils, extract_first_error_message
+from kidney.identity import get_request_identity
 from django.db.models import Q
 from .serializers import (
     GetNotificationChatsToProviderSerializer,
@@ -17,6 +18,7 @@ from .serializers import (
 from rest_framework.exceptions import ParseError, NotFound
 import json
 from .models import Message
+from .inbox import get_latest_messages, get_messages_presence
 from rest_framework.pagination import PageNumberPagination
 
 class ChatPagination(PageNumberPagination):
@@ -38,34 +40,22 @@ class GetNotificationChatsToProviderView(generics.ListAPIView):
         
         try:
             
-            #get the current authenticated user_id from the token
-            user_id = get_token_user_id(request)
+            #get the current authenticated user from the request identity
+            provider = get_request_identity(request).user
 
-            provider = User.objects.get(id=user_id)
+            #latest message of every conversation where the patient and provider both messaged
+            latest_messages = get_latest_messages(provider, roles=['patient'], mutual=True)
 
-            patients = User.objects.filter(role__in=['patient'])
-
-            patient_who_messaged_providers = patients.filter(
-                Q(sender_messages__receiver=provider, receiver_messages__sender=provider)
-            ).distinct()
-
-            if not patient_who_messaged_providers.exists():
+            if not latest_messages:
                 return ResponseMessageUtils(
                     message="No messages found",
                     status_code=status.HTTP_404_NOT_FOUND
                 )
 
-            latest_messages = []
-            for patient in patient_who_messaged_providers:
-                message = Message.objects.filter(
-                    Q(sender=patient, receiver=provider) |
-                    Q(sender=provider, receiver=patient)
-                ).order_by('-created_at').first()
-                if message:
-                    latest_messages.append(message)
-       
+            #presence of the whole page is read once instead of per row
+            presence = get_messages_presence(latest_messages)
 
-            serializer = self.get_serializer(latest_messages, many=True, context={'pk': user_id, 'request': request})
+            serializer = self.get_serializer(latest_messages, many=True, context={'pk': provider.id, 'request': request, 'presence': presence})
 
 
             return ResponseMessageUtils(
@@ -90,34 +80,22 @@ class GetProvidersChatView(generics.ListAPIView):
         
         try:
             
-            #get the current authenticated user_id from the token
-            user_id = get_token_user_id(request)
-
-            patient = User.objects.get(id=user_id)
-
-            providers = User.objects.filter(role__in=['nurse', 'head nurse'])
+            #get the current authenticated user from the request identity
+            patient = get_request_identity(request).user
 
-            providers_who_messaged_patient = providers.filter(
-                Q(sender_messages__receiver=patient) | Q(receiver_messages__sender=patient)
-            ).distinct()
+            #latest message of every conversation between the patient and a provider
+            latest_messages = get_latest_messages(patient, roles=['nurse', 'head nurse'])
 
-            if not providers_who_messaged_patient.exists():
+            if not latest_messages:
                 return ResponseMessageUtils(
                     message="No messages found",
                     status_code=status.HTTP_404_NOT_FOUND
                 )
 
-            latest_messages = []
-            for provider in providers_who_messaged_patient:
-                message = Message.objects.filter(
-                    Q(sender=patient, receiver=provider) |
-                    Q(sender=provider, receiver=patient)
-                ).order_by('-created_at').first()
-                if message:
-                    latest_messages.append(message)
-       
+            #presence of the whole page is read once instead of per row
+            presence = get_messages_presence(latest_messages)
 
-            serializer = self.get_serializer(latest_messages, many=True, context={'pk': user_id, 'request': request})
+            serializer = self.get_serializer(latest_messages, many=True, context={'pk': patient.id, 'request': request, 'presence': presence})
 
 
             return ResponseMessageUtils(
@@ -145,17 +123,20 @@ class GetProviderChatInformationView(generics.ListAPIView):
 
         try:
 
-            user_id = get_token_user_id(request)
-
             queryset = User.objects.get(id=kwargs.get('pk'))
 
-            serializer = self.get_serializer(queryset, context={'user_id': user_id, 'request': request})
+            serializer = self.get_serializer(queryset, context={'request': request})
             return ResponseMessageUtils(
                 message="Chat messages",
                 data=serializer.data,
                 status_code=status.HTTP_200_OK
             )
 
+        except NotFound as e:
+            return ResponseMessageUtils(
+                message=str(e.detail),
+                status_code=status.HTTP_404_NOT_FOUND
+            )
         except Exception as e:
             return ResponseMessageUtils(
                 message=f"Something went wrong while processing your request {e}",
@@ -171,35 +152,23 @@ class GetPatientsChatView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         
         try:
-            #get the current authenticated user_id from the token
-            user_id = get_token_user_id(request)
-
-            admin = User.objects.get(id=user_id)
+            #get the current authenticated user from the request identity
+            admin = get_request_identity(request).user
 
-            patient = User.objects.filter(role='patient')
+            #latest message of every conversation between the admin and a patient
+            latest_messages = get_latest_messages(admin, roles=['patient'])
 
-            patient_who_messaged_admin = patient.filter(
-                Q(sender_messages__receiver=admin) | Q(receiver_messages__sender=admin)
-            ).distinct()
-
-            if not patient_who_messaged_admin.exists():
+            if not latest_messages:
                 return ResponseMessageUtils(
                     message="No messages found",
                     data=[],
                     status_code=status.HTTP_404_NOT_FOUND
                 )
 
-            latest_messages = []
-            for patient in patient_who_messaged_admin:
-                message = Message.objects.filter(
-                    Q(sender=admin, receiver=patient) |
-                    Q(sender=patient, receiver=admin)
-                ).order_by('-created_at').first()
-                if message:
-                    latest_messages.append(message)
-       
+            #presence of the whole page is read once instead of per row
+            presence = get_messages_presence(latest_messages)
 
-            serializer = self.get_serializer(latest_messages, many=True, context={'pk': user_id, 'request': request})
+            serializer = self.get_serializer(latest_messages, many=True, context={'pk': admin.id, 'request': request, 'presence': presence})
 
 
             return ResponseMessageUtils(
@@ -228,7 +197,7 @@ class UpdateChatStatusInView(generics.UpdateAPIView):
 
         try:
             
-            sender_id = get_token_user_id(request)
+            sender_id = get_request_identity(request).user_id
             receiver_id = kwargs.get('pk')
 
             instance = self.get_queryset()
@@ -268,11 +237,9 @@ class GetPatientChatInformationView(generics.RetrieveAPIView):
 
         try:
 
-            user_id = get_token_user_id(request)
-
             queryset = self.get_queryset()
 
-            serializer = self.get_serializer(queryset, context={"user_id": user_id, "request": request})
+            serializer = self.get_serializer(queryset, context={"request": request})
 
             return ResponseMessageUtils(
                 message="Chat messages",
@@ -280,6 +247,11 @@ class GetPatientChatInformationView(generics.RetrieveAPIView):
                 status_code=status.HTTP_200_OK
             )
 
+        except NotFound as e:
+            return ResponseMessageUtils(
+                message=str(e.detail),
+                status_code=status.HTTP_404_NOT_FOUND
+            )
         except Exception as e:
             print(f"WHAT WENT WRONG? {e}")
             return ResponseMessageUtils(
@@ -300,11 +272,9 @@ class GetPatientChatInformationInProviderView(generics.RetrieveAPIView):
 
         try:
 
-            user_id = get_token_user_id(request)
-
             queryset = self.get_queryset()
 
-            serializer = self.get_serializer(queryset, context={"user_id": user_id, "request": request})
+            serializer = self.get_serializer(queryset, context={"request": request})
 
             return ResponseMessageUtils(
                 message="Chat messages",
@@ -312,6 +282,11 @@ class GetPatientChatInformationInProviderView(generics.RetrieveAPIView):
                 status_code=status.HTTP_200_OK
             )
 
+        except NotFound as e:
+            return ResponseMessageUtils(
+                message=str(e.detail),
+                status_code=status.HTTP_404_NOT_FOUND
+            )
         except Exception as e:
             return ResponseMessageUtils(
                 message="Something went wrong while processing your request",
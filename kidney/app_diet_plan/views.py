@@ -15,7 +15,8 @@ from collections import defaultdict
 from rest_framework.permissions import IsAuthenticated
 from .models import DietPlan, SubDietPlan
 from datetime import time, datetime
-from kidney.utils import get_token_user_id, ResponseMessageUtils, extract_first_error_message
+from kidney.utils import ResponseMessageUtils, extract_first_error_message
+from kidney.identity import get_request_identity
 
 class CreateDietPlanView(generics.CreateAPIView):
 
@@ -79,7 +80,7 @@ class GetPatientHealthStatusView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
 
         try:
-            user_id = get_token_user_id(request)
+            user_id = get_request_identity(request).user_id
 
             diet_plan = DietPlan.objects.filter(patient=user_id).first()
 
@@ -118,7 +119,7 @@ class GetPatientDietPlanLimitOneView(generics.RetrieveAPIView):
         }
         try:
             #get the user id of the current authenticated user
-            user_id = get_token_user_id(request)
+            user_id = get_request_identity(request).user_id
 
             #get the first diet plans of the authenticated user
             diet_plan = DietPlan.objects.filter(patient=user_id).first()
@@ -177,7 +178,7 @@ class GetPatientAllDietPlanView(generics.ListAPIView):
 
         try:
             #get the user id of the current authenticated user
-            user_id = get_token_user_id(request)
+            user_id = get_request_identity(request).user_id
 
             #get the diet plans of the authenticated user
             diet_plan = DietPlan.objects.filter(patient=user_id)
@@ -329,7 +330,7 @@ class GetPatientMedicationView(generics.RetrieveAPIView):
 
         try:
             
-            user_id = get_token_user_id(request)
+            user_id = get_request_identity(request).user_id
 
 
             if kwargs.get('pk') in (None, ""):
@@ -1,6 +1,20 @@
 from django.contrib import admin
-from .models import Notification
+from .models import Notification, EmailJob, RealtimeEvent
 
 @admin.register(Notification)
 class AdminNotification(admin.ModelAdmin):
-    readonly_fields = ('created_at',)
\ No newline at end of file
+    readonly_fields = ('created_at',)
+
+
+@admin.register(EmailJob)
+class AdminEmailJob(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(RealtimeEvent)
+class AdminRealtimeEvent(admin.ModelAdmin):
+    list_display = ('group', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,169 @@
+from datetime import timedelta
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import EmailJob
+
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30  #delay before the first retry, doubled on every failed attempt
+MAX_BACKOFF_SECONDS = 3600
+#how long a worker owns the jobs it claimed, a job is claimed again if the worker dies before updating it
+SENDING_LEASE_SECONDS = 300
+
+
+def enqueue_email(subject, body, recipient_list, html_body='', expires_in=None):
+    """
+        Queues an email to be sent by the send_queued_emails worker.
+
+        The job is created once the current transaction commits, so the request never
+        waits on SMTP and no email is sent for a transaction that was rolled back.
+
+        Args:
+            expires_in (int): Seconds after which the email isn't sent anymore (e.g, the otp validity).
+    """
+    expires_at = timezone.now() + timedelta(seconds=expires_in) if expires_in else None
+
+    transaction.on_commit(lambda: EmailJob.objects.create(
+        subject=subject,
+        body=body or '',
+        html_body=html_body or '',
+        recipients=list(recipient_list),
+        expires_at=expires_at,
+    ))
+
+
+def get_retry_delay(attempts):
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def clear_content(job):
+    #the content can hold otps and generated passwords, it isn't kept once the job is done
+    job.body = ''
+    job.html_body = ''
+
+
+def mark_failed(job, error, max_attempts):
+    job.attempts += 1
+    job.last_error = str(error)
+    job.next_attempt_at = timezone.now() + get_retry_delay(job.attempts)
+    job.status = 'failed' if job.attempts >= max_attempts else 'pending'
+
+
+def mark_email_failed(job, error, max_attempts):
+    mark_failed(job, error, max_attempts)
+
+    #the retry would come after the email expired
+    if job.status == 'pending' and job.expires_at and job.next_attempt_at >= job.expires_at:
+        job.status = 'expired'
+
+    if job.status != 'pending':
+        clear_content(job)
+
+
+def mark_sent(job):
+    job.attempts += 1
+    job.status = 'sent'
+    job.sent_at = timezone.now()
+    job.last_error = ''
+    clear_content(job)
+
+
+def mark_expired(job):
+    job.status = 'expired'
+    clear_content(job)
+
+
+def claim_email_batch(batch_size):
+    """
+        Claims the next due emails for this worker and commits the claim.
+
+        A claimed job is 'sending' until its lease ends, so other workers skip it while
+        this one talks to SMTP outside of any transaction.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        #skip rows another worker has already locked, a sending job whose lease ended is claimed again
+        jobs = list(EmailJob.objects.select_for_update(skip_locked=True).filter(
+            status__in=['pending', 'sending'],
+            next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id')[:batch_size])
+
+        for job in jobs:
+            job.status = 'sending'
+            job.next_attempt_at = now + timedelta(seconds=SENDING_LEASE_SECONDS)
+            job.updated_at = now
+
+        EmailJob.objects.bulk_update(jobs, ['status', 'next_attempt_at', 'updated_at'])
+
+    return jobs
+
+
+def send_email_batch(batch_size=50, max_attempts=MAX_ATTEMPTS):
+    """
+        Sends the next batch of due emails over a single SMTP connection.
+
+        Returns:
+            tuple: The number of sent and failed emails.
+    """
+    sent = failed = 0
+
+    jobs = claim_email_batch(batch_size)
+
+    if not jobs:
+        return sent, failed
+
+    now = timezone.now()
+    due_jobs = []
+
+    for job in jobs:
+        if job.expires_at and job.expires_at <= now:
+            mark_expired(job)
+        else:
+            due_jobs.append(job)
+
+    if due_jobs:
+        connection = get_connection(fail_silently=False)
+
+        try:
+            connection.open()
+        except Exception as e:
+            #the smtp server is unreachable, retry the whole batch later
+            for job in due_jobs:
+                mark_email_failed(job, e, max_attempts)
+            failed = len(due_jobs)
+        else:
+            try:
+                for job in due_jobs:
+                    email = EmailMultiAlternatives(
+                        subject=job.subject,
+                        body=job.body,
+                        to=job.recipients,
+                        connection=connection,
+                    )
+
+                    if job.html_body:
+                        email.attach_alternative(job.html_body, "text/html")
+
+                    try:
+                        email.send(fail_silently=False)
+                    except Exception as e:
+                        mark_email_failed(job, e, max_attempts)
+                        failed += 1
+                    else:
+                        mark_sent(job)
+                        sent += 1
+            finally:
+                connection.close()
+
+    #bulk_update doesn't apply auto_now
+    now = timezone.now()
+    for job in jobs:
+        job.updated_at = now
+
+    EmailJob.objects.bulk_update(
+        jobs,
+        ['attempts', 'status', 'sent_at', 'body', 'html_body', 'last_error', 'next_attempt_at', 'updated_at']
+    )
+
+    return sent, failed
@@ -0,0 +1,51 @@
+from pathlib import Path
+from django.template import Context, Engine
+
+EMAIL_TEMPLATES_DIR = Path(__file__).resolve().parent / 'templates' / 'emails'
+
+#a single engine shared by every email, separate from the site templates
+engine = Engine(dirs=[str(EMAIL_TEMPLATES_DIR)], autoescape=True)
+
+#every template is read and compiled once when the module is imported
+EMAIL_TEMPLATES = {
+    path.stem: engine.get_template(path.name)
+    for path in sorted(EMAIL_TEMPLATES_DIR.glob('*.html'))
+}
+
+
+def render_email(template_name, context):
+    """
+        Renders a precompiled email template.
+
+        Args:
+            template_name (str): The template file name without the extension (e.g, 'otp').
+            context (dict): The values used by the template.
+
+        Returns:
+            str: The rendered html.
+    """
+    return EMAIL_TEMPLATES[template_name].render(Context(context))
+
+
+def render_bulk_emails(template_name, contexts, shared_context=None):
+    """
+        Renders one personalized email per context in a single pass.
+
+        Args:
+            template_name (str): The template file name without the extension.
+            contexts (list): One dict of per-recipient values per email.
+            shared_context (dict): Values shared by every email (e.g, the news event).
+
+        Returns:
+            list: The rendered html of every email, in the same order as the contexts.
+    """
+    template = EMAIL_TEMPLATES[template_name]
+    context = Context(shared_context or {})
+
+    rendered = []
+    for recipient_context in contexts:
+        #push the recipient values on top of the shared ones, then pop them for the next email
+        with context.push(recipient_context):
+            rendered.append(template.render(context))
+
+    return rendered
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from app_notification.realtime_outbox import dispatch_realtime_batch, MAX_ATTEMPTS
+
+
+class Command(BaseCommand):
+    help = "Sends the queued realtime events to the channel layer in batches, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument('--interval', type=float, default=1, help="Seconds to wait when the outbox is empty.")
+        parser.add_argument('--once', action='store_true', help="Send the due events and exit.")
+
+    def handle(self, *args, **options):
+
+        while True:
+            sent, failed = dispatch_realtime_batch(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts']
+            )
+
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} realtime events, {failed} failed")
+
+            #keep draining while full batches are coming back
+            if sent + failed >= options['batch_size']:
+                continue
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
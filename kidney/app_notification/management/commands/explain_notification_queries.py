@@ -0,0 +1,17 @@
+import uuid
+from app_notification.models import Notification
+from kidney.query_plans import ExplainQueriesCommand
+
+
+class Command(ExplainQueriesCommand):
+    help = "Runs EXPLAIN on the hot notification queries and reports whether each one uses an index."
+
+    def get_hot_queries(self):
+        user_id = uuid.uuid4()
+
+        return [
+            ("patient notifications", Notification.objects.filter(
+                appointment__user=user_id,
+                appointment__status__in=['approved', 'cancelled', 'rescheduled']
+            )),
+        ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_notification', '0006_emailjob_expires_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='realtimeevent',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
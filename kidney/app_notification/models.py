@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from kidney.models import TimestampModel
 from app_appointment.models import Appointment
 
@@ -11,3 +12,61 @@ class Notification(TimestampModel):
 
     def __str__(self):
         return f"{self.appointment.user.username}"
+
+
+class EmailJob(TimestampModel):
+
+    email_status = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=email_status, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    #when a sending job is claimed, the end of the worker's lease
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    #an email that is useless once this passes (e.g, an otp) is never sent after it
+    expires_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            #jobs the worker picks up next
+            models.Index(fields=['status', 'next_attempt_at'], name='emailjob_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
+
+
+class RealtimeEvent(TimestampModel):
+
+    event_status = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('failed', 'Failed'),
+    ]
+
+    group = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=event_status, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            #events the dispatcher picks up next
+            models.Index(fields=['status', 'next_attempt_at'], name='realtimeevent_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.payload.get('type')} to {self.group} ({self.status})"
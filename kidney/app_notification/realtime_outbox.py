@@ -0,0 +1,144 @@
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import RealtimeEvent
+
+MAX_ATTEMPTS = 5
+#a realtime event is only worth sending soon after the change it announces, retries stay short
+BACKOFF_SECONDS = 1  #delay before the first retry, doubled on every failed attempt
+MAX_BACKOFF_SECONDS = 60
+#how long a worker owns the events it claimed, they are claimed again if the worker dies before updating them
+SENDING_LEASE_SECONDS = 30
+
+
+def enqueue_realtime_event(group, event):
+    """
+        Queues a channel layer event to be sent to a group by the dispatch_realtime_events worker.
+
+        Call it inside the transaction of the change the event announces, the event is
+        only sent if that change commits and the request never waits on the channel layer.
+    """
+    return RealtimeEvent.objects.create(group=group, payload=event)
+
+
+def get_retry_delay(attempts):
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def mark_failed(event, error, max_attempts):
+    event.attempts += 1
+    event.last_error = str(error)
+    event.next_attempt_at = timezone.now() + get_retry_delay(event.attempts)
+    event.status = 'failed' if event.attempts >= max_attempts else 'pending'
+
+
+async def send_events(channel_layer, events):
+    """
+        Sends the events to their groups, the groups concurrently and the events of a group in order.
+
+        A group stops at its first event that couldn't be sent, the ones after it wait for its retry.
+
+        Returns:
+            tuple: The ids of the sent events and the error of every event that couldn't be sent, keyed by the event id.
+    """
+    groups = defaultdict(list)
+    for event in events:
+        groups[event.group].append(event)
+
+    sent = set()
+    errors = {}
+
+    async def send_group(group, group_events):
+        for event in group_events:
+            try:
+                await channel_layer.group_send(group, event.payload)
+            except Exception as e:
+                errors[event.id] = e
+                return
+            sent.add(event.id)
+
+    await asyncio.gather(*(send_group(group, group_events) for group, group_events in groups.items()))
+
+    return sent, errors
+
+
+def claim_realtime_batch(batch_size):
+    """
+        Claims the next due realtime events for this worker and commits the claim.
+
+        A claimed event is 'sending' until its lease ends, so other workers skip it while this
+        one talks to the channel layer outside of any transaction. An event waiting for a retry
+        or claimed by another worker holds back the later events of its group.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        #skip rows another worker has already locked, a sending event whose lease ended is claimed again
+        events = list(RealtimeEvent.objects.select_for_update(skip_locked=True).filter(
+            status__in=['pending', 'sending'],
+            next_attempt_at__lte=now
+        ).exclude(
+            Exists(RealtimeEvent.objects.filter(
+                group=OuterRef('group'),
+                status__in=['pending', 'sending'],
+                next_attempt_at__gt=now,
+                id__lt=OuterRef('id')
+            ))
+        ).order_by('id')[:batch_size])
+
+        for event in events:
+            event.status = 'sending'
+            event.next_attempt_at = now + timedelta(seconds=SENDING_LEASE_SECONDS)
+            event.updated_at = now
+
+        RealtimeEvent.objects.bulk_update(events, ['status', 'next_attempt_at', 'updated_at'])
+
+    return events
+
+
+def dispatch_realtime_batch(batch_size=100, max_attempts=MAX_ATTEMPTS):
+    """
+        Sends the next batch of due realtime events to the channel layer.
+
+        Sent events are deleted, the table only keeps what is still due and what failed. An event
+        waiting for a retry holds back the later events of its group so they arrive in order.
+
+        Returns:
+            tuple: The number of sent and failed events.
+    """
+    events = claim_realtime_batch(batch_size)
+
+    if not events:
+        return 0, 0
+
+    try:
+        sent, errors = async_to_sync(send_events)(get_channel_layer(), events)
+    except Exception as e:
+        #the channel layer is unreachable, retry the whole batch later
+        sent, errors = set(), {event.id: e for event in events}
+
+    #bulk_update doesn't apply auto_now
+    now = timezone.now()
+    failed_events = []
+    unsent_events = [event for event in events if event.id not in sent]
+
+    for event in unsent_events:
+        if event.id in errors:
+            mark_failed(event, errors[event.id], max_attempts)
+            failed_events.append(event)
+        else:
+            #held back behind a failed event of its group, it goes out after that one
+            event.status = 'pending'
+            event.next_attempt_at = now
+        event.updated_at = now
+
+    with transaction.atomic():
+        RealtimeEvent.objects.bulk_update(unsent_events, ['attempts', 'status', 'last_error', 'next_attempt_at', 'updated_at'])
+        RealtimeEvent.objects.filter(id__in=sent).delete()
+
+    return len(sent), len(failed_events)
@@ -1,3 +1,230 @@
-from django.test import TestCase
+from io import StringIO
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from app_authentication.models import OTP_VALIDITY_SECONDS
+from kidney.utils import send_otp_to_email
+from .models import EmailJob, RealtimeEvent
+from .email_queue import claim_email_batch
+from .realtime_outbox import enqueue_realtime_event, claim_realtime_batch, dispatch_realtime_batch
+from .email_templates import EMAIL_TEMPLATES, render_email, render_bulk_emails
 
-# Create your tests here.
+
+class FailingEmailBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise SMTPException("Connection unexpectedly closed")
+
+
+class EmailQueueTest(TestCase):
+
+    def queue_otp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            send_otp_to_email(
+                subject='Your OTP Code',
+                message='Your OTP is 123456',
+                recipient_list=['patient@kidneycare.com'],
+                otp='123456',
+                expires_in=OTP_VALIDITY_SECONDS
+            )
+
+    def test_email_is_queued_and_sent_by_the_worker(self):
+        self.queue_otp()
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailJob.objects.get().status, 'pending')
+
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+
+        job = EmailJob.objects.get()
+        self.assertEqual(job.status, 'sent')
+        self.assertEqual(job.html_body, '')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['patient@kidneycare.com'])
+        self.assertIn('123456', mail.outbox[0].alternatives[0][0])
+
+    def test_failed_email_is_retried_with_backoff(self):
+        self.queue_otp()
+
+        with override_settings(EMAIL_BACKEND='app_notification.tests.FailingEmailBackend'):
+            call_command('send_queued_emails', once=True, max_attempts=2, stdout=StringIO())
+
+            job = EmailJob.objects.get()
+            self.assertEqual(job.status, 'pending')
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.next_attempt_at, timezone.now())
+
+            #not due yet, the worker leaves it alone
+            call_command('send_queued_emails', once=True, max_attempts=2, stdout=StringIO())
+            self.assertEqual(EmailJob.objects.get().attempts, 1)
+
+            EmailJob.objects.update(next_attempt_at=timezone.now())
+            call_command('send_queued_emails', once=True, max_attempts=2, stdout=StringIO())
+
+        job = EmailJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.html_body, '')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_expired_otp_is_not_sent(self):
+        self.queue_otp()
+        job = EmailJob.objects.get()
+        #the email and the queue use the validity the otp is checked against
+        self.assertIn('3 minutes', job.html_body)
+        self.assertAlmostEqual((job.expires_at - job.created_at).total_seconds(), OTP_VALIDITY_SECONDS, delta=5)
+
+        EmailJob.objects.update(expires_at=timezone.now())
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+
+        job = EmailJob.objects.get()
+        self.assertEqual(job.status, 'expired')
+        self.assertEqual(job.html_body, '')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_otp_isnt_retried_past_its_expiry(self):
+        self.queue_otp()
+        EmailJob.objects.update(expires_at=timezone.now() + timedelta(seconds=10))
+
+        with override_settings(EMAIL_BACKEND='app_notification.tests.FailingEmailBackend'):
+            call_command('send_queued_emails', once=True, stdout=StringIO())
+
+        job = EmailJob.objects.get()
+        self.assertEqual(job.status, 'expired')
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.html_body, '')
+
+    def test_job_claimed_by_a_dead_worker_is_sent_once_the_lease_ends(self):
+        self.queue_otp()
+
+        claimed = claim_email_batch(batch_size=10)
+        self.assertEqual(EmailJob.objects.get().status, 'sending')
+
+        #still leased to the first worker
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+        EmailJob.objects.filter(id=claimed[0].id).update(next_attempt_at=timezone.now())
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+
+        self.assertEqual(EmailJob.objects.get().status, 'sent')
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class FailingChannelLayer:
+
+    async def group_send(self, group, message):
+        raise ConnectionError("Redis is unreachable")
+
+
+class RecordingChannelLayer:
+
+    def __init__(self, failing_types=()):
+        self.failing_types = set(failing_types)
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if message["type"] in self.failing_types:
+            raise ConnectionError("Redis is unreachable")
+        self.sent.append((group, message["type"]))
+
+
+class RealtimeOutboxTest(TestCase):
+
+    def dispatch(self, channel_layer):
+        with mock.patch('app_notification.realtime_outbox.get_channel_layer', return_value=channel_layer):
+            return dispatch_realtime_batch()
+
+    def test_failed_event_holds_back_the_rest_of_its_group(self):
+        enqueue_realtime_event("appointment_user_1", {"type": "first"})
+        enqueue_realtime_event("appointment_user_1", {"type": "second"})
+        enqueue_realtime_event("appointment_user_2", {"type": "other"})
+
+        channel_layer = RecordingChannelLayer(failing_types=['first'])
+        self.assertEqual(self.dispatch(channel_layer), (1, 1))
+        self.assertEqual(channel_layer.sent, [("appointment_user_2", "other")])
+
+        #the second event is due but waits for the first one's retry
+        self.assertEqual(self.dispatch(channel_layer), (0, 0))
+
+        RealtimeEvent.objects.filter(payload__type='first').update(next_attempt_at=timezone.now())
+        channel_layer = RecordingChannelLayer()
+        self.assertEqual(self.dispatch(channel_layer), (2, 0))
+        self.assertEqual(channel_layer.sent, [("appointment_user_1", "first"), ("appointment_user_1", "second")])
+        self.assertFalse(RealtimeEvent.objects.exists())
+
+    def test_events_are_claimed_before_they_are_sent(self):
+        enqueue_realtime_event("appointment_user_1", {"type": "upcoming_appointments"})
+        statuses = []
+
+        class ClaimCheckingChannelLayer:
+            async def group_send(self, group, message):
+                statuses.append(await RealtimeEvent.objects.values_list('status', flat=True).aget())
+
+        self.assertEqual(self.dispatch(ClaimCheckingChannelLayer()), (1, 0))
+        self.assertEqual(statuses, ['sending'])
+        self.assertFalse(RealtimeEvent.objects.exists())
+
+    def test_event_claimed_by_a_dead_worker_is_sent_once_the_lease_ends(self):
+        enqueue_realtime_event("appointment_user_1", {"type": "first"})
+        enqueue_realtime_event("appointment_user_1", {"type": "second"})
+        claim_realtime_batch(1)
+
+        #the claimed event holds back the rest of its group until its lease ends
+        channel_layer = RecordingChannelLayer()
+        self.assertEqual(self.dispatch(channel_layer), (0, 0))
+
+        RealtimeEvent.objects.filter(payload__type='first').update(next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatch(channel_layer), (2, 0))
+        self.assertEqual(channel_layer.sent, [("appointment_user_1", "first"), ("appointment_user_1", "second")])
+
+    def test_failed_event_is_retried_with_backoff(self):
+        enqueue_realtime_event("appointment_user_1", {"type": "upcoming_appointments"})
+
+        with mock.patch('app_notification.realtime_outbox.get_channel_layer', return_value=FailingChannelLayer()):
+            call_command('dispatch_realtime_events', once=True, max_attempts=2, stdout=StringIO())
+
+            event = RealtimeEvent.objects.get()
+            self.assertEqual(event.status, 'pending')
+            self.assertEqual(event.attempts, 1)
+            self.assertIn('Redis is unreachable', event.last_error)
+            self.assertGreater(event.next_attempt_at, timezone.now())
+
+            RealtimeEvent.objects.update(next_attempt_at=timezone.now())
+            call_command('dispatch_realtime_events', once=True, max_attempts=2, stdout=StringIO())
+
+        event = RealtimeEvent.objects.get()
+        self.assertEqual(event.status, 'failed')
+        self.assertEqual(event.attempts, 2)
+
+
+class EmailTemplateTest(TestCase):
+
+    def test_templates_are_compiled_once(self):
+        template = EMAIL_TEMPLATES['otp']
+
+        render_email('otp', {'otp': '123456', 'recipient': 'patient@kidneycare.com'})
+
+        self.assertIs(EMAIL_TEMPLATES['otp'], template)
+
+    def test_bulk_render_personalizes_every_email(self):
+        news_event = {'title': 'Kidney Health Month', 'category': 'event', 'description': 'Free screening <b>today</b>'}
+        recipients = ['patient1@kidneycare.com', 'patient2@kidneycare.com']
+
+        emails = render_bulk_emails(
+            'news_event',
+            [{'recipient': recipient} for recipient in recipients],
+            shared_context={'news_event': news_event}
+        )
+
+        self.assertEqual(len(emails), 2)
+        for recipient, html in zip(recipients, emails):
+            self.assertIn(f"Hello, {recipient}", html)
+            self.assertIn('Kidney Health Month', html)
+            self.assertIn('&lt;b&gt;today&lt;/b&gt;', html)
+        self.assertNotIn(recipients[0], emails[1])
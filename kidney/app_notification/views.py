@@ -1,5 +1,6 @@
 from rest_framework import generics, status
-from kidney.utils import ResponseMessageUtils, extract_first_error_message, get_token_user_id
+from kidney.utils import ResponseMessageUtils, extract_first_error_message
+from kidney.identity import get_request_identity
 from .serializers import NotificationsInPatientSerializer
 from rest_framework.permissions import IsAuthenticated
 from .models import Notification
@@ -17,7 +18,7 @@ class NotificationsInPatientView(generics.ListAPIView):
         try:
 
             #get the user id from the token
-            user_id = get_token_user_id(request)
+            user_id = get_request_identity(request).user_id
 
             notification = self.get_queryset().filter(appointment__user=user_id, appointment__status__in=['approved', 'cancelled', 'rescheduled'])
 
@@ -1,6 +1,12 @@
 from django.contrib import admin
-from .models import Schedule
+from .models import Schedule, SlotCounter
 
 @admin.register(Schedule)
 class AdminSchedule(admin.ModelAdmin):
     pass
+
+
+@admin.register(SlotCounter)
+class AdminSlotCounter(admin.ModelAdmin):
+    list_display = ('date', 'time', 'booked')
+    list_filter = ('date',)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from app_schedule.slots import rebuild_slot_counters
+
+
+class Command(BaseCommand):
+    help = "Recounts the booked appointments of every time slot, e.g. after appointments were changed outside the API."
+
+    def handle(self, *args, **options):
+        total = rebuild_slot_counters()
+        self.stdout.write(f"Rebuilt the counters of {total} booked slots")
@@ -8,3 +8,27 @@ class Schedule(TimestampModel):
     start_time = models.TimeField(null=True, blank=True)
     end_time = models.TimeField(null=True, blank=True)
     date_created = models.DateField(null=True, blank=True)
+    #appointments a single time slot can take, no limit when empty
+    slot_capacity = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        from .slots import invalidate_schedule
+
+        super().save(*args, **kwargs)
+        #every process rebuilds its slot grid from the new schedule
+        invalidate_schedule()
+
+
+class SlotCounter(models.Model):
+    date = models.DateField()
+    time = models.TimeField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            #one counter per slot, also serves the date range reads of the availability
+            models.UniqueConstraint(fields=['date', 'time'], name='slotcounter_date_time_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.time}: {self.booked} booked"
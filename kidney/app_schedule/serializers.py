@@ -1,8 +1,7 @@
 from rest_framework import serializers
 from .models import Schedule
+from .slots import SlotGrid, SCHEDULE_ID, MAX_AVAILABILITY_DAYS
 from kidney.utils import is_field_empty
-from .models import Schedule
-from datetime import datetime, timedelta
 from django.utils import timezone
 
 
@@ -13,10 +12,11 @@ class CreateScheduleSerializer(serializers.ModelSerializer):
     )
     start_time = serializers.TimeField(format='%I:%M %p', input_formats=['%I:%M %p'])
     end_time = serializers.TimeField(format='%I:%M %p', input_formats=['%I:%M %p'])
+    slot_capacity = serializers.IntegerField(min_value=1, required=False, allow_null=True)
 
     class Meta:
         model = Schedule
-        fields = ['available_days', 'start_time', 'end_time']
+        fields = ['available_days', 'start_time', 'end_time', 'slot_capacity']
 
 
     def validate(self, attrs):
@@ -32,11 +32,12 @@ class CreateScheduleSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
 
         return Schedule.objects.update_or_create(
-            id=3,
+            id=SCHEDULE_ID,
             defaults={
                 "available_days": validated_data.get('available_days', []),
                 "start_time": validated_data.get('start_time', None),
                 "end_time": validated_data.get('end_time', None),
+                "slot_capacity": validated_data.get('slot_capacity', None),
                 "date_created": timezone.now,
             }
         )
@@ -49,34 +50,35 @@ class GetScheduleSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Schedule
-        fields = ['id', 'start_time', 'end_time', 'available_days']
+        fields = ['id', 'start_time', 'end_time', 'available_days', 'slot_capacity']
 
 
     def to_representation(self, instance):
 
         data = super().to_representation(instance)
 
-        #convert to datetime objects
-        schedule_start_time = datetime.strptime(data.pop('start_time'), '%I:%M %p')
-        schedule_end_time = datetime.strptime(data.pop('end_time'), '%I:%M %p')
+        data.pop('start_time')
+        data.pop('end_time')
+
+        #the hourly slots as 12-hour strings
+        data["available_time"] = list(SlotGrid.from_schedule(instance).labels)
 
-        #generate time interval every hour
-        interval = timedelta(hours=1)
-        #starting time of our schedule
-        current_time = schedule_start_time
+        return data
 
-        #slots for scheduled time
-        time_slots = [] 
 
-        while current_time <= schedule_end_time:
-            #add the current_time to time slots
-            time_slots.append(current_time)
-            #adding 1hr interval to the current_time
-            current_time += interval
+class GetAvailabilitySerializer(serializers.Serializer):
 
-        #format the time to 12-hour strings
-        formatted_slots = [slot.strftime("%I:%M %p") for slot in time_slots]
+    start_date = serializers.DateField(input_formats=['%m/%d/%Y'])
+    end_date = serializers.DateField(input_formats=['%m/%d/%Y'])
+
+    def validate(self, attrs):
 
-        data["available_time"] = formatted_slots
+        days = (attrs['end_date'] - attrs['start_date']).days + 1
 
-        return data
\ No newline at end of file
+        if days < 1:
+            raise serializers.ValidationError({"message": "The end date must not be before the start date"})
+
+        if days > MAX_AVAILABILITY_DAYS:
+            raise serializers.ValidationError({"message": f"The availability covers at most {MAX_AVAILABILITY_DAYS} days"})
+
+        return attrs
@@ -0,0 +1,234 @@
+import uuid
+from datetime import datetime, timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from .models import Schedule, SlotCounter
+
+SCHEDULE_ID = 3  #the clinic has a single schedule
+SCHEDULE_VERSION_KEY = 'schedule:version'
+SLOT_INTERVAL = timedelta(hours=1)
+MAX_AVAILABILITY_DAYS = 62  #days a single availability request can cover
+#an appointment with one of these statuses gives its slot back
+RELEASED_STATUSES = ('cancelled',)
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+#the slot grid of this process and the schedule version it was built from
+loaded_grid = (None, None)
+
+
+class SlotGrid:
+    """
+        The bookable time slots of the schedule, built once per schedule version.
+
+        A slot starts every SLOT_INTERVAL from the start time up to and including the end time,
+        on the schedule's available days only.
+    """
+
+    def __init__(self, start_time=None, end_time=None, capacity=None, available_days=None):
+        slots = []
+
+        if start_time and end_time:
+            current_time = datetime.combine(datetime.min, start_time)
+            end = datetime.combine(datetime.min, end_time)
+
+            while current_time <= end:
+                slots.append(current_time.time())
+                current_time += SLOT_INTERVAL
+
+        self.slots = tuple(slots)
+        self.slot_set = frozenset(slots)
+        self.labels = tuple(slot.strftime('%I:%M %p') for slot in slots)
+        self.capacity = capacity
+        self.open_weekdays = get_open_weekdays(available_days)
+
+    @classmethod
+    def from_schedule(cls, schedule):
+        if not schedule:
+            return cls()
+
+        return cls(schedule.start_time, schedule.end_time, schedule.slot_capacity, schedule.available_days)
+
+    def is_open(self, date):
+        return self.open_weekdays is None or date.weekday() in self.open_weekdays
+
+    def has_slot(self, time):
+        return time in self.slot_set
+
+    def get_remaining(self, booked):
+        """Returns how many more appointments a slot with booked appointments takes, None if there is no limit."""
+        return None if self.capacity is None else max(self.capacity - booked, 0)
+
+    def is_available(self, booked):
+        return self.capacity is None or booked < self.capacity
+
+
+def get_open_weekdays(available_days):
+    """
+        Returns the weekday numbers (monday is 0) of the available days, e.g. ["Monday", "wed"].
+
+        Returns None, every day is open, when the schedule doesn't list any day.
+    """
+    weekdays = frozenset(
+        index
+        for day in available_days or []
+        for index, weekday in enumerate(WEEKDAYS)
+        if str(day).strip().lower()[:3] == weekday[:3]
+    )
+
+    return weekdays or None
+
+
+def invalidate_schedule():
+    """Makes every process rebuild its slot grid once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(SCHEDULE_VERSION_KEY, uuid.uuid4().hex, timeout=None))
+
+
+def get_schedule_version():
+    version = cache.get(SCHEDULE_VERSION_KEY)
+
+    if version is None:
+        #a random version, a flushed cache can't bring back one a process already built its grid from
+        cache.add(SCHEDULE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(SCHEDULE_VERSION_KEY)
+
+    return version
+
+
+def get_slot_grid():
+    """Returns the slot grid of the current schedule, the schedule is only read again after it changed."""
+    global loaded_grid
+
+    version = get_schedule_version()
+    loaded_version, grid = loaded_grid
+
+    if grid is None or loaded_version != version:
+        grid = SlotGrid.from_schedule(Schedule.objects.filter(id=SCHEDULE_ID).first())
+        loaded_grid = (version, grid)
+
+    return grid
+
+
+def get_slot_key(date, time, status):
+    """Returns the (date, time) slot an appointment holds, None if it doesn't hold one."""
+    if date is None or time is None or status in RELEASED_STATUSES:
+        return None
+
+    return date, time
+
+
+def is_slot_available(date, time):
+    grid = get_slot_grid()
+
+    if grid.capacity is None:
+        return True
+
+    booked = SlotCounter.objects.filter(date=date, time=time).values_list('booked', flat=True).first()
+
+    return grid.is_available(booked or 0)
+
+
+def reserve_slot(date, time):
+    """
+        Books one place in a slot with a single conditional update, the counter row is the only row locked.
+
+        Returns:
+            bool: False if the slot is full.
+    """
+    capacity = get_slot_grid().capacity
+    counters = SlotCounter.objects.filter(date=date, time=time)
+
+    if capacity is not None:
+        counters = counters.filter(booked__lt=capacity)
+
+    if counters.update(booked=F('booked') + 1):
+        return True
+
+    #the first booking of the slot creates its counter, or the slot is full
+    SlotCounter.objects.bulk_create([SlotCounter(date=date, time=time)], ignore_conflicts=True)
+
+    return bool(counters.update(booked=F('booked') + 1))
+
+
+def release_slot(date, time):
+    SlotCounter.objects.filter(date=date, time=time, booked__gt=0).update(booked=F('booked') - 1)
+
+
+def change_slot(old_slot, new_slot):
+    """
+        Moves an appointment's booking between two slot keys, either can be None.
+
+        Returns:
+            bool: False if the new slot is full, nothing is changed then.
+    """
+    if old_slot == new_slot:
+        return True
+
+    if new_slot and not reserve_slot(*new_slot):
+        return False
+
+    if old_slot:
+        release_slot(*old_slot)
+
+    return True
+
+
+def get_availability(start_date, end_date):
+    """
+        Returns the slots of every open date in the range with their bookings, read in a single query.
+
+        Returns:
+            list: A {"date", "slots"} dict per date, oldest first, the days the clinic is closed are left out.
+    """
+    grid = get_slot_grid()
+
+    booked_slots = {
+        (slot_date, slot_time): booked
+        for slot_date, slot_time, booked in SlotCounter.objects.filter(
+            date__range=(start_date, end_date),
+            booked__gt=0
+        ).values_list('date', 'time', 'booked')
+    }
+
+    availability = []
+    current_date = start_date
+
+    while current_date <= end_date:
+        if not grid.is_open(current_date):
+            current_date += timedelta(days=1)
+            continue
+
+        slots = []
+
+        for slot, label in zip(grid.slots, grid.labels):
+            booked = booked_slots.get((current_date, slot), 0)
+            slots.append({
+                "time": label,
+                "booked": booked,
+                "remaining": grid.get_remaining(booked),
+                "available": grid.is_available(booked),
+            })
+
+        availability.append({"date": current_date.strftime('%m/%d/%Y'), "slots": slots})
+        current_date += timedelta(days=1)
+
+    return availability
+
+
+def rebuild_slot_counters():
+    """Recounts the bookings of every slot from the appointments in a single query, returns how many slots are booked."""
+    from app_appointment.models import Appointment
+
+    booked_slots = Appointment.objects.filter(
+        date__isnull=False,
+        time__isnull=False
+    ).exclude(status__in=RELEASED_STATUSES).values('date', 'time').annotate(booked=Count('id')).order_by()
+
+    with transaction.atomic():
+        SlotCounter.objects.all().delete()
+        SlotCounter.objects.bulk_create(
+            [SlotCounter(date=slot['date'], time=slot['time'], booked=slot['booked']) for slot in booked_slots.iterator()],
+            batch_size=1000
+        )
+
+    return SlotCounter.objects.count()
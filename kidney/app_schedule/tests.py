@@ -1,3 +1,116 @@
+from datetime import date, time
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from app_authentication.models import User
+from app_appointment.models import Appointment
+from .models import Schedule, SlotCounter
+from .slots import get_slot_grid
 
-# Create your tests here.
+
+class SlotAvailabilityTest(TestCase):
+
+    def setUp(self):
+        #drop the schedule version of the previous test
+        cache.clear()
+        self.client = APIClient()
+        self.schedule = Schedule.objects.create(id=3, start_time=time(8, 0), end_time=time(17, 0), slot_capacity=1)
+        self.patient = self.create_patient('patient@kidneycare.com')
+
+    def create_patient(self, username):
+        return User.objects.create_user(username=username, password='password123', role='patient')
+
+    def request(self, method, user, url, data=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return getattr(self.client, method)(url, data, format='json')
+
+    def book(self, user, slot_time="01:00 PM"):
+        return self.request('post', user, '/patient/create-appointment/', {"date": "01/06/2025", "time": slot_time})
+
+    def get_booked(self, slot_date, slot_time):
+        return SlotCounter.objects.filter(date=slot_date, time=slot_time).values_list('booked', flat=True).first()
+
+    def test_slot_grid_is_rebuilt_only_after_the_schedule_changes(self):
+        grid = get_slot_grid()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_slot_grid(), grid)
+
+        self.assertEqual(len(grid.slots), 10)
+        self.assertTrue(grid.has_slot(time(13, 0)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.schedule.end_time = time(12, 0)
+            self.schedule.save()
+
+        self.assertFalse(get_slot_grid().has_slot(time(13, 0)))
+
+    def test_full_slot_is_rejected_until_a_booking_is_cancelled(self):
+        self.assertEqual(self.book(self.patient).status_code, 201)
+        self.assertEqual(self.get_booked(date(2025, 1, 6), time(13, 0)), 1)
+
+        other_patient = self.create_patient('other@kidneycare.com')
+        response = self.book(other_patient)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["message"], "This time slot is already booked. Please choose different time.")
+
+        appointment = Appointment.objects.get(user=self.patient)
+        self.request('patch', self.patient, f'/patients/cancel-appointment/{appointment.id}/', {})
+
+        self.assertEqual(self.get_booked(date(2025, 1, 6), time(13, 0)), 0)
+        self.assertEqual(self.book(other_patient).status_code, 201)
+
+    def test_time_outside_the_schedule_is_rejected(self):
+        response = self.book(self.patient, slot_time="08:00 PM")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["message"], "This time is not available")
+
+    def test_reschedule_moves_the_booking(self):
+        self.book(self.patient)
+        appointment = Appointment.objects.get()
+
+        response = self.request('patch', self.patient, f'/patient/update-appointment/{appointment.id}/', {"date": "01/07/2025", "time": "09:00 AM"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_booked(date(2025, 1, 6), time(13, 0)), 0)
+        self.assertEqual(self.get_booked(date(2025, 1, 7), time(9, 0)), 1)
+
+    def test_availability_of_a_date_range(self):
+        self.book(self.patient)
+
+        response = self.request('get', self.patient, '/get/availability/', {"start_date": "01/06/2025", "end_date": "01/07/2025"})
+
+        self.assertEqual(response.status_code, 200)
+        dates = response.data["data"]["dates"]
+        self.assertEqual([day["date"] for day in dates], ["01/06/2025", "01/07/2025"])
+
+        slot = next(slot for slot in dates[0]["slots"] if slot["time"] == "01:00 PM")
+        self.assertEqual(slot, {"time": "01:00 PM", "booked": 1, "remaining": 0, "available": False})
+        self.assertTrue(all(slot["available"] for slot in dates[1]["slots"]))
+
+    def test_closed_days_are_not_bookable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.schedule.available_days = ['Monday', 'Wednesday']
+            self.schedule.save()
+
+        response = self.request('get', self.patient, '/get/availability/', {"start_date": "01/06/2025", "end_date": "01/08/2025"})
+        self.assertEqual([day["date"] for day in response.data["data"]["dates"]], ["01/06/2025", "01/08/2025"])
+
+        #01/07/2025 is a tuesday
+        response = self.request('post', self.patient, '/patient/create-appointment/', {"date": "01/07/2025", "time": "01:00 PM"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["message"], "This date is not available")
+
+    def test_rebuild_counts_the_appointments(self):
+        Appointment.objects.create(user=self.patient, date=date(2025, 1, 6), time=time(8, 0))
+        Appointment.objects.create(user=self.patient, date=date(2025, 1, 6), time=time(8, 0))
+        Appointment.objects.create(user=self.patient, date=date(2025, 1, 6), time=time(9, 0), status='cancelled')
+
+        call_command('rebuild_slot_counters', stdout=StringIO())
+
+        self.assertEqual(self.get_booked(date(2025, 1, 6), time(8, 0)), 2)
+        self.assertIsNone(self.get_booked(date(2025, 1, 6), time(9, 0)))
@@ -1,10 +1,12 @@
 from django.urls import path
 from .views import (
     CreateScheduleView,
-    GetScheduleView
+    GetScheduleView,
+    GetAvailabilityView
 )
 
 urlpatterns = [
     path('create/schedule/', CreateScheduleView.as_view(), name='create-schedule'),
     path('get/schedules/', GetScheduleView.as_view(), name='get-schedule'),
+    path('get/availability/', GetAvailabilityView.as_view(), name='get-availability'),
 ]
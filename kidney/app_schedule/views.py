@@ -1,11 +1,13 @@
 from django.shortcuts import render
 from .serializers import (
     CreateScheduleSerializer,
-    GetScheduleSerializer
+    GetScheduleSerializer,
+    GetAvailabilitySerializer
 )
 from rest_framework import status, generics
 from rest_framework.permissions import IsAuthenticated
 from .models import Schedule
+from .slots import SCHEDULE_ID, get_availability, get_slot_grid
 from kidney.utils import ResponseMessageUtils, extract_first_error_message
 
 class CreateScheduleView(generics.CreateAPIView):
@@ -36,7 +38,7 @@ class GetScheduleView(generics.ListAPIView):
     serializer_class = GetScheduleSerializer
 
     def get_queryset(self):
-        return Schedule.objects.get(id=3)
+        return Schedule.objects.get(id=SCHEDULE_ID)
 
     def get(self, request, *args, **kwargs):
 
@@ -54,4 +56,34 @@ class GetScheduleView(generics.ListAPIView):
             return ResponseMessageUtils(
                 message=f"Something went wrong while processing your request {e}",
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class GetAvailabilityView(generics.GenericAPIView):
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = GetAvailabilitySerializer
+
+    def get(self, request, *args, **kwargs):
+
+        try:
+
+            serializer = self.get_serializer(data=request.query_params)
+
+            if not serializer.is_valid():
+                return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
+
+            return ResponseMessageUtils(
+                message="Availability",
+                data={
+                    "slot_capacity": get_slot_grid().capacity,
+                    "dates": get_availability(serializer.validated_data['start_date'], serializer.validated_data['end_date'])
+                },
+                status_code=status.HTTP_200_OK
+            )
+
+        except Exception as e:
+            return ResponseMessageUtils(
+                message=f"Something went wrong while processing your request {e}",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
@@ -5,7 +5,8 @@ from .models import (
     TreatmentDetail,
     Prescription,
     PreDialysis,
-    PostDialysis
+    PostDialysis,
+    IntradialyticSeries
 )
 
 @admin.register(Treatment)
@@ -32,4 +33,6 @@ class AdminPredialysis(admin.ModelAdmin):
 class AdminPostdialysis(admin.ModelAdmin):
     pass
 
-
+@admin.register(IntradialyticSeries)
+class AdminIntradialyticSeries(admin.ModelAdmin):
+    pass
@@ -0,0 +1,177 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from django.db import transaction
+from .models import IntradialyticSeries
+from .vitals import get_lttb_indices
+
+CHANNELS = [channel for channel, _ in IntradialyticSeries.channels]
+MAX_BATCH_READINGS = 1000  #readings a single ingestion request can carry
+DEFAULT_WINDOW_POINTS = 300
+MAX_WINDOW_POINTS = 2000
+
+
+class MachineMismatchError(Exception):
+    """The readings come from another machine than the one the session runs on."""
+
+
+def pack(numbers):
+    """Packs numbers into little-endian float32 bytes."""
+    packed = array('f', numbers)
+
+    if sys.byteorder == 'big':
+        packed.byteswap()
+
+    return packed.tobytes()
+
+
+def get_view(blob):
+    """
+        Returns the float32 numbers of a packed blob as a sequence.
+
+        On little-endian hosts it's a memoryview over the blob, a number is only
+        decoded when it's read so a window of a long session stays cheap.
+    """
+    if sys.byteorder == 'big':
+        numbers = array('f', bytes(blob))
+        numbers.byteswap()
+        return numbers
+
+    return memoryview(blob).cast('B').cast('f')
+
+
+def to_float32(number):
+    """Rounds a number to the float32 it is stored as, so it can be compared with the stored offsets."""
+    return array('f', [number])[0]
+
+
+def merge_readings(series, late_offsets, late_values):
+    """
+        Inserts readings older than the channel's latest one at their place, returns how many were new.
+
+        A reading at the exact offset of a stored one is the same reading sent again and is skipped.
+    """
+    offsets = list(get_view(series.offsets))
+    values = list(get_view(series.values))
+    merged = 0
+
+    for offset, value in zip(late_offsets, late_values):
+        index = bisect_left(offsets, offset)
+
+        if index < len(offsets) and offsets[index] == offset:
+            continue
+
+        offsets.insert(index, offset)
+        values.insert(index, value)
+        merged += 1
+
+    if merged:
+        series.offsets = pack(offsets)
+        series.values = pack(values)
+
+    return merged
+
+
+def append_readings(appointment, machine_number, readings):
+    """
+        Appends a batch of readings to the session's channels, each channel row is read and written once.
+
+        The readings after a channel's last offset are appended to its blobs as they are. A delayed
+        reading is merged in at its place, and a reading at the exact offset of a stored one is
+        skipped, so a batch sent again after a timeout isn't stored twice.
+
+        Args:
+            readings (list): {"time", <channel>: value} dicts, a channel can be left out of a reading.
+
+        Returns:
+            int: The number of channel readings stored.
+    """
+    readings = sorted(readings, key=lambda reading: reading['time'])
+    started_at = readings[0]['time']
+    channels = [channel for channel in CHANNELS if any(reading.get(channel) is not None for reading in readings)]
+
+    with transaction.atomic():
+        #the first batch of a channel creates its row, the rows are then locked until the batch is stored
+        IntradialyticSeries.objects.bulk_create(
+            [
+                IntradialyticSeries(appointment=appointment, channel=channel, machine_number=machine_number, started_at=started_at)
+                for channel in channels
+            ],
+            ignore_conflicts=True
+        )
+
+        stored = 0
+
+        for series in IntradialyticSeries.objects.select_for_update().filter(appointment=appointment, channel__in=channels):
+            if series.machine_number != machine_number:
+                raise MachineMismatchError(series.machine_number)
+
+            last_offset = series.last_offset
+            new_offsets = []
+            new_values = []
+            late_offsets = []
+            late_values = []
+
+            for reading in readings:
+                value = reading.get(series.channel)
+
+                if value is None:
+                    continue
+
+                offset = to_float32((reading['time'] - series.started_at).total_seconds())
+
+                if last_offset is None or offset > last_offset:
+                    new_offsets.append(offset)
+                    new_values.append(value)
+                    last_offset = offset
+                elif not new_offsets:
+                    #the readings are sorted, only the ones before the first new reading can be late
+                    late_offsets.append(offset)
+                    late_values.append(value)
+
+            #the stored offsets are only decoded when a reading arrives late
+            added = merge_readings(series, late_offsets, late_values) if late_offsets else 0
+
+            if not new_offsets and not added:
+                continue
+
+            series.offsets = bytes(series.offsets) + pack(new_offsets)
+            series.values = bytes(series.values) + pack(new_values)
+            series.readings += len(new_offsets) + added
+            series.last_offset = last_offset
+            series.save(update_fields=['offsets', 'values', 'readings', 'last_offset', 'updated_at'])
+            stored += len(new_offsets) + added
+
+    return stored
+
+
+def get_readings_window(appointment, start=None, end=None, points=DEFAULT_WINDOW_POINTS):
+    """
+        Returns the readings of every channel between start and end, downsampled to at most points each.
+
+        The window is found by bisecting the packed offsets and only the readings inside it are
+        decoded, the channels are read in a single query.
+    """
+    window = {}
+    machine_number = None
+
+    for series in IntradialyticSeries.objects.filter(appointment=appointment).only('channel', 'machine_number', 'started_at', 'offsets', 'values'):
+        machine_number = series.machine_number
+        offsets = get_view(series.offsets)
+        values = get_view(series.values)
+
+        first = bisect_left(offsets, (start - series.started_at).total_seconds()) if start else 0
+        last = bisect_right(offsets, (end - series.started_at).total_seconds()) if end else len(offsets)
+        offsets = offsets[first:last]
+        values = values[first:last]
+
+        kept = get_lttb_indices(offsets, values, points)
+
+        window[series.channel] = {
+            "readings": len(offsets),
+            "times": [series.started_at + timedelta(seconds=round(offsets[index], 3)) for index in kept],
+            "values": [round(values[index], 2) for index in kept],
+        }
+
+    return {"machine_number": machine_number, "channels": window}
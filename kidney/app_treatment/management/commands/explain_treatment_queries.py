@@ -0,0 +1,16 @@
+import uuid
+from app_treatment.models import Treatment
+from kidney.query_plans import ExplainQueriesCommand
+
+
+class Command(ExplainQueriesCommand):
+    help = "Runs EXPLAIN on the hot treatment queries and reports whether each one uses an index."
+
+    def get_hot_queries(self):
+        user_id = uuid.uuid4()
+
+        return [
+            ("patient treatment history", Treatment.objects.filter(
+                user=user_id
+            ).order_by('-last_treatment_date')),
+        ]
@@ -0,0 +1,82 @@
+import math
+import re
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+#copied from app_treatment.vitals as they were when this migration was written, the migration doesn't follow later changes
+MAX_BLOOD_PRESSURE = 400
+WEIGHT_NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+WEIGHT_LOSS_WORDS = re.compile(r'\b(?:loss|lost|lose|decrease|decreased|down)\b', re.IGNORECASE)
+
+
+def parse_blood_pressure(value):
+    try:
+        systolic, diastolic = (float(number) for number in str(value).replace('~', '/').split('/'))
+        #"inf/80" or "1e400/80" parse as floats but aren't readings
+        if not (math.isfinite(systolic) and math.isfinite(diastolic)):
+            return None, None
+        systolic, diastolic = int(systolic), int(diastolic)
+    except (TypeError, ValueError, OverflowError):
+        return None, None
+
+    if not (0 < systolic <= MAX_BLOOD_PRESSURE and 0 < diastolic <= MAX_BLOOD_PRESSURE):
+        return None, None
+
+    return systolic, diastolic
+
+
+def parse_weight_change(value):
+    match = WEIGHT_NUMBER.search(str(value or ''))
+
+    if not match:
+        return None
+
+    change = float(match.group())
+
+    if change > 0 and WEIGHT_LOSS_WORDS.search(str(value)):
+        change = -change
+
+    return change
+
+
+def backfill_numeric_vitals(apps, schema_editor):
+    """Parses the blood pressure and weight change texts into the numeric columns, a batch of prescriptions at a time."""
+    Prescription = apps.get_model('app_treatment', 'Prescription')
+    last_id = 0
+
+    while True:
+        batch = list(
+            Prescription.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'weight', 'blood_pressure_pre', 'blood_pressure_post')[:BATCH_SIZE]
+        )
+
+        if not batch:
+            break
+
+        for prescription in batch:
+            prescription.systolic_pre, prescription.diastolic_pre = parse_blood_pressure(prescription.blood_pressure_pre)
+            prescription.systolic_post, prescription.diastolic_post = parse_blood_pressure(prescription.blood_pressure_post)
+            prescription.weight_change = parse_weight_change(prescription.weight)
+
+        Prescription.objects.bulk_update(
+            batch,
+            ['systolic_pre', 'diastolic_pre', 'systolic_post', 'diastolic_post', 'weight_change']
+        )
+
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    #each batch commits on its own, a large table isn't rewritten in one transaction
+    atomic = False
+
+    dependencies = [
+        ('app_treatment', '0003_prescription_numeric_vitals'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_numeric_vitals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 09:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_appointment', '0007_add_hot_path_indexes'),
+        ('app_treatment', '0004_backfill_prescription_numeric_vitals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntradialyticSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('channel', models.CharField(choices=[('systolic', 'Systolic'), ('diastolic', 'Diastolic'), ('pulse', 'Pulse'), ('uf_rate', 'UF Rate')], max_length=20)),
+                ('machine_number', models.CharField(max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('offsets', models.BinaryField(default=bytes)),
+                ('values', models.BinaryField(default=bytes)),
+                ('readings', models.PositiveIntegerField(default=0)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intradialytic_series', to='app_appointment.appointment')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('appointment', 'channel'), name='intradialytic_appointment_channel_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 10:14
+
+import struct
+from django.db import migrations, models
+
+
+def backfill_last_offset(apps, schema_editor):
+    """Reads the last packed little-endian float32 offset of every series."""
+    IntradialyticSeries = apps.get_model('app_treatment', 'IntradialyticSeries')
+
+    for series in IntradialyticSeries.objects.filter(readings__gt=0).only('id', 'offsets').iterator():
+        offsets = bytes(series.offsets)
+
+        if len(offsets) >= 4:
+            IntradialyticSeries.objects.filter(id=series.id).update(last_offset=struct.unpack('<f', offsets[-4:])[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_treatment', '0005_intradialyticseries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='intradialyticseries',
+            name='last_offset',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_offset, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from kidney.models import TimestampModel
-from app_appointment.models import User
+from app_appointment.models import User, Appointment
 
 class Treatment(TimestampModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='treatment', null=True)
@@ -8,6 +8,12 @@ class Treatment(TimestampModel):
     nephrologist = models.CharField(max_length=100, null=True, blank=True)
     last_treatment_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            #treatment history of a patient ordered by treatment date
+            models.Index(fields=['user', 'last_treatment_date'], name='treatment_user_date_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user.username} Treatment'
 
@@ -19,6 +25,12 @@ class Prescription(models.Model):
     weight_post = models.FloatField(null=True, blank=True)
     blood_pressure_pre = models.CharField(null=True, blank=True)
     blood_pressure_post = models.CharField(null=True, blank=True)
+    #the blood pressures and the weight change as numbers, written along with their text
+    systolic_pre = models.PositiveSmallIntegerField(null=True, blank=True)
+    diastolic_pre = models.PositiveSmallIntegerField(null=True, blank=True)
+    systolic_post = models.PositiveSmallIntegerField(null=True, blank=True)
+    diastolic_post = models.PositiveSmallIntegerField(null=True, blank=True)
+    weight_change = models.FloatField(null=True, blank=True)
     pulse_pre = models.IntegerField(null=True, blank=True)
     pulse_post = models.IntegerField(null=True, blank=True)
     temp_pre = models.FloatField(null=True, blank=True)
@@ -75,4 +87,37 @@ class PostDialysis(models.Model):
     cardiac = models.CharField(null=True, blank=True)   
 
     def __str__(self):
-        return f'{self.treatment.user.username} Post Dialysis'
\ No newline at end of file
+        return f'{self.treatment.user.username} Post Dialysis'
+
+
+class IntradialyticSeries(TimestampModel):
+    """
+        The readings of one channel during a dialysis session, packed as little-endian float32 arrays.
+
+        offsets holds the seconds of each reading since started_at and values the reading itself,
+        a 4-hour session read every 5 seconds takes about 23 KB per channel.
+    """
+    channels = [
+        ('systolic', 'Systolic'),
+        ('diastolic', 'Diastolic'),
+        ('pulse', 'Pulse'),
+        ('uf_rate', 'UF Rate'),
+    ]
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='intradialytic_series')
+    channel = models.CharField(max_length=20, choices=channels)
+    machine_number = models.CharField(max_length=20)
+    started_at = models.DateTimeField()
+    offsets = models.BinaryField(default=bytes)
+    values = models.BinaryField(default=bytes)
+    readings = models.PositiveIntegerField(default=0)
+    #the offset of the latest reading, a batch after it is appended without decoding the offsets
+    last_offset = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'channel'], name='intradialytic_appointment_channel_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.appointment_id} {self.channel} Intradialytic Readings'
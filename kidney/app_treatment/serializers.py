@@ -8,6 +8,16 @@ from .models import (
     PostDialysis
 )
 from kidney.utils import is_field_empty
+from .vitals import (
+    MAX_TREND_POINTS,
+    DEFAULT_TREND_POINTS,
+    DEFAULT_ROLLING_WINDOW,
+    BLOOD_PRESSURE_VITALS,
+    get_deltas,
+    parse_blood_pressure,
+    parse_weight_change
+)
+from .intradialytic import MAX_BATCH_READINGS, DEFAULT_WINDOW_POINTS, MAX_WINDOW_POINTS
 from app_authentication.models import User
 
 class PrescriptionSerializer(serializers.ModelSerializer):
@@ -57,6 +67,27 @@ class PrescriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Prescription
         fields = '__all__'
+        read_only_fields = ['systolic_pre', 'diastolic_pre', 'systolic_post', 'diastolic_post', 'weight_change']
+
+    def validate(self, attrs):
+
+        #the numbers are written along with the text they're read from
+        for field in BLOOD_PRESSURE_VITALS:
+            stage = field.rsplit('_', 1)[1]
+            systolic, diastolic = None, None
+
+            if not is_field_empty(attrs.get(field)):
+                systolic, diastolic = parse_blood_pressure(attrs[field])
+
+                if systolic is None:
+                    raise serializers.ValidationError({"message": f"{field.capitalize().replace('_', ' ')} should use this format: 120/80"})
+
+            attrs[f'systolic_{stage}'] = systolic
+            attrs[f'diastolic_{stage}'] = diastolic
+
+        attrs['weight_change'] = parse_weight_change(attrs.get('weight'))
+
+        return attrs
 
 
 class AccessTypeSerializer(serializers.ModelSerializer):
@@ -208,36 +239,81 @@ class CreateTreatmentFormSerializer(serializers.ModelSerializer):
         return treatment
     
 
-class GetPatientHealthMonitoringSerializer(serializers.ModelSerializer):
+class GetPatientHealthMonitoringSerializer(serializers.Serializer):
 
-    class Meta:
-        model = Treatment
-        fields = ['id']
+    #the vitals of the latest treatment shown with their change since the treatment before
+    MONITORED_VITALS = ['weight_pre', 'weight_post', 'systolic_pre', 'diastolic_pre', 'systolic_post', 'diastolic_post', 'pulse_pre', 'pulse_post']
 
-    def to_representation(self, instance):
+    def get_blood_pressure(self, series, stage):
+        systolic = series.columns[f'systolic_{stage}'][-1]
+        diastolic = series.columns[f'diastolic_{stage}'][-1]
 
-        data = super().to_representation(instance)
+        if systolic is None:
+            #a reading the backfill couldn't parse is shown as it was typed
+            return str(series.blood_pressures[f'blood_pressure_{stage}'][-1]).replace('/', '~')
 
-        user_id = self.context.get('user_id')
+        return f"{systolic}~{diastolic}"
 
-        treatment = Treatment.objects.get(user=user_id)
+    def to_representation(self, instance):
 
-        prescription = Prescription.objects.get(
-            treatment=treatment
-        )
+        #the patient's vitals series, the latest treatment is the last one
+        series = instance
+        columns = series.columns
+
+        data = {"id": series.treatment_ids[-1]}
 
-        data["weight_change"] = str(prescription.weight).lower()
-        data["pre_dialysis"] = prescription.weight_pre
-        data["post_dialysis"] = prescription.weight_post
+        data["weight_change"] = str(series.weight_changes[-1]).lower()
+        data["pre_dialysis"] = columns['weight_pre'][-1]
+        data["post_dialysis"] = columns['weight_post'][-1]
 
-        data["blood_pressure_pre_dialysis"] = str(prescription.blood_pressure_pre).replace('/', '~')
-        data["blood_pressure_post_dialysis"] = str(prescription.blood_pressure_post).replace('/', '~')
+        data["blood_pressure_pre_dialysis"] = self.get_blood_pressure(series, 'pre')
+        data["blood_pressure_post_dialysis"] = self.get_blood_pressure(series, 'post')
 
-        data["heart_rate_pre_dialysis"] = prescription.pulse_pre
-        data["heart_rate_post_dialysis"] = prescription.pulse_post
+        data["heart_rate_pre_dialysis"] = columns['pulse_pre'][-1]
+        data["heart_rate_post_dialysis"] = columns['pulse_post'][-1]
+
+        data["changes"] = {name: get_deltas(columns[name])[-1] for name in self.MONITORED_VITALS}
 
         return data
-    
+
+
+class GetVitalsTrendSerializer(serializers.Serializer):
+
+    points = serializers.IntegerField(min_value=3, max_value=MAX_TREND_POINTS, default=DEFAULT_TREND_POINTS)
+    window = serializers.IntegerField(min_value=1, max_value=30, default=DEFAULT_ROLLING_WINDOW)
+
+
+class IntradialyticReadingSerializer(serializers.Serializer):
+
+    time = serializers.DateTimeField()
+    systolic = serializers.FloatField(required=False, allow_null=True)
+    diastolic = serializers.FloatField(required=False, allow_null=True)
+    pulse = serializers.FloatField(required=False, allow_null=True)
+    uf_rate = serializers.FloatField(required=False, allow_null=True)
+
+
+class AddIntradialyticReadingsSerializer(serializers.Serializer):
+
+    machine_number = serializers.CharField(max_length=20, error_messages={
+        "blank": "Machine number cannot be empty"
+    })
+    readings = IntradialyticReadingSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_READINGS)
+
+
+class GetIntradialyticWindowSerializer(serializers.Serializer):
+
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    points = serializers.IntegerField(min_value=3, max_value=MAX_WINDOW_POINTS, default=DEFAULT_WINDOW_POINTS)
+
+    def validate(self, attrs):
+
+        if attrs.get('start') and attrs.get('end') and attrs['end'] < attrs['start']:
+            raise serializers.ValidationError({"message": "The end must not be before the start"})
+
+        return attrs
+
+
 class GetPatientsTreatmentHistorySerializer(serializers.ModelSerializer):
 
     treatment_date = serializers.SerializerMethodField()
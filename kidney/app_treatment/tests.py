@@ -1,3 +1,230 @@
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from django.apps import apps
+from django.db.models import Avg, Max
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from app_authentication.models import User
+from app_appointment.models import Appointment, AssignedMachine
+from .models import Treatment, Prescription, IntradialyticSeries
+from .intradialytic import get_view
+from .serializers import PrescriptionSerializer
+from .vitals import VitalsSeries, get_lttb_indices, get_rolling_means, parse_blood_pressure, parse_weight_change
 
-# Create your tests here.
+
+class VitalsTrendTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.patient)}")
+
+    def add_treatment(self, treatment_date, weight_pre, blood_pressure_pre="120/80", pulse_pre=80):
+        treatment = Treatment.objects.create(user=self.patient, diagnosis='CKD', nephrologist='Dr. Cruz', last_treatment_date=treatment_date)
+        Prescription.objects.create(
+            treatment=treatment,
+            weight='Gain',
+            weight_pre=weight_pre,
+            weight_post=weight_pre - 2,
+            blood_pressure_pre=blood_pressure_pre,
+            blood_pressure_post="110/70",
+            systolic_pre=parse_blood_pressure(blood_pressure_pre)[0],
+            diastolic_pre=parse_blood_pressure(blood_pressure_pre)[1],
+            systolic_post=110,
+            diastolic_post=70,
+            pulse_pre=pulse_pre,
+            pulse_post=75,
+        )
+        return treatment
+
+    def test_rolling_means_skip_missing_values(self):
+        self.assertEqual(get_rolling_means([1, 2, None, 6, 8], 2), [1.0, 1.5, 2.0, 6.0, 7.0])
+
+    def test_lttb_keeps_the_ends_and_the_peak(self):
+        ys = [0] * 100
+        ys[40] = 10
+
+        indices = get_lttb_indices(list(range(100)), ys, 10)
+
+        self.assertEqual(len(indices), 10)
+        self.assertEqual((indices[0], indices[-1]), (0, 99))
+        self.assertIn(40, indices)
+
+    def test_health_monitoring_shows_the_latest_of_several_treatments(self):
+        self.add_treatment(date(2025, 1, 6), 70)
+        latest = self.add_treatment(date(2025, 1, 8), 72, blood_pressure_pre="130/85", pulse_pre=90)
+
+        response = self.client.get('/patients/health-monitoring/')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.data["data"]
+        self.assertEqual(data["id"], latest.id)
+        self.assertEqual(data["weight_change"], "gain")
+        self.assertEqual(data["pre_dialysis"], 72)
+        self.assertEqual(data["blood_pressure_pre_dialysis"], "130~85")
+        self.assertEqual(data["changes"]["weight_pre"], 2)
+        self.assertEqual(data["changes"]["systolic_pre"], 10)
+        self.assertEqual(data["changes"]["pulse_pre"], 10)
+
+    def test_trend_is_loaded_in_one_query_and_downsampled(self):
+        start_date = date(2025, 1, 1)
+        for day in range(30):
+            self.add_treatment(start_date + timedelta(days=day), 70 + day % 3)
+
+        with self.assertNumQueries(1):
+            series = VitalsSeries.for_patient(self.patient.id)
+        self.assertEqual(len(series), 30)
+
+        response = self.client.get(f'/patients/{self.patient.id}/vitals-trend/', {"points": 10, "window": 3})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.data["data"]
+        self.assertEqual(data["sessions"], 30)
+
+        weight = data["vitals"]["weight_pre"]
+        self.assertEqual(len(weight["values"]), 10)
+        self.assertEqual((weight["dates"][0], weight["dates"][-1]), ("01/01/2025", "01/30/2025"))
+        self.assertEqual((weight["min"], weight["max"], weight["mean"]), (70, 72, 71))
+        self.assertEqual(data["vitals"]["weight_removed"]["latest"], 2)
+        self.assertEqual(data["vitals"]["systolic_pre"]["latest"], 120)
+
+        self.assertEqual(self.client.get('/patients/vitals-trend/', {"points": 1}).status_code, 400)
+
+
+class NumericVitalsTest(TestCase):
+
+    prescription = {
+        "weight": "Loss of 1.5 kg",
+        "weight_pre": 70,
+        "weight_post": 68,
+        "blood_pressure_pre": "140/90",
+        "blood_pressure_post": "120/80",
+        "pulse_pre": 80,
+        "pulse_post": 75,
+        "temp_pre": 36.5,
+        "temp_post": 36.6,
+        "respiratory_rate_pre": 18,
+        "respiratory_rate_post": 18,
+        "saturation_percentage_pre": 98,
+        "saturation_percentage_post": 98,
+        "rbs_pre": 110,
+        "rbs_post": 120,
+        "uf_time": "4",
+        "uf_goal": 2.0,
+    }
+
+    def setUp(self):
+        patient = User.objects.create_user(username='patient@kidneycare.com', password='password123', role='patient')
+        self.treatment = Treatment.objects.create(user=patient, last_treatment_date=date(2025, 1, 6))
+
+    def test_texts_are_parsed(self):
+        self.assertEqual(parse_blood_pressure("120/80"), (120, 80))
+        self.assertEqual(parse_blood_pressure("120~80"), (120, 80))
+        self.assertEqual(parse_blood_pressure("high"), (None, None))
+        self.assertEqual(parse_blood_pressure("inf/80"), (None, None))
+        self.assertEqual(parse_blood_pressure("1e400/80"), (None, None))
+        self.assertEqual(parse_blood_pressure("nan/80"), (None, None))
+        self.assertEqual(parse_weight_change("+1.5 kg"), 1.5)
+        self.assertEqual(parse_weight_change("1.5kg loss"), -1.5)
+        self.assertIsNone(parse_weight_change("Gain"))
+
+    def test_serializer_writes_both_representations(self):
+        serializer = PrescriptionSerializer(data=self.prescription)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        prescription = serializer.save(treatment=self.treatment)
+
+        self.assertEqual(prescription.blood_pressure_pre, "140/90")
+        self.assertEqual((prescription.systolic_pre, prescription.diastolic_pre), (140, 90))
+        self.assertEqual(prescription.weight_change, -1.5)
+
+        #the numbers aggregate in the database
+        self.assertEqual(
+            Prescription.objects.aggregate(systolic=Max('systolic_pre'), diastolic=Avg('diastolic_post')),
+            {"systolic": 140, "diastolic": 80.0}
+        )
+
+        serializer = PrescriptionSerializer(data={**self.prescription, "blood_pressure_pre": "high"})
+        self.assertFalse(serializer.is_valid())
+
+    def test_backfill_parses_the_existing_texts(self):
+        Prescription.objects.create(treatment=self.treatment, weight="-2", blood_pressure_pre="130/85", blood_pressure_post="n/a")
+
+        migration = import_module('app_treatment.migrations.0004_backfill_prescription_numeric_vitals')
+        migration.backfill_numeric_vitals(apps, None)
+
+        prescription = Prescription.objects.get()
+        self.assertEqual((prescription.systolic_pre, prescription.diastolic_pre), (130, 85))
+        self.assertEqual((prescription.systolic_post, prescription.diastolic_post), (None, None))
+        self.assertEqual(prescription.weight_change, -2)
+
+
+class IntradialyticReadingsTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        nurse = User.objects.create_user(username='nurse@kidneycare.com', password='password123', role='nurse')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(nurse)}")
+        self.appointment = Appointment.objects.create(date=date(2025, 1, 6), status='in-progress')
+        AssignedMachine.objects.create(assigned_machine_appointment=self.appointment, assigned_machine='M-3')
+        self.started_at = timezone.make_aware(datetime(2025, 1, 6, 9, 0))
+
+    def send(self, first, total, machine_number='M-3'):
+        readings = [
+            {
+                "time": (self.started_at + timedelta(seconds=5 * index)).isoformat(),
+                "systolic": 120 + index % 10,
+                "pulse": 70,
+                "uf_rate": 0.5,
+            }
+            for index in range(first, first + total)
+        ]
+        return self.client.post(
+            f'/appointments/{self.appointment.id}/intradialytic-readings/',
+            {"machine_number": machine_number, "readings": readings},
+            format='json'
+        )
+
+    def test_readings_are_packed_per_channel(self):
+        self.assertEqual(self.send(0, 1000).data["data"]["stored"], 3000)
+
+        #a batch sent again only stores its new readings
+        self.assertEqual(self.send(500, 1000).data["data"]["stored"], 1500)
+
+        series = IntradialyticSeries.objects.get(appointment=self.appointment, channel='systolic')
+        self.assertEqual(series.readings, 1500)
+        self.assertEqual(len(bytes(series.values)), 1500 * 4)
+        self.assertFalse(IntradialyticSeries.objects.filter(channel='diastolic').exists())
+
+        self.assertEqual(self.send(1500, 10, machine_number='M-4').status_code, 400)
+
+    def test_delayed_readings_are_merged_in_order(self):
+        self.send(0, 10)
+        self.send(20, 10)
+
+        #a batch held up by the network, overlapping what was already stored
+        self.assertEqual(self.send(5, 20).data["data"]["stored"], 30)
+        self.assertEqual(self.send(0, 30).data["data"]["stored"], 0)
+
+        series = IntradialyticSeries.objects.get(appointment=self.appointment, channel='systolic')
+        offsets = list(get_view(series.offsets))
+        self.assertEqual(series.readings, 30)
+        self.assertEqual(offsets, [5.0 * index for index in range(30)])
+        self.assertEqual(list(get_view(series.values)), [120.0 + index % 10 for index in range(30)])
+        self.assertEqual(series.last_offset, 145.0)
+
+    def test_window_is_downsampled(self):
+        self.send(0, 1000)
+
+        response = self.client.get(
+            f'/appointments/{self.appointment.id}/intradialytic-readings/window/',
+            {"start": (self.started_at + timedelta(minutes=10)).isoformat(), "end": (self.started_at + timedelta(minutes=20)).isoformat(), "points": 20}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        systolic = response.data["data"]["channels"]["systolic"]
+        self.assertEqual(systolic["readings"], 121)
+        self.assertEqual(len(systolic["values"]), 20)
+        self.assertEqual((systolic["times"][0], systolic["times"][-1]), (self.started_at + timedelta(minutes=10), self.started_at + timedelta(minutes=20)))
+        self.assertEqual(response.data["data"]["channels"]["uf_rate"]["values"][0], 0.5)
@@ -3,6 +3,9 @@ from .views import (
     CreateTreatmentFormView,
     GetPatientHealthMonitoringView,
     GetAssignedPatientHealthMonitoringView,
+    GetVitalsTrendView,
+    AddIntradialyticReadingsView,
+    GetIntradialyticReadingsView,
     GetPatientsTreatmentHistoryView,
     GetPatientTreatmentView,
     DeletePatientsTreatmentHistoryView
@@ -11,6 +14,10 @@ from .views import (
 urlpatterns = [
     path('patients/<str:pk>/treatment-form/', CreateTreatmentFormView.as_view(), name='create-treatment-form'),
     path('patients/health-monitoring/', GetPatientHealthMonitoringView.as_view(), name='patient-health-monitoring'),
+    path('patients/vitals-trend/', GetVitalsTrendView.as_view(), name='patient-vitals-trend'),
+    path('patients/<str:pk>/vitals-trend/', GetVitalsTrendView.as_view(), name='patient-vitals-trend-filter'),
+    path('appointments/<int:pk>/intradialytic-readings/', AddIntradialyticReadingsView.as_view(), name='add-intradialytic-readings'),
+    path('appointments/<int:pk>/intradialytic-readings/window/', GetIntradialyticReadingsView.as_view(), name='intradialytic-readings-window'),
     path('patients/<str:pk>/treatment-history/', GetPatientsTreatmentHistoryView.as_view(), name='patient-treatment-history'),
     path('patients/<str:pk>/treatment/<int:id>/', GetPatientTreatmentView.as_view(), name='patient-treatment'),
     path('patients/<str:pk>/treatment-history/<int:id>/', DeletePatientsTreatmentHistoryView.as_view(), name='delete-patient-treatment-history'),
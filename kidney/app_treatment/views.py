@@ -2,15 +2,22 @@ from rest_framework import generics, status
 from .serializers import (
     CreateTreatmentFormSerializer,
     GetPatientHealthMonitoringSerializer,
+    GetVitalsTrendSerializer,
+    AddIntradialyticReadingsSerializer,
+    GetIntradialyticWindowSerializer,
     GetPatientsTreatmentHistorySerializer,
     GetPatientTreatmentSerializer,
     DeletePatientsTreatmentHistorySerializer
 )
 from rest_framework.exceptions import ParseError
-from kidney.utils import ResponseMessageUtils, extract_first_error_message, get_token_user_id
+from kidney.utils import ResponseMessageUtils, extract_first_error_message
+from kidney.identity import get_request_identity
 from .models import Treatment
+from .vitals import VitalsSeries, get_vitals_trend
+from .intradialytic import MachineMismatchError, append_readings, get_readings_window
 from rest_framework.permissions import IsAuthenticated
 from app_authentication.models import Caregiver
+from app_appointment.models import Appointment, AssignedMachine
 from rest_framework.pagination import PageNumberPagination
 
 class Pagination(PageNumberPagination):
@@ -50,25 +57,22 @@ class GetPatientHealthMonitoringView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = GetPatientHealthMonitoringSerializer
 
-    def get_queryset(self):
-        user_id = get_token_user_id(self.request)
-        return Treatment.objects.filter(user=user_id)
-
     def list(self, request, *args, **kwargs):
 
         try:
 
-            user_id = get_token_user_id(self.request)
+            user_id = get_request_identity(self.request).user_id
 
-            queryset = self.get_queryset()
+            #every treatment of the patient in one query, the latest one is shown
+            series = VitalsSeries.for_patient(user_id)
 
-            if not queryset.exists():
+            if not series:
                 return ResponseMessageUtils(
                     message="No patient monitoring found",
                     status_code=status.HTTP_404_NOT_FOUND
                 )
             
-            serializer = self.get_serializer(queryset, context={'user_id': user_id})
+            serializer = self.get_serializer(series)
 
             return ResponseMessageUtils(
                 message="Patient health monitoring",
@@ -89,15 +93,13 @@ class GetAssignedPatientHealthMonitoringView(generics.ListAPIView):
     serializer_class = GetPatientHealthMonitoringSerializer
 
     def get_queryset(self):
-        user_id = get_token_user_id(self.request)
+        user_id = get_request_identity(self.request).user_id
         return Caregiver.objects.filter(user=user_id).first()
 
     def get(self, request, *args, **kwargs):
 
         try:
 
-            treatment = None
-
             queryset = self.get_queryset()
 
             if not queryset:
@@ -106,15 +108,15 @@ class GetAssignedPatientHealthMonitoringView(generics.ListAPIView):
                     status_code=status.HTTP_404_NOT_FOUND
                 )
 
-            treatment = Treatment.objects.filter(user=queryset.added_by).first()
+            series = VitalsSeries.for_patient(queryset.added_by_id)
 
-            if not treatment:
+            if not series:
                 return ResponseMessageUtils(
                     message="No treatment found",
                     status_code=status.HTTP_404_NOT_FOUND
                 )
             
-            serializer = self.get_serializer(treatment, many=False, context={'user_id': queryset.added_by})
+            serializer = self.get_serializer(series)
 
             return ResponseMessageUtils(
                 message="Patient health monitoring",
@@ -129,6 +131,130 @@ class GetAssignedPatientHealthMonitoringView(generics.ListAPIView):
             )
 
 
+class GetVitalsTrendView(generics.GenericAPIView):
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = GetVitalsTrendSerializer
+    lookup_field = 'pk'
+
+    def get(self, request, *args, **kwargs):
+
+        try:
+
+            serializer = self.get_serializer(data=request.query_params)
+
+            if not serializer.is_valid():
+                return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
+
+            #a provider reads the patient of the url, a patient their own vitals
+            user_id = self.kwargs.get('pk') or get_request_identity(self.request).user_id
+
+            series = VitalsSeries.for_patient(user_id)
+
+            if not series:
+                return ResponseMessageUtils(
+                    message="No treatment found",
+                    status_code=status.HTTP_404_NOT_FOUND
+                )
+
+            return ResponseMessageUtils(
+                message="Patient vitals trend",
+                data=get_vitals_trend(series, **serializer.validated_data),
+                status_code=status.HTTP_200_OK
+            )
+
+        except Exception as e:
+            return ResponseMessageUtils(
+                message="Something went wrong while processing your request.",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AddIntradialyticReadingsView(generics.CreateAPIView):
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = AddIntradialyticReadingsSerializer
+    lookup_field = 'pk'
+
+    def post(self, request, *args, **kwargs):
+
+        try:
+
+            appointment = Appointment.objects.filter(id=self.kwargs.get('pk')).first()
+
+            if not appointment:
+                return ResponseMessageUtils(message="No appointment found", status_code=status.HTTP_404_NOT_FOUND)
+
+            serializer = self.get_serializer(data=request.data)
+
+            if not serializer.is_valid():
+                return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
+
+            machine_number = serializer.validated_data['machine_number']
+            assigned_machine = AssignedMachine.objects.filter(assigned_machine_appointment=appointment).values_list('assigned_machine', flat=True).first()
+
+            #the readings must come from the machine the session was assigned
+            if assigned_machine and assigned_machine != machine_number:
+                return ResponseMessageUtils(message="This machine is not assigned to the appointment", status_code=status.HTTP_400_BAD_REQUEST)
+
+            stored = append_readings(appointment, machine_number, serializer.validated_data['readings'])
+
+            return ResponseMessageUtils(
+                message="Readings added successfully",
+                data={"stored": stored},
+                status_code=status.HTTP_201_CREATED
+            )
+
+        except ParseError as e:
+            return ResponseMessageUtils(
+                message=f"Invalid JSON: {str(e)}",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        except MachineMismatchError as e:
+            return ResponseMessageUtils(
+                message="This session is recorded by another machine",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return ResponseMessageUtils(
+                message="Something went wrong while processing your request.",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class GetIntradialyticReadingsView(generics.GenericAPIView):
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = GetIntradialyticWindowSerializer
+    lookup_field = 'pk'
+
+    def get(self, request, *args, **kwargs):
+
+        try:
+
+            serializer = self.get_serializer(data=request.query_params)
+
+            if not serializer.is_valid():
+                return ResponseMessageUtils(message=extract_first_error_message(serializer.errors), status_code=status.HTTP_400_BAD_REQUEST)
+
+            window = get_readings_window(self.kwargs.get('pk'), **serializer.validated_data)
+
+            if not window["channels"]:
+                return ResponseMessageUtils(message="No readings found", status_code=status.HTTP_404_NOT_FOUND)
+
+            return ResponseMessageUtils(
+                message="Intradialytic readings",
+                data=window,
+                status_code=status.HTTP_200_OK
+            )
+
+        except Exception as e:
+            return ResponseMessageUtils(
+                message="Something went wrong while processing your request.",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 class GetPatientsTreatmentHistoryView(generics.ListAPIView):
 
     permission_classes = [IsAuthenticated]
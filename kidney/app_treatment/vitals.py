@@ -0,0 +1,227 @@
+import math
+import re
+from .models import Prescription
+
+DEFAULT_TREND_POINTS = 60  #points of each chart, about what a phone screen shows
+MAX_TREND_POINTS = 500
+DEFAULT_ROLLING_WINDOW = 3  #sessions averaged by the rolling mean, about a week of dialysis
+
+#the numeric prescription columns, keyed by the name of their series
+NUMERIC_VITALS = {
+    'weight_pre': 'weight_pre',
+    'weight_post': 'weight_post',
+    'weight_change': 'weight_change',
+    'systolic_pre': 'systolic_pre',
+    'diastolic_pre': 'diastolic_pre',
+    'systolic_post': 'systolic_post',
+    'diastolic_post': 'diastolic_post',
+    'pulse_pre': 'pulse_pre',
+    'pulse_post': 'pulse_post',
+    'temp_pre': 'temp_pre',
+    'temp_post': 'temp_post',
+    'saturation_pre': 'saturation_percentage_pre',
+    'saturation_post': 'saturation_percentage_post',
+    'rbs_pre': 'rbs_pre',
+    'rbs_post': 'rbs_post',
+}
+#the blood pressures are also kept as their "systolic/diastolic" text
+BLOOD_PRESSURE_VITALS = ('blood_pressure_pre', 'blood_pressure_post')
+MAX_BLOOD_PRESSURE = 400  #mmHg, anything above is a typo
+WEIGHT_NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+WEIGHT_LOSS_WORDS = re.compile(r'\b(?:loss|lost|lose|decrease|decreased|down)\b', re.IGNORECASE)
+
+
+def parse_blood_pressure(value):
+    """Returns the (systolic, diastolic) numbers of a "120/80" reading, (None, None) if it can't be read."""
+    try:
+        systolic, diastolic = (float(number) for number in str(value).replace('~', '/').split('/'))
+        #"inf/80" or "1e400/80" parse as floats but aren't readings
+        if not (math.isfinite(systolic) and math.isfinite(diastolic)):
+            return None, None
+        systolic, diastolic = int(systolic), int(diastolic)
+    except (TypeError, ValueError, OverflowError):
+        return None, None
+
+    if not (0 < systolic <= MAX_BLOOD_PRESSURE and 0 < diastolic <= MAX_BLOOD_PRESSURE):
+        return None, None
+
+    return systolic, diastolic
+
+
+def parse_weight_change(value):
+    """
+        Returns the weight change of a text like "+1.5", "1.5 kg gain" or "loss of 2kg" in kg, None if it has no number.
+
+        A minus sign or a word of loss makes the change negative.
+    """
+    match = WEIGHT_NUMBER.search(str(value or ''))
+
+    if not match:
+        return None
+
+    change = float(match.group())
+
+    if change > 0 and WEIGHT_LOSS_WORDS.search(str(value)):
+        change = -change
+
+    return change
+
+
+class VitalsSeries:
+    """
+        The prescription numbers of every treatment of a patient as columns, oldest treatment first.
+
+        Each column holds one value per treatment, None where the treatment didn't record it.
+    """
+
+    def __init__(self, rows):
+        self.treatment_ids = [row['treatment_id'] for row in rows]
+        self.dates = [row['treatment__last_treatment_date'] for row in rows]
+        self.weight_changes = [row['weight'] for row in rows]
+        self.blood_pressures = {field: [row[field] for row in rows] for field in BLOOD_PRESSURE_VITALS}
+        self.columns = {name: [row[field] for row in rows] for name, field in NUMERIC_VITALS.items()}
+
+        #the fluid removed by each session
+        self.columns['weight_removed'] = subtract(self.columns['weight_pre'], self.columns['weight_post'])
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def for_patient(cls, user_id):
+        """Loads the series of a patient in a single query."""
+        fields = ['treatment_id', 'treatment__last_treatment_date', 'weight', *BLOOD_PRESSURE_VITALS, *NUMERIC_VITALS.values()]
+
+        rows = (
+            Prescription.objects.filter(treatment__user=user_id, treatment__last_treatment_date__isnull=False)
+            .order_by('treatment__last_treatment_date', 'treatment_id')
+            .values(*fields)
+        )
+
+        return cls(list(rows))
+
+
+def subtract(values, others):
+    return [None if a is None or b is None else round(a - b, 2) for a, b in zip(values, others)]
+
+
+def get_deltas(values):
+    """The change of each value from the one before it, None for the first value and around a missing one."""
+    return [None] + subtract(values[1:], values[:-1])
+
+
+def get_rolling_means(values, window):
+    """
+        The mean of each value and the window - 1 values before it, computed with a running sum.
+
+        The missing values are left out of the mean, it is None when the whole window is missing.
+    """
+    means = []
+    total = 0
+    present = 0
+
+    for index, value in enumerate(values):
+        if value is not None:
+            total += value
+            present += 1
+
+        if index >= window and values[index - window] is not None:
+            total -= values[index - window]
+            present -= 1
+
+        means.append(round(total / present, 2) if present else None)
+
+    return means
+
+
+def get_summary(values):
+    present = [value for value in values if value is not None]
+
+    if not present:
+        return {"latest": None, "change": None, "min": None, "max": None, "mean": None}
+
+    return {
+        "latest": present[-1],
+        "change": round(present[-1] - present[-2], 2) if len(present) > 1 else None,
+        "min": min(present),
+        "max": max(present),
+        "mean": round(sum(present) / len(present), 2),
+    }
+
+
+def get_lttb_indices(xs, ys, threshold):
+    """
+        Picks threshold points of a series with Largest-Triangle-Three-Buckets, keeping its peaks and dips.
+
+        The first and last points are always kept, each bucket in between keeps the point forming
+        the largest triangle with the point kept before it and the average of the next bucket.
+
+        Returns:
+            list: The indices of the points kept, in order.
+    """
+    total = len(xs)
+
+    if threshold >= total or threshold < 3:
+        return list(range(total))
+
+    bucket_size = (total - 2) / (threshold - 2)
+    indices = [0]
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, total)
+        average_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        average_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        start = int(bucket * bucket_size) + 1
+        end = next_start
+
+        previous = max(
+            range(start, end),
+            key=lambda index: abs(
+                (xs[previous] - average_x) * (ys[index] - ys[previous])
+                - (xs[previous] - xs[index]) * (average_y - ys[previous])
+            )
+        )
+        indices.append(previous)
+
+    indices.append(total - 1)
+
+    return indices
+
+
+def get_vitals_trend(series, points=DEFAULT_TREND_POINTS, window=DEFAULT_ROLLING_WINDOW):
+    """
+        Returns the chart of every vital: its points downsampled to at most the given number, the
+        rolling mean and the session to session change at those points, and a summary of the full history.
+    """
+    labels = [day.strftime('%m/%d/%Y') for day in series.dates]
+    ordinals = [day.toordinal() for day in series.dates]
+    trend = {}
+
+    for name, values in series.columns.items():
+        present = [index for index, value in enumerate(values) if value is not None]
+        rolling_means = get_rolling_means(values, window)
+        deltas = get_deltas(values)
+
+        kept = get_lttb_indices(
+            [ordinals[index] for index in present],
+            [values[index] for index in present],
+            points
+        )
+        kept = [present[index] for index in kept]
+
+        trend[name] = {
+            **get_summary(values),
+            "dates": [labels[index] for index in kept],
+            "values": [values[index] for index in kept],
+            "rolling_mean": [rolling_means[index] for index in kept],
+            "delta": [deltas[index] for index in kept],
+        }
+
+    return {
+        "sessions": len(series),
+        "window": window,
+        "vitals": trend,
+    }
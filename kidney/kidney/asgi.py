@@ -5,9 +5,9 @@ django.setup()
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
-from channels.auth import AuthMiddlewareStack
 from app_chat.routing import websocket_urlpatterns as chat_websocket_urlpatterns
 from app_appointment.routing import websocket_urlpatterns as appointment_websocket_urlpatterns
+from .realtime.routing import websocket_urlpatterns as realtime_websocket_urlpatterns
 from .middleware.token_auth_middleware import JWTAuthMiddleware
 
 # application = ProtocolTypeRouter({
@@ -22,10 +22,10 @@ from .middleware.token_auth_middleware import JWTAuthMiddleware
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AllowedHostsOriginValidator(
+        #the jwt middleware sets scope["user"], the session based AuthMiddlewareStack would only add a lookup per connect
         JWTAuthMiddleware(
-            AuthMiddlewareStack(
-                URLRouter(chat_websocket_urlpatterns + appointment_websocket_urlpatterns)
-            )
+            #ws/realtime/ carries everything over one socket, the chat and appointment routes are adapters of it
+            URLRouter(realtime_websocket_urlpatterns + chat_websocket_urlpatterns + appointment_websocket_urlpatterns)
         )
     )
 })
\ No newline at end of file
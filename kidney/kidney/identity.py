@@ -0,0 +1,122 @@
+import time
+from django.core.exceptions import ValidationError
+
+
+class RequestIdentity:
+    """
+        The authenticated identity of a request.
+
+        The access token is decoded and the user is fetched (with its profile) once by
+        CustomJWTAuthentication, views and serializers read them from here instead of
+        parsing the Authorization header again.
+    """
+
+    def __init__(self, claims, user):
+        self.claims = claims
+        self.user = user
+
+    @property
+    def user_id(self):
+        return str(self.user.id)
+
+    @property
+    def role(self):
+        return self.user.role
+
+    @property
+    def profile(self):
+        #the profile is joined when the user is authenticated, a missing profile returns None
+        return getattr(self.user, 'user_profile', None)
+
+
+def get_request_identity(request):
+    """
+        Returns the identity of the authenticated request, built once and cached on the request.
+
+        Args:
+            request (Request): The DRF request.
+
+        Returns:
+            RequestIdentity: The decoded token claims and the authenticated user.
+    """
+    identity = getattr(request, '_identity', None)
+
+    if identity is None:
+        identity = RequestIdentity(claims=request.auth, user=request.user)
+        request._identity = identity
+
+    return identity
+
+
+class ConnectionIdentity:
+    """
+        The few user fields WebSocket consumers need, cached between connects.
+
+        Used as scope["user"], it is not a User instance so it can't be saved or used
+        as a foreign key value, use the id instead.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, role, first_name, last_name, status):
+        self.id = id
+        self.pk = id
+        self.role = role
+        self.first_name = first_name
+        self.last_name = last_name
+        self.status = status
+
+
+IDENTITY_CACHE_TTL = 30  #seconds, a cached status can be this old
+IDENTITY_CACHE_MAX_SIZE = 10000
+
+#in-process so a lookup never leaves the event loop, user_id -> (expires_at, identity)
+identity_cache = {}
+
+
+async def aget_identity(user_id):
+    """
+        Returns the identity of a user from the cache, or through the async ORM on a miss.
+
+        Args:
+            user_id (str | UUID): The user id.
+
+        Returns:
+            ConnectionIdentity: The identity, or None if the user doesn't exist.
+    """
+    from app_authentication.models import User
+
+    key = str(user_id)
+    now = time.monotonic()
+
+    cached = identity_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    try:
+        user = await User.objects.only('id', 'role', 'first_name', 'last_name', 'status').aget(id=user_id)
+    except (User.DoesNotExist, ValidationError, ValueError):
+        return None
+
+    identity = ConnectionIdentity(
+        id=user.id,
+        role=user.role,
+        first_name=user.first_name,
+        last_name=user.last_name,
+        status=user.status
+    )
+
+    if len(identity_cache) >= IDENTITY_CACHE_MAX_SIZE:
+        #drop the oldest entry, dicts keep insertion order
+        identity_cache.pop(next(iter(identity_cache)), None)
+
+    identity_cache.pop(key, None)
+    identity_cache[key] = (now + IDENTITY_CACHE_TTL, identity)
+
+    return identity
+
+
+def forget_identity(user_id):
+    """Removes a user from this process' identity cache, e.g. after the user changed."""
+    identity_cache.pop(str(user_id), None)
@@ -1,8 +1,6 @@
-from urllib.parse import parse_qs
-from django.contrib.auth.models import AnonymousUser
-from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from rest_framework_simplejwt.tokens import AccessToken, TokenError
+from kidney.identity import aget_identity
 
 
 class JWTAuthMiddleware(BaseMiddleware):
@@ -18,11 +16,19 @@ class JWTAuthMiddleware(BaseMiddleware):
             if not token:
                 raise TokenError("Authorization token not provided")
 
-            user_id = await self.get_user_from_token(token)
+            #decoding is pure cpu work, it runs inline instead of in the sync thread pool
+            user_id = self.get_user_from_token(token)
 
             if not user_id:
                 raise TokenError("Invalid or expired token. Please log in again.")
-            scope["user"] = await self.get_user(user_id) 
+
+            #resolved from the short lived identity cache, or the async orm on a miss
+            user = await aget_identity(user_id)
+
+            if not user:
+                raise TokenError("User not found")
+
+            scope = dict(scope, user=user)
 
         except Exception as e:
             await self.close_connection(send, code=4003)
@@ -40,27 +46,15 @@ class JWTAuthMiddleware(BaseMiddleware):
         if auth_header and auth_header.startswith('Bearer '):
             return auth_header.split(' ')[1]
 
-    
-    @database_sync_to_async
     def get_user_from_token(self, token):
         try:
             access_token = AccessToken(token)
             return access_token["user_id"]  
         except:
             return None
-        
-    @database_sync_to_async
-    def get_user(self, user_id):
-        from django.contrib.auth import get_user_model
-        try:
-            User = get_user_model()
-            return User.objects.get(id=user_id)
-        except Exception:
-            return AnonymousUser()
-        
 
     async def close_connection(self, send, code):
         await send({
             "type": "websocket.close",
             "code": code,
-        })
\ No newline at end of file
+        })
@@ -0,0 +1,102 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination:
+    """
+        Cursor pagination keyed on (created_at, id), newest first.
+
+        Only limit + 1 rows are fetched from the database. Use the 'before' cursor
+        to load older rows and the 'after' cursor to load newer rows.
+    """
+    page_size = 10  #define how many rows to show per page
+    page_size_query_param = 'limit'  # Allow custom page size via query params
+    max_page_size = 10  # Maximum allowed page size
+    before_query_param = 'before'
+    after_query_param = 'after'
+
+    def paginate_queryset(self, queryset, request):
+
+        self.request = request
+
+        limit = self.get_page_size(request)
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+        self.is_first_page = not before and not after
+
+        if after:
+            created_at, row_id = after
+
+            #fetch the rows right after the cursor in ascending order, then flip them back
+            rows = list(queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=row_id)
+            ).order_by('created_at', 'id')[:limit + 1])
+
+            self.has_newer = len(rows) > limit
+            self.has_older = True
+            rows = rows[:limit][::-1]
+        else:
+            if before:
+                created_at, row_id = before
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=row_id)
+                )
+
+            rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+
+            self.has_older = len(rows) > limit
+            self.has_newer = before is not None
+            rows = rows[:limit]
+
+        self.page = rows
+
+        return rows
+
+    def get_count(self, queryset):
+        """Counts the rows on the first page only, the later pages return None instead of a COUNT(*) per scroll."""
+        return queryset.count() if self.is_first_page else None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_older or not self.page:
+            return None
+
+        url = remove_query_param(self.request.build_absolute_uri(), self.after_query_param)
+        return replace_query_param(url, self.before_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_newer or not self.page:
+            return None
+
+        url = remove_query_param(self.request.build_absolute_uri(), self.before_query_param)
+        return replace_query_param(url, self.after_query_param, self.encode_cursor(self.page[0]))
+
+    def encode_cursor(self, row):
+        #rows can either be model instances or dictionaries from .values()
+        created_at = row["created_at"] if isinstance(row, dict) else row.created_at
+        row_id = row["id"] if isinstance(row, dict) else row.id
+
+        return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+
+        try:
+            created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), int(row_id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
@@ -0,0 +1,250 @@
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+PRESENCE_TTL = 60  #seconds without a frame from a socket before it is considered gone
+PRESENCE_REFRESH_INTERVAL = 20  #a socket writes its last seen time at most this often
+PRESENCE_LOCK_TIMEOUT = 5
+PRESENCE_LOCK_ATTEMPTS = 20
+MAX_PRESENCE_SUBSCRIPTIONS = 200  #users a single socket can watch
+ONLINE = 'online'
+OFFLINE = 'offline'
+
+
+def presence_key(user_id):
+    #holds the live sockets of the user, their channel name -> the time a frame was last received
+    return f"presence:{user_id}"
+
+
+def presence_lock_key(user_id):
+    return f"presence_lock:{user_id}"
+
+
+def presence_group_name(user_id):
+    return f"presence_{user_id}"
+
+
+def get_live_sockets(sockets, now=None):
+    """Drops the sockets nothing was received from for PRESENCE_TTL, e.g. a process that died without disconnecting them."""
+    if not isinstance(sockets, dict):
+        return {}
+
+    now = now or time.time()
+    return {channel_name: seen_at for channel_name, seen_at in sockets.items() if seen_at > now - PRESENCE_TTL}
+
+
+def to_presence(user_ids, sockets):
+    return {
+        user_id: ONLINE if get_live_sockets(sockets.get(presence_key(user_id))) else OFFLINE
+        for user_id in user_ids
+    }
+
+
+def get_presence(user_ids):
+    """
+        Returns the presence of several users with a single cache round-trip.
+
+        Args:
+            user_ids (list): The user ids.
+
+        Returns:
+            dict: The status ('online' or 'offline') keyed by the user id as a string.
+    """
+    user_ids = {str(user_id) for user_id in user_ids}
+    return to_presence(user_ids, cache.get_many([presence_key(user_id) for user_id in user_ids]))
+
+
+async def aget_presence(user_ids):
+    #one thread hop for the whole page, cache.aget_many would read the keys one by one
+    return await sync_to_async(get_presence, thread_sensitive=False)(user_ids)
+
+
+def get_user_presence(user_id, presence=None):
+    """Returns the status of one user, from an already loaded presence map when given."""
+    if presence is not None and str(user_id) in presence:
+        return presence[str(user_id)]
+    return get_presence([user_id])[str(user_id)]
+
+
+def acquire_presence_lock(user_id):
+    #cache.add is a SET NX with an expiry on redis, a lock left by a dead process expires on its own
+    lock_key = presence_lock_key(user_id)
+    for _ in range(PRESENCE_LOCK_ATTEMPTS):
+        if cache.add(lock_key, True, PRESENCE_LOCK_TIMEOUT):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def write_sockets(user_id, channel_name, connected):
+    """
+        Adds (or refreshes) or removes a socket of the user.
+
+        The sockets of a user are read and written under a short cache lock, so two tabs
+        connecting or closing at once don't overwrite each other. Nothing is written when the
+        lock can't be taken, the caller retries on the next frame of the socket and a socket
+        that couldn't be removed drops out once its last seen time is PRESENCE_TTL old.
+
+        Returns:
+            tuple: Whether the user was online before and is online after the update,
+                None if the lock couldn't be taken.
+    """
+    if not acquire_presence_lock(user_id):
+        return None
+
+    key = presence_key(user_id)
+    try:
+        now = time.time()
+        sockets = get_live_sockets(cache.get(key), now)
+        was_online = bool(sockets)
+
+        if connected:
+            sockets[channel_name] = now
+        else:
+            sockets.pop(channel_name, None)
+
+        if sockets:
+            cache.set(key, sockets, PRESENCE_TTL)
+        else:
+            cache.delete(key)
+
+        return was_online, bool(sockets)
+    finally:
+        cache.delete(presence_lock_key(user_id))
+
+
+async def update_sockets(user_id, channel_name, connected):
+    #the whole update runs in one thread hop, off the thread the ORM calls share
+    return await sync_to_async(write_sockets, thread_sensitive=False)(user_id, channel_name, connected)
+
+
+async def socket_connected(user_id, channel_name):
+    """
+        Adds a live socket of the user.
+
+        Returns:
+            bool: True if the user just came online, None if the socket couldn't be recorded.
+    """
+    result = await update_sockets(user_id, channel_name, connected=True)
+    if result is None:
+        return None
+    was_online, _ = result
+    return not was_online
+
+
+async def socket_disconnected(user_id, channel_name):
+    """Removes a live socket of the user and returns True if it was the last one."""
+    result = await update_sockets(user_id, channel_name, connected=False)
+    if result is None:
+        return False
+    was_online, is_online = result
+    return was_online and not is_online
+
+
+async def socket_heartbeat(user_id, channel_name):
+    """Keeps the socket live for another TTL and returns True if the user had already expired."""
+    return await socket_connected(user_id, channel_name)
+
+
+class PresenceConsumerMixin:
+    """
+        Keeps the presence of the connected user current from a WebSocket consumer.
+
+        The consumer calls presence_connect() once accepted and presence_disconnect() on
+        disconnect, and passes incoming json to handle_presence_message(). Every frame the
+        socket receives keeps it live. Every socket of a user is tracked on its own, an idle client
+        sends {"type": "ping"} at least every PRESENCE_TTL seconds and can watch other users with
+        {"type": "subscribe_presence", "user_ids": [...]}, changes then arrive as
+        {"type": "presence", "user_id": ..., "status": ...} frames.
+    """
+
+    presence_user_id = None
+    presence_seen_at = 0
+
+    async def presence_connect(self, user_id):
+        self.presence_user_id = str(user_id)
+        self.presence_subscriptions = set()
+        await self.record_socket()
+
+    async def websocket_receive(self, message):
+        #any frame shows the socket is alive, not only a ping
+        await self.presence_seen()
+        await super().websocket_receive(message)
+
+    async def presence_seen(self):
+        """Keeps the socket live, the cache is only written every PRESENCE_REFRESH_INTERVAL."""
+        if not self.presence_user_id or time.monotonic() - self.presence_seen_at < PRESENCE_REFRESH_INTERVAL:
+            return
+
+        await self.record_socket()
+
+    async def record_socket(self):
+        self.presence_seen_at = time.monotonic()
+        came_online = await socket_heartbeat(self.presence_user_id, self.channel_name)
+
+        if came_online is None:
+            #the presence lock was busy, try again on the next frame
+            self.presence_seen_at = 0
+        elif came_online:
+            await self.broadcast_presence(self.presence_user_id, ONLINE)
+
+    async def presence_disconnect(self):
+        if not self.presence_user_id:
+            return
+
+        for user_id in self.presence_subscriptions:
+            await self.channel_layer.group_discard(presence_group_name(user_id), self.channel_name)
+
+        if await socket_disconnected(self.presence_user_id, self.channel_name):
+            await self.broadcast_presence(self.presence_user_id, OFFLINE)
+
+    async def subscribe_presence(self, user_ids):
+        """Watches the given users and returns their current presence."""
+        user_ids = [str(user_id) for user_id in user_ids]
+        user_ids = [user_id for user_id in user_ids if user_id not in self.presence_subscriptions]
+        user_ids = user_ids[:max(MAX_PRESENCE_SUBSCRIPTIONS - len(self.presence_subscriptions), 0)]
+
+        for user_id in user_ids:
+            await self.channel_layer.group_add(presence_group_name(user_id), self.channel_name)
+            self.presence_subscriptions.add(user_id)
+
+        return await aget_presence(user_ids)
+
+    async def handle_presence_message(self, data):
+        """Handles ping and subscribe_presence messages, returns False for any other message."""
+        message_type = data.get('type') if isinstance(data, dict) else None
+
+        #the socket was already refreshed by presence_seen()
+        if message_type == 'ping':
+            await self.send_json_frame({"type": "pong"})
+            return True
+
+        if message_type == 'subscribe_presence':
+            presence = await self.subscribe_presence(data.get('user_ids') or [])
+            for user_id, status in presence.items():
+                await self.send_json_frame({"type": "presence", "user_id": user_id, "status": status})
+            return True
+
+        return False
+
+    async def broadcast_presence(self, user_id, status):
+        await self.channel_layer.group_send(
+            presence_group_name(user_id),
+            {
+                "type": "presence_changed",
+                "user_id": str(user_id),
+                "status": status,
+            }
+        )
+
+    #receive a presence change of a watched user
+    async def presence_changed(self, event):
+        await self.send_json_frame({
+            "type": "presence",
+            "user_id": event["user_id"],
+            "status": event["status"],
+        })
+
+    async def send_json_frame(self, data):
+        await self.send(text_data=json.dumps(data))
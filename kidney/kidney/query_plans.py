@@ -0,0 +1,65 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+#plan lines that mean the whole table is read (postgres, sqlite)
+FULL_SCAN_PATTERNS = [
+    re.compile(r'Seq Scan on'),
+    re.compile(r'\bSCAN (?!.*\bUSING\b)'),
+]
+
+#plan lines that mean an index is used (postgres, sqlite)
+INDEX_PATTERNS = [
+    re.compile(r'Index (Only )?Scan'),
+    re.compile(r'Bitmap Index Scan'),
+    re.compile(r'USING (COVERING )?INDEX'),
+    re.compile(r'USING INTEGER PRIMARY KEY'),
+]
+
+
+def uses_index(plan):
+    if any(pattern.search(line) for line in plan.splitlines() for pattern in FULL_SCAN_PATTERNS):
+        return False
+    return any(pattern.search(plan) for pattern in INDEX_PATTERNS)
+
+
+class ExplainQueriesCommand(BaseCommand):
+    """
+        Runs EXPLAIN on the hot queries of an app and reports whether each one uses an index.
+
+        Each app's command lists its own queries in get_hot_queries().
+    """
+    help = "Runs EXPLAIN on the hot API queries and reports whether each one uses an index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true', help="Exit with an error if any query does a full table scan.")
+
+    def get_hot_queries(self):
+        """Returns (label, queryset) pairs, placeholder ids are enough since EXPLAIN doesn't need real rows."""
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+
+        full_scans = []
+
+        with transaction.atomic():
+
+            if connection.vendor == 'postgresql':
+                #small tables are always sequentially scanned, check that an index is usable instead
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for label, queryset in self.get_hot_queries():
+                plan = queryset.explain()
+
+                if uses_index(plan):
+                    self.stdout.write(self.style.SUCCESS(f"[INDEX] {label}"))
+                else:
+                    full_scans.append(label)
+                    self.stdout.write(self.style.ERROR(f"[FULL SCAN] {label}"))
+
+                if options['verbosity'] > 1:
+                    self.stdout.write(plan)
+
+        if full_scans and options['strict']:
+            raise CommandError(f"{len(full_scans)} hot queries do not use an index: {', '.join(full_scans)}")
@@ -0,0 +1,314 @@
+import json
+import uuid
+from collections import Counter
+from channels.generic.websocket import AsyncWebsocketConsumer
+from redis.exceptions import RedisError
+from app_chat.rooms import CHAT_TYPES, ChatError, ChatRoom, get_message_payload
+from app_chat.replay import (
+    get_user_event,
+    parse_event_id,
+    stream_covers,
+    iter_stream_events,
+    iter_missed_messages,
+    get_last_event_id,
+    mark_stream_unavailable,
+)
+from app_chat.fanout import inbox_group_name
+from app_chat.participants import profile_group_name
+from app_appointment.events import appointment_group_name
+from kidney.identity import forget_identity
+from kidney.presence import PresenceConsumerMixin, aget_presence
+
+MAX_CONVERSATIONS = 50  #conversations a single socket can subscribe to
+
+
+class RealtimeConsumer(PresenceConsumerMixin, AsyncWebsocketConsumer):
+    """
+        A single authenticated socket for chat, appointment and notification events.
+
+        Every frame is a typed envelope, {"type": ..., "conversation": ..., "data": {...}},
+        where the conversation is only set for events of a subscribed conversation, its chat room name.
+
+        Client messages:
+            {"type": "subscribe", "chat_type": "nurse", "user_id": "<uuid>"}
+            {"type": "unsubscribe", "conversation": "<conversation>"}
+            {"type": "chat.send", "conversation": "<conversation>", "message": "...", "image_data": "..."}
+            {"type": "replay", "last_event_id": "<event_id>"}
+            {"type": "ping"} and {"type": "subscribe_presence", "user_ids": [...]}
+
+        Server events:
+            subscribed, unsubscribed, chat.message, chat.image_ready, chat.inbox,
+            chat.notification, appointment.upcoming, presence, pong and error.
+
+        Chat events carry the event_id of the user's replay stream, after a reconnect the
+        client sends the last one it saw and gets what it missed followed by replay.done.
+    """
+
+    #the legacy adapters turn off the events their route never carried
+    chat_events = True
+    appointment_events = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_id = None
+        self.groups_joined = []
+        #subscribed chat rooms keyed by their name, and how many of them need each profile group
+        self.rooms = {}
+        self.profile_groups = Counter()
+
+    async def connect(self):
+        """Handles the WebSocket connection."""
+        #user is already authenticated by middleware
+        user = self.scope.get("user")
+        if not user:
+            await self.close(code=4003)
+            return
+
+        self.user_id = str(user.id)
+
+        if self.chat_events:
+            self.groups_joined.append(inbox_group_name(self.user_id))
+        if self.appointment_events:
+            self.groups_joined.append(appointment_group_name(self.user_id))
+
+        for group_name in self.groups_joined:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+
+        await self.accept()
+
+        await self.presence_connect(self.user_id)
+
+    async def disconnect(self, close_code):
+        """Handles the WebSocket disconnection."""
+        for group_name in self.groups_joined + list(self.profile_groups):
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+        await self.presence_disconnect()
+
+    async def receive(self, text_data):
+        """Handles the in-band messages of the client."""
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_error("Invalid JSON data.")
+            return
+
+        if not isinstance(data, dict):
+            await self.send_error("Invalid JSON data.")
+            return
+
+        #heartbeats and presence subscriptions
+        if await self.handle_presence_message(data):
+            return
+
+        handlers = {
+            "subscribe": self.handle_subscribe,
+            "unsubscribe": self.handle_unsubscribe,
+            "chat.send": self.handle_chat_send,
+            "replay": self.handle_replay,
+        }
+
+        handler = handlers.get(data.get("type"))
+
+        if not handler:
+            await self.send_error("Unknown message type.")
+            return
+
+        await handler(data)
+
+    async def handle_subscribe(self, data):
+        chat_type = data.get("chat_type")
+        user_id = str(data.get("user_id"))
+
+        try:
+            uuid.UUID(user_id)
+        except ValueError:
+            await self.send_error("Invalid user id.")
+            return
+
+        if chat_type not in CHAT_TYPES:
+            await self.send_error("Invalid chat type.")
+            return
+
+        room = ChatRoom(chat_type, self.user_id, user_id)
+
+        if room.room_group_name not in self.rooms:
+            if len(self.rooms) >= MAX_CONVERSATIONS:
+                await self.send_error("Too many conversations.")
+                return
+
+            await room.load_participants()
+
+            if not room.is_loaded:
+                await self.send_error("Conversation not found.")
+                return
+
+        await self.add_room(room)
+
+    async def add_room(self, room):
+        """Subscribes the socket to a chat room whose participants are loaded."""
+        name = room.room_group_name
+
+        if name not in self.rooms:
+            self.rooms[name] = room
+
+            #reload the participants whenever one of them changes their profile or status
+            for user_id in (room.sender_id, room.receiver_id):
+                group_name = profile_group_name(user_id)
+                if not self.profile_groups[group_name]:
+                    await self.channel_layer.group_add(group_name, self.channel_name)
+                self.profile_groups[group_name] += 1
+
+        presence = await self.subscribe_presence([room.receiver_id])
+
+        await self.send_envelope(
+            "subscribed",
+            {"status": await self.get_receiver_status(room, presence)},
+            conversation=name
+        )
+
+    async def get_receiver_status(self, room, presence):
+        #subscribe_presence only reports users that weren't watched yet
+        if room.receiver_id in presence:
+            return presence[room.receiver_id]
+
+        return (await aget_presence([room.receiver_id]))[room.receiver_id]
+
+    async def handle_unsubscribe(self, data):
+        room = self.rooms.pop(str(data.get("conversation")), None)
+
+        if not room:
+            await self.send_error("Not subscribed to this conversation.")
+            return
+
+        for user_id in (room.sender_id, room.receiver_id):
+            group_name = profile_group_name(user_id)
+            self.profile_groups[group_name] -= 1
+            if not self.profile_groups[group_name]:
+                del self.profile_groups[group_name]
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+
+        await self.send_envelope("unsubscribed", conversation=room.room_group_name)
+
+    async def handle_chat_send(self, data):
+        room = self.rooms.get(str(data.get("conversation")))
+
+        if not room:
+            await self.send_error("Not subscribed to this conversation.")
+            return
+
+        await self.send_chat_message(room, data.get("message"), data.get("image_data"))
+
+    async def send_chat_message(self, room, message_content=None, image_data=None):
+        try:
+            message = await room.save_message(message_content=message_content, image_data=image_data)
+        except ChatError as e:
+            await self.send_error(str(e))
+            return
+
+        #the image is uploaded in the background, the message goes out with an uploading placeholder
+        await room.publish_message(self.channel_layer, message, image_status='uploading' if image_data else None)
+
+        if image_data:
+            room.start_image_upload(self.channel_layer, message, image_data)
+
+    #receive a fanned out chat event, each socket gets it once and writes the parts meant for it
+    async def chat_event(self, event):
+        await self.send_chat_event(get_user_event(event, self.user_id), event.get("event_ids", {}).get(self.user_id))
+
+    async def send_chat_event(self, user_event, event_id=None, replayed=False):
+        """Writes the parts of a user's chat event, live ones only for subscribed conversations."""
+        room_name = user_event.get("room")
+
+        if replayed:
+            #a reconnecting client catches up on all of its conversations
+            includes_room = self.replay_includes(user_event)
+        else:
+            includes_room = room_name in self.rooms
+
+        if includes_room and user_event.get("chat"):
+            await self.send_envelope("chat.message", user_event["chat"], conversation=room_name, event_id=event_id, replayed=replayed)
+
+        if includes_room and user_event.get("image_ready"):
+            await self.send_envelope("chat.image_ready", user_event["image_ready"], conversation=room_name, event_id=event_id, replayed=replayed)
+
+        if user_event.get("inbox"):
+            await self.send_envelope("chat.inbox", user_event["inbox"], event_id=event_id, replayed=replayed)
+
+        if user_event.get("notification"):
+            await self.send_envelope("chat.notification", user_event["notification"], event_id=event_id, replayed=replayed)
+
+    def replay_includes(self, user_event):
+        return True
+
+    async def handle_replay(self, data):
+        last_event_id = data.get("last_event_id")
+
+        try:
+            parse_event_id(last_event_id)
+        except (TypeError, ValueError):
+            await self.send_error("Invalid event id.")
+            return
+
+        source = 'stream'
+
+        try:
+            if await stream_covers(self.user_id, last_event_id):
+                async for event_id, user_event in iter_stream_events(self.user_id, last_event_id):
+                    await self.send_chat_event(user_event, event_id, replayed=True)
+                    last_event_id = event_id
+            else:
+                source = 'database'
+        except RedisError as e:
+            #continue from the last replayed event
+            mark_stream_unavailable(e)
+            source = 'database'
+
+        if source == 'database':
+            #the gap is beyond the retained window, replay the messages themselves
+            async for message in iter_missed_messages(self.user_id, last_event_id):
+                await self.send_chat_event({
+                    "room": None,
+                    "participants": [str(message.sender_id), str(message.receiver_id)],
+                    "chat": get_message_payload(message),
+                }, replayed=True)
+
+            last_event_id = await get_last_event_id(self.user_id) or last_event_id
+
+        await self.send_envelope("replay.done", {"last_event_id": last_event_id, "source": source})
+
+    #receive an appointment of the user, sent by the realtime event dispatcher
+    async def upcoming_appointments(self, event):
+        await self.send_envelope("appointment.upcoming", {key: value for key, value in event.items() if key != "type"})
+
+    #one of the participants changed their profile or status
+    async def profile_changed(self, event):
+        #the next connect of the user reads the new status and role
+        forget_identity(event["user_id"])
+
+        for room in self.rooms.values():
+            if event["user_id"] in (room.sender_id, room.receiver_id):
+                await room.load_participants()
+
+    async def send_envelope(self, type, data=None, conversation=None, event_id=None, replayed=False):
+        frame = {"type": type}
+
+        if conversation:
+            frame["conversation"] = conversation
+        if event_id:
+            frame["event_id"] = event_id
+        if replayed:
+            frame["replayed"] = True
+        if data is not None:
+            frame["data"] = data
+
+        await self.send(text_data=json.dumps(frame))
+
+    async def send_error(self, message):
+        await self.send_envelope("error", {"message": message})
+
+    async def send_json_frame(self, data):
+        #the presence frames of PresenceConsumerMixin, e.g. {"type": "pong"}, as envelopes
+        data = dict(data)
+        frame_type = data.pop("type")
+        await self.send_envelope(frame_type, data or None)
@@ -0,0 +1,7 @@
+# routing.py
+from django.urls import re_path
+from .gateway import RealtimeConsumer
+
+websocket_urlpatterns = [
+    re_path(r"ws/realtime/$", RealtimeConsumer.as_asgi()),
+]
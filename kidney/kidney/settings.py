@@ -209,6 +209,12 @@ CACHES = {
     }
 }
 
+#per-user chat event streams replayed to reconnecting sockets, None turns them off
+REALTIME_REDIS_URL = redis_url
+
+#daily HyperLogLogs of the patients who booked, None makes the analytics count them in the database
+ANALYTICS_REDIS_URL = redis_url
+
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 
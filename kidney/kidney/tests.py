@@ -0,0 +1,25 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+
+#the ExplainQueriesCommand of each app
+EXPLAIN_COMMANDS = [
+    'explain_analytics_queries',
+    'explain_appointment_queries',
+    'explain_chat_queries',
+    'explain_notification_queries',
+    'explain_treatment_queries',
+]
+
+
+class ExplainQueriesTest(TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        for command in EXPLAIN_COMMANDS:
+            with self.subTest(command=command):
+                output = StringIO()
+
+                #raises CommandError when a hot query falls back to a full table scan
+                call_command(command, strict=True, stdout=output)
+
+                self.assertNotIn('[FULL SCAN]', output.getvalue())
@@ -2,14 +2,12 @@ from rest_framework.response import Response
 from typing import Optional, Dict, Any
 from rest_framework.views import exception_handler
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.template import Template, Context
-from django.core.mail import EmailMultiAlternatives
+from app_notification.email_queue import enqueue_email
+from app_notification.email_templates import render_email
 import random
 import re
 import secrets
-import base64
 import string
-from rest_framework_simplejwt.tokens import AccessToken, TokenError
 from rest_framework import status
 from asgiref.sync import sync_to_async
 from django.db import OperationalError
@@ -87,40 +85,16 @@ def send_otp_to_email(
     message=None,
     recipient_list=None,
     otp=None,
+    expires_in=None,
 ):
-    email = EmailMultiAlternatives(
-        subject=subject,
-        body=message,
-        to=recipient_list,
-    )
-
-    html_template = Template("""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-        </head>
-        <body style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px;">
-            <div style="max-width: 600px; margin: auto; background-color: #fff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-                <h2 style="color: #333;">(OTP) Code</h2>
-                <p>Hello, {{ recipient_list }}</p>
-                <p>Use the following OTP to verify your email:</p>
-                <p style="font-size: 24px; font-weight: bold; color: #4CAF50;">{{ otp }}</p>
-                <p>This code will expire in 3 minutes.</p>
-                <hr>
-                <p style="font-size: 12px; color: #888;">If you did not request this, please ignore this email.</p>
-                <p style="font-size: 12px; color: #888;">Thank you,<br>KidneyCare Team</p>
-            </div>
-        </body>
-        </html>
-    """)
-
-    context = Context({'otp': otp, 'recipient_list': recipient_list[0]})
-    html_content = html_template.render(context)
-
-    email.attach_alternative(html_content, "text/html")
-
-    email.send(fail_silently=False)
+    html_content = render_email('otp', {
+        'otp': otp,
+        'recipient': recipient_list[0],
+        'expires_in_minutes': expires_in // 60 if expires_in else None,
+    })
+
+    #queued and sent by the send_queued_emails worker once the transaction commits, an expired otp isn't sent
+    enqueue_email(subject, message, recipient_list, html_content, expires_in=expires_in)
 
 
 def send_password_to_email(
@@ -129,39 +103,10 @@ def send_password_to_email(
     recipient_list=None,
     password=None
 ):
-    email = EmailMultiAlternatives(
-        subject=subject,
-        body=message,
-        to=recipient_list,
-    )
-
-    html_template = Template("""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-        </head>
-        <body style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px;">
-            <div style="max-width: 600px; margin: auto; background-color: #fff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-                <h2 style="color: #333;">(Generated) Password</h2>
-                <p>Hello, {{ recipient_list }}</p>
-                <p>Please use the following temporary password to log in to your account:</p>
-                <p style="font-size: 24px; font-weight: bold; color: #4CAF50;">{{ password }}</p>
-                <p>For your security, please change this password after logging in and do not share it with anyone.</p>
-                <hr>
-                <p style="font-size: 12px; color: #888;">If you did not request this, please ignore this email.</p>
-                <p style="font-size: 12px; color: #888;">Thank you,<br>KidneyCare Team</p>
-            </div>
-        </body>
-        </html>
-    """)
-
-    context = Context({'password': password, 'recipient_list': recipient_list[0]})
-    html_content = html_template.render(context)
-
-    email.attach_alternative(html_content, "text/html")
-
-    email.send(fail_silently=False)
+    html_content = render_email('generated_password', {'password': password, 'recipient': recipient_list[0]})
+
+    #queued and sent by the send_queued_emails worker once the transaction commits
+    enqueue_email(subject, message, recipient_list, html_content)
 
 
 #generate a random otp 6-digit number
@@ -217,41 +162,6 @@ def extract_first_error_message(errors):
         return errors[0] #flatten the error
     return None
 
-def get_token_user_id(request):
-
-    #get the 'Authorization' header from the request, or return an empty list if not found
-    auth_header = request.headers.get('Authorization', '')
-
-    #check if the 'Authorization' header is missing or doesn't start with Bearer
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return ResponseMessageUtils(
-            message="Missing or invalid Authorization header",
-            status_code=status.HTTP_401_UNAUTHORIZED
-        )
-
-    try:
-        # Extract the token part from the Authorization header
-        auth_header_token = auth_header.split(' ')[1]
-    except IndexError:
-        return ResponseMessageUtils(
-            message="Malformed Authorization header",
-            status_code=status.HTTP_401_UNAUTHORIZED
-        )
-
-    try:
-        #parse the token using AccessToken
-        access_token = AccessToken(auth_header_token)
-
-        #extract the user_id claim, convert to string and remove hyphens
-        return str(access_token["user_id"])
-    except TokenError as e:
-        #handle invalid or expired tokens by returning a 401 Unauthorized
-        return ResponseMessageUtils(
-            message="Expired or invalid token",
-            status_code=status.HTTP_401_UNAUTHORIZED
-        )
-            
-    
 @sync_to_async
 def get_user_by_id(user_id):
     try:
@@ -268,11 +178,16 @@ def get_user_by_id(user_id):
     
 def get_base64_file_size(base64_data: str) -> int:
     """
-    Returns the size in bytes of the base64-encoded image.
+    Returns the size in bytes of the base64-encoded image, computed from the encoded length without decoding it.
     """
-    if ";base64," in base64_data:
-        base64_data = base64_data.split(";base64,")[1]
-    return len(base64.b64decode(base64_data))
+    #skip the data url prefix (e.g, data:image/png;base64,) without copying the payload
+    prefix_end = base64_data.find(";base64,")
+    start = prefix_end + len(";base64,") if prefix_end != -1 else 0
+
+    encoded_length = len(base64_data) - start
+    padding = base64_data.count("=", max(start, len(base64_data) - 2))
+
+    return encoded_length * 3 // 4 - padding
 
 
 def get_absolute_image_url(scope, image_url):